@@ -1,12 +1,16 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, Response, abort, request, jsonify, send_file, stream_with_context, url_for
 from flask_cors import CORS
-import sqlite3
 import json
 import logging
+import multiprocessing
 from datetime import datetime
 import os
+import tempfile
+import time
 import uuid
+from functools import partial
 from dotenv import load_dotenv
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 
 # Configure logging
 logging.basicConfig(
@@ -21,15 +25,39 @@ load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), 'env', '.env'))
 load_dotenv()
 logger.info("Environment variables loaded from .env files")
 
-# OpenAI client setup
-from openai import OpenAI
+# OpenAI client setup (shared, pooled client also used by the vision service)
+from services.openai_client import get_openai_client, get_pool_stats
+from services.page_tiles import TilesChanged, apply_tile_extraction, load_signatures
+from services.hedging import get_hedger, hedged
+from services.metrics import init_metrics, stage
+from services.profiling import init_profiler
+from services.catalog import serialize_item
+from services.search import search_catalogs
+from services.stats import all_catalog_stats, source_catalog_stats
+from services.changes import MAX_CHANGES, fetch_changes, latest_change_id, notify_changes, wait_for_changes
+from services.imaging import RETRY_AFTER_SECONDS, ImagePoolBusy, get_image_pool
+from services.menus import delete_unused_menu, get_menu_registry, put_menu
+from services.retention import configure_retention, recent_runs
+from services.session_cache import create_conversation, get_session_cache, load_session, session_version
+from services.storage import StorageRouter
+from services.sync import current_revision, delta_export
+from services.review import QUEUE_STATUSES, DEFAULT_LEASE_SECONDS, claim_catalogs, peek_catalogs, release_items
+from services.image_store import (
+    THUMBNAIL_WIDTHS,
+    blob_path,
+    get_thumbnail,
+    is_digest,
+    put_image,
+    schedule_thumbnails,
+)
+from services.usage import configure_usage, record_completion, usage_by_day, usage_by_key, usage_context
 
 openai_api_key = os.getenv('OPENAI_API_KEY')
 if not openai_api_key:
     logger.error("OpenAI API key not found in environment variables")
     exit(1)
 
-client = OpenAI(api_key=openai_api_key)
+client = get_openai_client()
 
 # OpenAI function definitions for menu access
 MENU_FUNCTIONS = [
@@ -67,18 +95,20 @@ MENU_FUNCTIONS = [
     }
 ]
 
-def call_menu_function(function_name: str, arguments: dict, session_id: str):
+def call_menu_function(function_name: str, arguments: dict, session_id: str, menu=None):
     """Execute menu function calls"""
     if function_name == "get_menu_items":
         return get_menu_items(
             session_id, 
             arguments.get("search_query"), 
-            arguments.get("category")
+            arguments.get("category"),
+            menu
         )
     elif function_name == "get_item_details":
         return get_item_details(
             session_id, 
-            arguments["item_name"]
+            arguments["item_name"],
+            menu
         )
     else:
         return {"error": f"Unknown function: {function_name}"}
@@ -86,113 +116,77 @@ def call_menu_function(function_name: str, arguments: dict, session_id: str):
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5173", "http://localhost:5174"])  # Enable CORS for frontend
 logger.info("Flask app initialized with CORS enabled")
+init_metrics(app)
+init_profiler(app)
+
+# Upload limits. Requests over MAX_REQUEST_MB are refused before they are
+# parsed; a single image over MAX_UPLOAD_MB is refused before it is read.
+# File parts above UPLOAD_SPOOL_KB are spooled to a temporary file (in
+# UPLOAD_SPOOL_DIR, default the system temp dir) rather than held in memory.
+MAX_REQUEST_MB = float(os.getenv('MAX_REQUEST_MB', '32'))
+MAX_UPLOAD_MB = float(os.getenv('MAX_UPLOAD_MB', '20'))
+UPLOAD_SPOOL_KB = int(os.getenv('UPLOAD_SPOOL_KB', '512'))
+UPLOAD_SPOOL_DIR = os.getenv('UPLOAD_SPOOL_DIR') or None
+
+class SpooledUploadRequest(Request):
+    """Request whose file uploads spool to disk past UPLOAD_SPOOL_KB."""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_KB * 1024, mode='rb+', dir=UPLOAD_SPOOL_DIR)
+
+app.request_class = SpooledUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(MAX_REQUEST_MB * 1024 * 1024) if MAX_REQUEST_MB > 0 else None
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    if e.description == RequestEntityTooLarge.description:
+        return jsonify({"error": f"Request exceeds the {MAX_REQUEST_MB:g} MB limit"}), 413
+    return jsonify({"error": e.description}), 413
+
+@app.errorhandler(ImagePoolBusy)
+def image_pool_busy(e):
+    # The image queue stayed full for IMAGE_QUEUE_TIMEOUT; shed the request
+    logger.warning(f"Image pool busy on {request.path}: {str(e)}")
+    return jsonify({"error": "Image processing is busy, try again shortly"}), 503, \
+        {"Retry-After": str(RETRY_AFTER_SECONDS)}
 
-# Database setup
+def read_upload(file) -> bytes:
+    """Read an uploaded image once, refusing it (413) if it is over MAX_UPLOAD_MB."""
+    file.stream.seek(0, os.SEEK_END)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    if MAX_UPLOAD_MB > 0 and size > MAX_UPLOAD_MB * 1024 * 1024:
+        abort(413, description=f"Image is {size / 1024 / 1024:.1f} MB; the limit is {MAX_UPLOAD_MB:g} MB")
+    with stage('upload_read'):
+        return file.read()
+
+# Database setup. DATABASE holds everything unless DB_LAYOUT=sharded, in
+# which case catalogs and chat data move to their own files (services/storage.py)
 DATABASE = 'catalog.db'
+storage = StorageRouter(DATABASE)
+# Image worker processes (services/imaging.py) re-import this module when the
+# server is started with `python app.py`; they need no background writers
+if multiprocessing.parent_process() is None:
+    configure_usage(storage.database)
+    configure_retention(storage.chat_database)
 
 def init_db():
     """Initialize the database with required tables"""
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # Create catalog_pages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS catalog_pages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            source_id TEXT NOT NULL,
-            page INTEGER NOT NULL,
-            page_width INTEGER NOT NULL,
-            page_height INTEGER NOT NULL,
-            UNIQUE(source_id, page)
-        )
-    ''')
-    
-    # Create catalog_items table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS catalog_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            page_id INTEGER NOT NULL,
-            bbox_x INTEGER NOT NULL,
-            bbox_y INTEGER NOT NULL,
-            bbox_w INTEGER NOT NULL,
-            bbox_h INTEGER NOT NULL,
-            name TEXT,
-            brand TEXT,
-            variants_json TEXT,
-            price_value REAL,
-            price_currency TEXT DEFAULT 'MYR',
-            size_value REAL,
-            size_unit TEXT,
-            barcode TEXT,
-            tags_json TEXT,
-            raw_text TEXT,
-            confidence REAL NOT NULL,
-            status TEXT DEFAULT 'ai' CHECK (status IN ('ai', 'edited', 'verified')),
-            FOREIGN KEY (page_id) REFERENCES catalog_pages (id)
-        )
-    ''')
-    
-    # Create conversations table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT UNIQUE NOT NULL,
-            user_id TEXT,
-            created_at TEXT NOT NULL
-        )
-    ''')
-    
-    # Create messages table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT NOT NULL,
-            role TEXT NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
-            content TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (session_id) REFERENCES conversations (session_id)
-        )
-    ''')
-    
-    # Create active_menu table for storing current menu data
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS active_menu (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT UNIQUE NOT NULL,
-            source_id TEXT NOT NULL,
-            page INTEGER NOT NULL,
-            menu_data JSON NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    storage.init_schemas()
 
 # Chat helper functions
 def get_or_create_conversation(session_id: str) -> None:
     """Create conversation if it doesn't exist"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    conn = storage.chat()
     
-    cursor.execute('''
-        INSERT OR IGNORE INTO conversations (session_id, created_at)
-        VALUES (?, ?)
-    ''', (session_id, datetime.utcnow().isoformat()))
+    create_conversation(conn, session_id, datetime.utcnow().isoformat())
     
     conn.commit()
     conn.close()
 
 def insert_message(session_id: str, role: str, content: str) -> None:
     """Insert a message into the database"""
-    conn = get_db_connection()
+    conn = storage.chat()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -203,104 +197,149 @@ def insert_message(session_id: str, role: str, content: str) -> None:
     conn.commit()
     conn.close()
 
-def fetch_messages(session_id: str, limit: int = 50) -> list:
-    """Fetch messages for a session ordered by created_at"""
-    conn = get_db_connection()
+def save_chat_turn(conn, session_id: str, turn: list) -> None:
+    """
+    Write the conversation row and a turn's (role, content, created_at)
+    messages in one commit, then apply them to the session cache
+    """
+    try:
+        create_conversation(conn, session_id, turn[0][2])
+        conn.executemany('''
+            INSERT INTO messages (session_id, role, content, created_at)
+            VALUES (?, ?, ?, ?)
+        ''', [(session_id, role, content, created_at) for role, content, created_at in turn])
+        version = session_version(conn, session_id)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    get_session_cache().apply_messages(session_id, version, turn)
+
+def store_extraction(extraction_id: str, source_id: str, page: int, session_id: str, menu_data: dict) -> None:
+    """Persist a validated vision extraction"""
+    conn = storage.main()
     cursor = conn.cursor()
     
+    item_count = sum(len(section.get('items', [])) for section in menu_data.get('sections', []))
     cursor.execute('''
-        SELECT role, content, created_at FROM messages
-        WHERE session_id = ?
-        ORDER BY created_at ASC
-        LIMIT ?
-    ''', (session_id, limit))
+        INSERT OR REPLACE INTO extractions (id, source_id, page, session_id, menu_data, item_count, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (extraction_id, source_id, page, session_id, json.dumps(menu_data), item_count,
+          datetime.utcnow().isoformat()))
     
-    messages = cursor.fetchall()
+    conn.commit()
     conn.close()
-    
-    return [(row['role'], row['content'], row['created_at']) for row in messages]
-
-def build_history_for_model(session_id: str, max_messages: int = 30) -> list:
-    """Build conversation history for the AI model"""
-    messages = fetch_messages(session_id, max_messages)
-    
-    # Convert to format expected by OpenAI
-    history = []
-    for role, content, _ in messages:
-        history.append({"role": role, "content": content})
-    
-    return history
 
-# Menu management functions
-def store_active_menu(session_id: str, source_id: str, page: int, menu_data: dict) -> None:
-    """Store active menu data for a session"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def ingest_page_image(source_id: str, page: int, data: bytes, mime: str) -> str:
+    """Store a page image, point the catalog page at it and queue its thumbnails"""
+    with stage('image_store'):
+        digest, width, height = put_image(data)
     
-    cursor.execute('''
-        INSERT OR REPLACE INTO active_menu (session_id, source_id, page, menu_data, created_at, updated_at)
+    conn = storage.main()
+    conn.execute('''
+        INSERT OR IGNORE INTO page_images (sha256, mime, width, height, size_bytes, created_at)
         VALUES (?, ?, ?, ?, ?, ?)
-    ''', (session_id, source_id, page, json.dumps(menu_data), 
-          datetime.utcnow().isoformat(), datetime.utcnow().isoformat()))
+    ''', (digest, mime, width, height, len(data), datetime.utcnow().isoformat()))
+    conn.commit()
+    conn.close()
     
+    conn = storage.catalog(source_id, create=True)
+    conn.execute('''
+        INSERT INTO catalog_pages (source_id, page, page_width, page_height, image_sha256)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(source_id, page) DO UPDATE SET
+            page_width = excluded.page_width,
+            page_height = excluded.page_height,
+            image_sha256 = excluded.image_sha256
+    ''', (source_id, page, width, height, digest))
     conn.commit()
     conn.close()
+    
+    schedule_thumbnails(digest)
+    return digest
+
+def page_image_urls(digest: str) -> dict:
+    """Immutable URLs of a stored page image and its thumbnails"""
+    return {
+        "image_url": url_for('get_page_image', digest=digest),
+        "thumbnails": {str(width): url_for('get_page_thumbnail', digest=digest, width=width)
+                       for width in THUMBNAIL_WIDTHS},
+    }
+
+# Menu management functions
+def store_active_menu(session_id: str, source_id: str, page: int, menu_data: dict) -> None:
+    """Point a session at a menu, storing the menu itself only if no session has it yet"""
+    conn = storage.chat()
+    try:
+        cursor = conn.cursor()
+        
+        # put_menu opens the write transaction, so the previous digest cannot be
+        # repointed by another writer before it is checked below
+        digest, size = put_menu(conn, menu_data)
+        # Index the menu before anything is committed; if that fails, closing
+        # the connection rolls back and no session is pointed at a menu
+        # load_session could not index
+        menu = get_menu_registry().add(digest, menu_data, size)
+        previous = cursor.execute('SELECT menu_sha256 FROM active_menu WHERE session_id = ?', (session_id,)).fetchone()
+        now = datetime.utcnow().isoformat()
+        cursor.execute('''
+            INSERT INTO active_menu (session_id, source_id, page, menu_sha256, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(session_id) DO UPDATE SET
+                source_id = excluded.source_id,
+                page = excluded.page,
+                menu_sha256 = excluded.menu_sha256,
+                updated_at = excluded.updated_at
+        ''', (session_id, source_id, page, digest, now, now))
+        if previous and previous[0] != digest:
+            # The menu this session switched away from goes with its last reference
+            delete_unused_menu(conn, previous[0])
+        version = session_version(conn, session_id)
+        
+        conn.commit()
+    finally:
+        conn.close()
+    get_session_cache().apply_menu(session_id, version, menu)
+
+def get_session_menu(session_id: str):
+    """The session's shared MenuIndex (via the session cache), or None"""
+    conn = storage.chat()
+    try:
+        return load_session(conn, session_id).menu
+    finally:
+        conn.close()
 
 def get_active_menu(session_id: str) -> dict:
     """Get active menu data for a session"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT menu_data FROM active_menu WHERE session_id = ?
-    ''', (session_id,))
-    
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        return json.loads(result['menu_data'])
-    return None
+    menu = get_session_menu(session_id)
+    return menu.data if menu else None
 
-def get_menu_items(session_id: str, search_query: str = None, category: str = None) -> list:
+def get_menu_items(session_id: str, search_query: str = None, category: str = None, menu=None) -> list:
     """Function for AI to search menu items"""
-    menu_data = get_active_menu(session_id)
-    if not menu_data or 'items' not in menu_data:
+    if menu is None:
+        menu = get_session_menu(session_id)
+    if not menu or not menu.has_items:
         return []
     
-    items = menu_data['items']
-    
-    # Filter by search query if provided
-    if search_query:
-        search_lower = search_query.lower()
-        items = [item for item in items if 
-                search_lower in item.get('name', '').lower() or
-                search_lower in item.get('brand', '').lower() or
-                search_lower in item.get('section', '').lower() or
-                any(search_lower in tag.lower() for tag in item.get('tags', []))]
-    
-    # Filter by category if provided
-    if category:
-        items = [item for item in items if 
-                category.lower() in item.get('section', '').lower()]
-    
-    return items
+    # Filter by search query and/or category using the menu's precomputed keys
+    return menu.search(search_query, category)
 
-def get_item_details(session_id: str, item_name: str) -> dict:
+def get_item_details(session_id: str, item_name: str, menu=None) -> dict:
     """Function for AI to get detailed info about a specific item"""
-    menu_data = get_active_menu(session_id)
-    if not menu_data or 'items' not in menu_data:
+    if menu is None:
+        menu = get_session_menu(session_id)
+    if not menu or not menu.has_items:
         return None
     
     # Find item by name (case insensitive)
-    for item in menu_data['items']:
-        if item.get('name', '').lower() == item_name.lower():
-            return item
-    
-    return None
+    return menu.find(item_name)
 
-def generate_reply(session_id: str, history: list, context_data: dict = None) -> str:
-    """Generate AI reply using GPT-4o with function calling for menu access"""
+def discard_chat_hedge(loser, elapsed: float) -> None:
+    """Count the tokens of a chat completion that lost a hedge race."""
+    record_completion("gpt-4o-mini", loser.usage, elapsed, 'hedge_loser')
+
+def generate_reply(session_id: str, history: list, context_data: dict = None, menu=None) -> str:
+    """Generate AI reply using GPT-4o with function calling; `menu` is the session's MenuIndex"""
     # Check if OpenAI API key is set
     api_key = os.getenv('OPENAI_API_KEY')
     if not api_key or api_key == 'sk-REPLACE_ME':
@@ -311,7 +350,7 @@ def generate_reply(session_id: str, history: list, context_data: dict = None) ->
         enhanced_history = history.copy()
         
         # Check if we have menu data in session or context
-        has_menu_data = bool(get_active_menu(session_id) or (context_data and context_data.get('items')))
+        has_menu_data = bool((menu and menu.data) or (context_data and context_data.get('items')))
         
         # If we have menu context, update the system message with restaurant server personality
         if has_menu_data:
@@ -344,14 +383,18 @@ You have access to the restaurant's current menu through function calls. Use get
         # Prepare function calling if menu data is available
         functions = MENU_FUNCTIONS if has_menu_data else None
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=enhanced_history,
-            functions=functions,
-            function_call="auto" if functions else None,
-            max_tokens=1000,
-            temperature=0.7
-        )
+        started = time.perf_counter()
+        with stage('upstream_call'):
+            response = hedged('chat', partial(
+                client.chat.completions.create,
+                model="gpt-4o-mini",
+                messages=list(enhanced_history),
+                functions=functions,
+                function_call="auto" if functions else None,
+                max_tokens=1000,
+                temperature=0.7
+            ), discard_chat_hedge)
+        record_completion("gpt-4o-mini", response.usage, time.perf_counter() - started, 'chat')
         
         message = response.choices[0].message
         
@@ -361,7 +404,7 @@ You have access to the restaurant's current menu through function calls. Use get
             function_args = json.loads(message.function_call.arguments)
             
             # Execute the function
-            function_result = call_menu_function(function_name, function_args, session_id)
+            function_result = call_menu_function(function_name, function_args, session_id, menu)
             
             # Add function call and result to conversation
             enhanced_history.append({
@@ -379,14 +422,18 @@ You have access to the restaurant's current menu through function calls. Use get
             })
             
             # Get final response with function result
-            final_response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=enhanced_history,
-                functions=functions,
-                function_call="auto" if functions else None,
-                max_tokens=1000,
-                temperature=0.7
-            )
+            started = time.perf_counter()
+            with stage('upstream_call'):
+                final_response = hedged('chat', partial(
+                    client.chat.completions.create,
+                    model="gpt-4o-mini",
+                    messages=list(enhanced_history),
+                    functions=functions,
+                    function_call="auto" if functions else None,
+                    max_tokens=1000,
+                    temperature=0.7
+                ), discard_chat_hedge)
+            record_completion("gpt-4o-mini", final_response.usage, time.perf_counter() - started, 'tool_round_trip')
             
             return final_response.choices[0].message.content
         
@@ -399,14 +446,14 @@ You have access to the restaurant's current menu through function calls. Use get
 @app.route('/api/catalog/<source_id>/page/<int:page>', methods=['GET'])
 def get_catalog_page(source_id, page):
     """Get catalog page with all items"""
-    conn = get_db_connection()
+    conn = storage.catalog(source_id)
     
-    # Get page info
+    # Get page info (a source without a catalog file has no pages yet)
     page_row = conn.execute('''
         SELECT * FROM catalog_pages 
         WHERE source_id = ? AND page = ?
-    ''', (source_id, page)).fetchone()
-    
+    ''', (source_id, page)).fetchone() if conn else None
+
     if not page_row:
         # For demo source, return minimal fallback data
         if source_id == 'demo':
@@ -457,28 +504,11 @@ def get_catalog_page(source_id, page):
         "page_height": page_row['page_height'],
         "items": []
     }
+    if page_row['image_sha256']:
+        response.update(page_image_urls(page_row['image_sha256']))
     
     for item in items:
-        response['items'].append({
-            "id": item['id'],
-            "bbox": [item['bbox_x'], item['bbox_y'], item['bbox_w'], item['bbox_h']],
-            "name": item['name'],
-            "brand": item['brand'],
-            "variants": json.loads(item['variants_json']) if item['variants_json'] else None,
-            "price": {
-                "value": item['price_value'],
-                "currency": item['price_currency']
-            },
-            "size": {
-                "value": item['size_value'],
-                "unit": item['size_unit']
-            },
-            "barcode": item['barcode'],
-            "tags": json.loads(item['tags_json']) if item['tags_json'] else None,
-            "raw_text": item['raw_text'],
-            "confidence": item['confidence'],
-            "status": item['status']
-        })
+        response['items'].append(serialize_item(item))
     
     conn.close()
     return jsonify(response)
@@ -487,7 +517,9 @@ def get_catalog_page(source_id, page):
 def update_item(item_id):
     """Update catalog item"""
     data = request.get_json()
-    conn = get_db_connection()
+    conn = storage.catalog_for_item(item_id)
+    if conn is None:
+        return jsonify({"error": "Item not found"}), 404
     
     # Build update query dynamically
     update_fields = []
@@ -544,6 +576,7 @@ def update_item(item_id):
         
         conn.execute(query, values)
         conn.commit()
+        notify_changes()
     
     # Return updated item
     item = conn.execute('''
@@ -551,26 +584,7 @@ def update_item(item_id):
     ''', (item_id,)).fetchone()
     
     if item:
-        response = {
-            "id": item['id'],
-            "bbox": [item['bbox_x'], item['bbox_y'], item['bbox_w'], item['bbox_h']],
-            "name": item['name'],
-            "brand": item['brand'],
-            "variants": json.loads(item['variants_json']) if item['variants_json'] else None,
-            "price": {
-                "value": item['price_value'],
-                "currency": item['price_currency']
-            },
-            "size": {
-                "value": item['size_value'],
-                "unit": item['size_unit']
-            },
-            "barcode": item['barcode'],
-            "tags": json.loads(item['tags_json']) if item['tags_json'] else None,
-            "raw_text": item['raw_text'],
-            "confidence": item['confidence'],
-            "status": item['status']
-        }
+        response = serialize_item(item)
         conn.close()
         return jsonify(response)
     
@@ -581,7 +595,7 @@ def update_item(item_id):
 def create_item(source_id, page):
     """Create a new catalog item"""
     data = request.get_json()
-    conn = get_db_connection()
+    conn = storage.catalog(source_id, create=True)
     
     try:
         # Get or create page
@@ -605,7 +619,7 @@ def create_item(source_id, page):
         page_id = page_row['id']
         
         # Insert new item
-        conn.execute('''
+        cursor = conn.execute('''
             INSERT INTO catalog_items (
                 page_id, bbox_x, bbox_y, bbox_w, bbox_h,
                 name, brand, variants_json, price_value, price_currency,
@@ -633,46 +647,371 @@ def create_item(source_id, page):
         ))
         
         # Get the created item ID
-        item_id = conn.lastrowid
+        item_id = cursor.lastrowid
         
         # Return the created item
         item = conn.execute('''
             SELECT * FROM catalog_items WHERE id = ?
         ''', (item_id,)).fetchone()
         
-        response = {
-            "id": item['id'],
-            "bbox": [item['bbox_x'], item['bbox_y'], item['bbox_w'], item['bbox_h']],
-            "name": item['name'],
-            "brand": item['brand'],
-            "variants": json.loads(item['variants_json']) if item['variants_json'] else None,
-            "price": {
-                "value": item['price_value'],
-                "currency": item['price_currency']
-            },
-            "size": {
-                "value": item['size_value'],
-                "unit": item['size_unit']
-            },
-            "barcode": item['barcode'],
-            "tags": json.loads(item['tags_json']) if item['tags_json'] else None,
-            "raw_text": item['raw_text'],
-            "confidence": item['confidence'],
-            "status": item['status']
-        }
+        response = serialize_item(item)
         
         conn.commit()
         conn.close()
+        notify_changes()
         return jsonify(response)
         
     except Exception as e:
         conn.close()
         return jsonify({"error": f"Failed to create item: {str(e)}"}), 500
 
+@app.route('/api/catalog/<source_id>/page/<int:page>/image', methods=['POST'])
+def upload_page_image(source_id, page):
+    """Store the page image and start rendering its thumbnails"""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+    
+    file = request.files['file']
+    if not file.content_type or not file.content_type.startswith('image/'):
+        return jsonify({"error": "File must be an image"}), 400
+    
+    data = read_upload(file)
+    try:
+        digest = ingest_page_image(source_id, page, data, file.content_type)
+    except Exception as e:
+        logger.error(f"Failed to store page image: {str(e)}")
+        return jsonify({"error": f"Failed to store page image: {str(e)}"}), 400
+    
+    return jsonify({"source_id": source_id, "page": page, "sha256": digest, **page_image_urls(digest)})
+
+@app.route('/api/catalog/<source_id>/page/<int:page>/extract', methods=['POST'])
+def extract_catalog_page(source_id, page):
+    """Extract a page image into its catalog items, re-reading only the tiles that changed"""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+    
+    file = request.files['file']
+    if not file.content_type or not file.content_type.startswith('image/'):
+        return jsonify({"error": "File must be an image"}), 400
+    
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key or api_key == 'sk-REPLACE_ME':
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+    
+    from services.vision.incremental import catalog_items, extract_changed_tiles
+    
+    data = read_upload(file)
+    mime_type = file.content_type
+    session_id = request.form.get('session_id')
+    try:
+        digest = ingest_page_image(source_id, page, data, mime_type)
+    except Exception as e:
+        logger.error(f"Failed to store page image: {str(e)}")
+        return jsonify({"error": f"Failed to store page image: {str(e)}"}), 400
+    
+    extraction_id = str(uuid.uuid4())
+    conn = storage.catalog(source_id)
+    try:
+        page_row = conn.execute('''
+            SELECT id, page_width, page_height FROM catalog_pages WHERE source_id = ? AND page = ?
+        ''', (source_id, page)).fetchone()
+        previous = load_signatures(conn, page_row['id'])
+        with usage_context(session_id=session_id, source_id=source_id, extraction_id=extraction_id):
+            diff = extract_changed_tiles(data, mime_type, page_row['page_width'], page_row['page_height'], previous)
+        if diff.failed and not diff.refreshed:
+            return jsonify({"error": f"Vision processing failed for all {len(diff.failed)} changed tiles"}), 500
+        summary = apply_tile_extraction(conn, page_row['id'], previous, diff.boxes, diff.signatures,
+                                        set(diff.refreshed), set(diff.failed), catalog_items(diff.menu), digest)
+    except TilesChanged as e:
+        return jsonify({"error": str(e)}), 409
+    except ImagePoolBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Incremental extraction of {source_id} page {page} failed: {str(e)}")
+        return jsonify({"error": f"Vision processing failed: {str(e)}"}), 500
+    finally:
+        conn.close()
+    
+    if diff.menu is not None:
+        diff.menu['meta']['tiling'] = {
+            "page_width": page_row['page_width'],
+            "page_height": page_row['page_height'],
+            "tiles": diff.boxes,
+            "refreshed_tiles": diff.refreshed,
+            "failed_tiles": diff.failed,
+            "duplicates_merged": diff.duplicates,
+        }
+        store_extraction(extraction_id, source_id, page, session_id, diff.menu)
+    if summary['inserted'] or summary['updated'] or summary['deleted'] or summary['needs_review']:
+        notify_changes()
+    
+    return jsonify({
+        "source_id": source_id,
+        "page": page,
+        "sha256": digest,
+        "extraction_id": extraction_id if diff.menu is not None else None,
+        "tiles": len(diff.tiles),
+        "refreshed_tiles": diff.refreshed,
+        "failed_tiles": diff.failed,
+        "unchanged_tiles": len(diff.tiles) - len(diff.refreshed) - len(diff.failed),
+        "items": summary,
+        **page_image_urls(digest),
+    })
+
+# Stored images never change, so they can be cached for a year
+IMMUTABLE_MAX_AGE = 31536000
+
+def _send_immutable(path: str, mimetype: str, etag: str) -> Response:
+    """Serve a stored blob with sendfile, range and conditional request support"""
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=IMMUTABLE_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    return response
+
+@app.route('/api/images/<digest>', methods=['GET'])
+def get_page_image(digest):
+    """Original page image by content hash"""
+    if not is_digest(digest):
+        return jsonify({"error": "Image not found"}), 404
+    
+    conn = storage.main()
+    row = conn.execute('SELECT mime FROM page_images WHERE sha256 = ?', (digest,)).fetchone()
+    conn.close()
+    if not row or not os.path.exists(blob_path(digest)):
+        return jsonify({"error": "Image not found"}), 404
+    
+    return _send_immutable(blob_path(digest), row['mime'], digest)
+
+@app.route('/api/images/<digest>/thumb/<int:width>', methods=['GET'])
+def get_page_thumbnail(digest, width):
+    """JPEG thumbnail of a page image; rendered inline if the background job is still queued"""
+    if not is_digest(digest):
+        return jsonify({"error": "Image not found"}), 404
+    
+    path = get_thumbnail(digest, width)
+    if path is None:
+        return jsonify({"error": "Thumbnail not found"}), 404
+    
+    return _send_immutable(path, 'image/jpeg', f'{digest}-{width}')
+
+@app.route('/api/search', methods=['GET'])
+def search_catalog():
+    """Ranked full-text item search across all sources"""
+    status = request.args.get('status')
+    if status and status not in ('ai', 'edited', 'verified'):
+        return jsonify({"error": "status must be one of ai, edited, verified"}), 400
+    
+    return jsonify(search_catalogs(
+        storage,
+        request.args.get('q', ''),
+        source_id=request.args.get('source_id'),
+        status=status,
+        min_price=request.args.get('min_price', type=float),
+        max_price=request.args.get('max_price', type=float),
+        size_unit=request.args.get('size_unit'),
+        page=request.args.get('page', 1, type=int),
+        per_page=request.args.get('per_page', 20, type=int),
+    ))
+
+@app.route('/api/stats', methods=['GET'])
+def get_all_stats():
+    """Annotation progress counters for every source"""
+    return jsonify({"sources": all_catalog_stats(storage)})
+
+@app.route('/api/stats/<source_id>', methods=['GET'])
+def get_source_stats(source_id):
+    """Annotation progress counters for one source (?pages=1 adds the per-page breakdown)"""
+    return jsonify(source_catalog_stats(storage, source_id, include_pages=request.args.get('pages') == '1'))
+
+@app.route('/api/review/queue', methods=['GET'])
+def get_review_queue():
+    """Unverified items across all sources, lowest confidence first (keyset paginated)"""
+    status = request.args.get('status', 'ai')
+    if status not in QUEUE_STATUSES:
+        return jsonify({"error": "status must be one of ai, edited"}), 400
+    
+    try:
+        return jsonify(peek_catalogs(
+            storage,
+            status=status,
+            limit=request.args.get('limit', 20, type=int),
+            cursor=request.args.get('cursor'),
+            source_id=request.args.get('source_id'),
+            max_confidence=request.args.get('max_confidence', type=float),
+            reviewer=request.args.get('reviewer'),
+        ))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+@app.route('/api/review/claim', methods=['POST'])
+def claim_review_batch():
+    """Lease the next batch of queue items to a reviewer"""
+    data = request.get_json() or {}
+    reviewer = data.get('reviewer')
+    status = data.get('status', 'ai')
+    if not reviewer:
+        return jsonify({"error": "reviewer is required"}), 400
+    if status not in QUEUE_STATUSES:
+        return jsonify({"error": "status must be one of ai, edited"}), 400
+    try:
+        limit = int(data.get('limit', 20))
+        lease_seconds = int(data.get('lease_seconds', DEFAULT_LEASE_SECONDS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit and lease_seconds must be integers"}), 400
+    
+    try:
+        return jsonify(claim_catalogs(
+            storage,
+            reviewer,
+            status=status,
+            limit=limit,
+            cursor=data.get('cursor'),
+            source_id=data.get('source_id'),
+            max_confidence=data.get('max_confidence'),
+            lease_seconds=lease_seconds,
+        ))
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+@app.route('/api/review/release', methods=['POST'])
+def release_review_items():
+    """Give claimed items back to the queue"""
+    data = request.get_json() or {}
+    if not data.get('reviewer') or not isinstance(data.get('item_ids'), list):
+        return jsonify({"error": "reviewer and item_ids are required"}), 400
+    if not all(isinstance(item_id, int) for item_id in data['item_ids']):
+        return jsonify({"error": "item_ids must be integers"}), 400
+    
+    # Leases live with their items, so release per catalog file
+    by_path = {}
+    for item_id in data['item_ids']:
+        path = storage.catalog_path_for_item(item_id)
+        if path:
+            by_path.setdefault(path, []).append(item_id)
+    
+    released = 0
+    for path, item_ids in by_path.items():
+        conn = storage.connect(path)
+        try:
+            released += release_items(conn, data['reviewer'], item_ids)
+        finally:
+            conn.close()
+    return jsonify({"released": released})
+
+# Change feed: long-poll waits at most this long, streams reconnect after CHANGE_STREAM_SECONDS
+CHANGE_POLL_INTERVAL = 1.0
+CHANGE_MAX_WAIT = 30
+CHANGE_STREAM_SECONDS = 300
+CHANGE_HEARTBEAT_SECONDS = 15
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Long-poll for item changes in a source (or one page) after cursor `since`"""
+    source_id = request.args.get('source_id')
+    if not source_id:
+        return jsonify({"error": "source_id is required"}), 400
+    page = request.args.get('page', type=int)
+    since = request.args.get('since', type=int)
+    wait = min(max(request.args.get('wait', 0, type=float), 0), CHANGE_MAX_WAIT)
+    
+    # Change ids are per catalog file; a source without one has no changes yet
+    conn = storage.catalog(source_id)
+    if conn is None:
+        if since is not None:
+            wait_for_changes(wait)
+        return jsonify({"changes": [], "cursor": since or 0, "has_more": False})
+    try:
+        if since is None:
+            # No cursor yet: hand out the current position to start from
+            return jsonify({"changes": [], "cursor": latest_change_id(conn)})
+        
+        deadline = time.monotonic() + wait
+        changes = fetch_changes(conn, source_id, page, since)
+        while not changes and time.monotonic() < deadline:
+            wait_for_changes(min(CHANGE_POLL_INTERVAL, deadline - time.monotonic()))
+            changes = fetch_changes(conn, source_id, page, since)
+        
+        return jsonify({
+            "changes": changes,
+            "cursor": changes[-1]['id'] if changes else since,
+            "has_more": len(changes) == MAX_CHANGES,
+        })
+    finally:
+        conn.close()
+
+@app.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """Server-sent item changes for a source (or one page); resumes from Last-Event-ID"""
+    source_id = request.args.get('source_id')
+    if not source_id:
+        return jsonify({"error": "source_id is required"}), 400
+    page = request.args.get('page', type=int)
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    
+    def generate():
+        # The source may get its catalog file while the stream is open
+        conn = storage.catalog(source_id)
+        try:
+            cursor = since if since is not None else (latest_change_id(conn) if conn else 0)
+            yield f"event: ready\ndata: {json.dumps({'cursor': cursor})}\n\n"
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < CHANGE_STREAM_SECONDS:
+                if conn is None:
+                    conn = storage.catalog(source_id)
+                changes = fetch_changes(conn, source_id, page, cursor) if conn else []
+                for change in changes:
+                    yield f"id: {change['id']}\nevent: change\ndata: {json.dumps(change, ensure_ascii=False)}\n\n"
+                if changes:
+                    cursor = changes[-1]['id']
+                    last_sent = time.monotonic()
+                    continue
+                if time.monotonic() - last_sent >= CHANGE_HEARTBEAT_SECONDS:
+                    yield ": keep-alive\n\n"
+                    last_sent = time.monotonic()
+                wait_for_changes(CHANGE_POLL_INTERVAL)
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/export/<source_id>', methods=['POST'])
 def export_catalog(source_id):
-    """Export catalog data as JSON"""
-    conn = get_db_connection()
+    """Export catalog data as JSON; with `since` (revision) or `since_time` (ISO) only the changes"""
+    options = request.get_json(silent=True) or {}
+    since = request.args.get('since', options.get('since'))
+    since_time = request.args.get('since_time', options.get('since_time'))
+    
+    try:
+        since = int(since) if since is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "since must be an integer revision"}), 400
+    
+    conn = storage.catalog(source_id)
+    if conn is None:
+        # A source without a catalog file has nothing to export yet
+        export_data = {"source_id": source_id, "mode": "full", "revision": 0,
+                       "exported_at": datetime.now().isoformat(), "pages": []}
+        if since is not None or since_time:
+            export_data.update({"mode": "delta", "since": since if since is not None else since_time,
+                                "items": [], "tombstones": []})
+        return jsonify(export_data)
+    
+    if since is not None or since_time:
+        try:
+            export_data = delta_export(conn, source_id, since=since, since_time=since_time)
+            export_data["exported_at"] = datetime.now().isoformat()
+            return jsonify(export_data)
+        finally:
+            conn.close()
+    
+    # Read everything in one transaction so `revision` is a consistent watermark
+    conn.execute('BEGIN')
     
     # Get all pages for this source
     pages = conn.execute('''
@@ -681,6 +1020,8 @@ def export_catalog(source_id):
     
     export_data = {
         "source_id": source_id,
+        "mode": "full",
+        "revision": current_revision(conn),
         "exported_at": datetime.now().isoformat(),
         "pages": []
     }
@@ -698,29 +1039,11 @@ def export_catalog(source_id):
         }
         
         for item in items:
-            page_data['items'].append({
-                "id": item['id'],
-                "bbox": [item['bbox_x'], item['bbox_y'], item['bbox_w'], item['bbox_h']],
-                "name": item['name'],
-                "brand": item['brand'],
-                "variants": json.loads(item['variants_json']) if item['variants_json'] else None,
-                "price": {
-                    "value": item['price_value'],
-                    "currency": item['price_currency']
-                },
-                "size": {
-                    "value": item['size_value'],
-                    "unit": item['size_unit']
-                },
-                "barcode": item['barcode'],
-                "tags": json.loads(item['tags_json']) if item['tags_json'] else None,
-                "raw_text": item['raw_text'],
-                "confidence": item['confidence'],
-                "status": item['status']
-            })
+            page_data['items'].append(serialize_item(item))
         
         export_data['pages'].append(page_data)
     
+    conn.rollback()
     conn.close()
     return jsonify(export_data)
 
@@ -729,6 +1052,58 @@ def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()})
 
+@app.route('/api/health/openai-pool', methods=['GET'])
+def openai_pool_stats():
+    """OpenAI HTTP pool saturation and connection reuse counters"""
+    return jsonify(get_pool_stats())
+
+@app.route('/api/health/image-pool', methods=['GET'])
+def image_pool_stats():
+    """Image worker pool queue depth and job counters"""
+    return jsonify(get_image_pool().snapshot())
+
+@app.route('/api/health/hedging', methods=['GET'])
+def hedging_stats():
+    """Hedge rate, win rate and current hedge delays for OpenAI calls"""
+    return jsonify(get_hedger().snapshot())
+
+@app.route('/api/health/retention', methods=['GET'])
+def retention_status():
+    """Progress and totals of recent chat retention passes"""
+    conn = storage.chat()
+    try:
+        return jsonify({"runs": recent_runs(conn)})
+    finally:
+        conn.close()
+
+@app.route('/api/usage/session/<session_id>', methods=['GET'])
+def get_session_usage(session_id):
+    """Token/cost usage for a chat session"""
+    conn = storage.main()
+    try:
+        return jsonify(usage_by_key(conn, 'session_id', session_id))
+    finally:
+        conn.close()
+
+@app.route('/api/usage/source/<source_id>', methods=['GET'])
+def get_source_usage(source_id):
+    """Token/cost usage for a catalog source, broken down by extraction"""
+    conn = storage.main()
+    try:
+        return jsonify(usage_by_key(conn, 'source_id', source_id))
+    finally:
+        conn.close()
+
+@app.route('/api/usage/daily', methods=['GET'])
+def get_daily_usage():
+    """Token/cost usage per day"""
+    days = request.args.get('days', 30, type=int)
+    conn = storage.main()
+    try:
+        return jsonify({"days": usage_by_day(conn, max(1, min(days, 366)))})
+    finally:
+        conn.close()
+
 # Vision API endpoints
 @app.route('/api/vision/detect-items', methods=['POST'])
 def detect_items():
@@ -769,21 +1144,33 @@ def detect_items():
         
         # Read file content
         logger.info("Step 4: Reading file content...")
-        file_bytes = file.read()
+        file_bytes = read_upload(file)
         mime_type = file.content_type
         logger.info(f"File read: {len(file_bytes)} bytes")
         
+        # Large pages are split into overlapping tiles unless tiling is off
+        tiling = request.form.get('tiling', os.getenv('VISION_TILING', 'auto'))
+        if tiling not in ('auto', 'on', 'off'):
+            return jsonify({"error": "tiling must be one of auto, on, off"}), 400
+        
         # Call vision service
         logger.info("Step 5: Calling vision service...")
-        result_json = detect_boxes(file_bytes, mime_type)
+        extraction_id = str(uuid.uuid4())
+        with usage_context(session_id=request.form.get('session_id'),
+                           source_id=request.form.get('source_id'),
+                           extraction_id=extraction_id):
+            result_json = detect_boxes(file_bytes, mime_type, tiling=tiling)
         logger.info("Step 6: Parsing vision service result...")
         result = json.loads(result_json)
+        result['extraction_id'] = extraction_id
         
-        logger.info(f"Vision service completed successfully. Result: {json.dumps(result, indent=2)}")
+        logger.info(f"Vision service completed successfully: {result.get('status')}, {len(result_json)} bytes")
         logger.info("=== /api/vision/detect-items endpoint completed successfully ===")
         
         return jsonify(result)
         
+    except (HTTPException, ImagePoolBusy):
+        raise
     except Exception as e:
         logger.error(f"=== /api/vision/detect-items endpoint failed ===")
         logger.error(f"Error: {str(e)}")
@@ -829,27 +1216,109 @@ def extract_item():
         
         # Read file content
         logger.info("Step 4: Reading file content...")
-        file_bytes = file.read()
+        file_bytes = read_upload(file)
         mime_type = file.content_type
         logger.info(f"File read: {len(file_bytes)} bytes")
         
         # Call vision service
         logger.info("Step 5: Calling vision service...")
-        result_json = extract_item_service(file_bytes, mime_type)
+        extraction_id = str(uuid.uuid4())
+        with usage_context(session_id=request.form.get('session_id'),
+                           source_id=request.form.get('source_id'),
+                           extraction_id=extraction_id):
+            result_json = extract_item_service(file_bytes, mime_type)
         logger.info("Step 6: Parsing vision service result...")
         result = json.loads(result_json)
+        result['extraction_id'] = extraction_id
         
-        logger.info(f"Vision service completed successfully. Result: {json.dumps(result, indent=2)}")
+        logger.info(f"Vision service completed successfully: {result.get('status')}, {len(result_json)} bytes")
         logger.info("=== /api/vision/extract-item endpoint completed successfully ===")
         
         return jsonify(result)
         
+    except (HTTPException, ImagePoolBusy):
+        raise
     except Exception as e:
         logger.error(f"=== /api/vision/extract-item endpoint failed ===")
         logger.error(f"Error: {str(e)}")
         logger.error(f"Error type: {type(e).__name__}")
         return jsonify({"error": f"Item extraction failed: {str(e)}"}), 500
 
+def _sse(event: dict) -> str:
+    """Format an event dict as a server-sent event"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+@app.route('/api/vision/extract-stream', methods=['POST'])
+def extract_stream():
+    """Stream menu sections and items over SSE as the vision model emits them."""
+    logger.info("=== /api/vision/extract-stream endpoint called ===")
+    
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No file selected"}), 400
+    
+    if not file.content_type.startswith('image/'):
+        return jsonify({"error": "File must be an image"}), 400
+    
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key or api_key == 'sk-REPLACE_ME':
+        return jsonify({"error": "OpenAI API key not configured"}), 500
+    
+    from services.vision.routing import profile_image
+    from services.vision.streaming import stream_menu_routed
+    
+    file_bytes = read_upload(file)
+    mime_type = file.content_type
+    source_id = request.form.get('source_id')
+    page = request.form.get('page', type=int)
+    session_id = request.form.get('session_id')
+    extraction_id = str(uuid.uuid4())
+    
+    # Same tiling switch as detect-items; large pages are tiled, the rest routed
+    tiling = request.form.get('tiling', os.getenv('VISION_TILING', 'auto'))
+    if tiling not in ('auto', 'on', 'off'):
+        return jsonify({"error": "tiling must be one of auto, on, off"}), 400
+    
+    # Sized up before the response starts so a busy image pool still answers 503
+    try:
+        profile = profile_image(file_bytes)
+    except ImagePoolBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Could not read uploaded image: {str(e)}")
+        return jsonify({"error": "Could not read image"}), 400
+    
+    # Ingest the page image once so the canvas can load it (and its previews) by hash
+    if source_id and page is not None:
+        try:
+            ingest_page_image(source_id, page, file_bytes, mime_type)
+        except Exception as e:
+            logger.warning(f"Could not store page image for {source_id} page {page}: {str(e)}")
+    
+    def generate():
+        yield _sse({"type": "start", "extraction_id": extraction_id,
+                    "page_width": profile.width, "page_height": profile.height})
+        with usage_context(session_id=session_id, source_id=source_id, extraction_id=extraction_id):
+            try:
+                for event in stream_menu_routed(file_bytes, mime_type, profile, tiling):
+                    if event['type'] == 'done':
+                        store_extraction(extraction_id, source_id, page, session_id, event['menu'])
+                        event['extraction_id'] = extraction_id
+                    yield _sse(event)
+            except Exception as e:
+                logger.error(f"Streaming extraction failed: {str(e)}")
+                yield _sse({"type": "error", "error": f"Vision processing failed: {str(e)}"})
+        logger.info("=== /api/vision/extract-stream endpoint completed ===")
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/chat/new', methods=['POST'])
 def new_chat_session():
     """Create a new chat session"""
@@ -881,7 +1350,11 @@ def get_chat_history():
         if not session_id:
             return jsonify({"error": "session_id is required"}), 400
         
-        messages = fetch_messages(session_id, 50)
+        conn = storage.chat()
+        try:
+            messages = load_session(conn, session_id).messages
+        finally:
+            conn.close()
         
         # Format messages for frontend
         formatted_messages = []
@@ -944,23 +1417,30 @@ def send_chat_message():
         if not message:
             return jsonify({"error": "message is required"}), 400
         
-        # Ensure conversation exists
-        get_or_create_conversation(session_id)
-        
-        # Insert user message
-        insert_message(session_id, 'user', message)
-        
-        # Build history for model
-        history = build_history_for_model(session_id, 30)
-        
-        # Generate AI reply with context
-        ai_response = generate_reply(session_id, history, context_data)
-        
-        # Insert assistant reply
-        insert_message(session_id, 'assistant', ai_response)
-        
-        # Get last 50 messages to return
-        messages = fetch_messages(session_id, 50)
+        conn = storage.chat()
+        try:
+            # Read history and the active menu once (usually from the session cache);
+            # nothing is written until the reply is in
+            state = load_session(conn, session_id)
+            stored, menu = state.messages, state.menu
+            user_turn = ('user', message, datetime.utcnow().isoformat())
+            
+            # Build history for model
+            history = [{"role": role, "content": content} for role, content, _ in (stored + [user_turn])[:30]]
+            
+            # Generate AI reply with context
+            with usage_context(session_id=session_id,
+                               source_id=(context_data or {}).get('source_id')):
+                ai_response = generate_reply(session_id, history, context_data, menu)
+            
+            # Persist the user message and the reply together
+            turn = [user_turn, ('assistant', ai_response, datetime.utcnow().isoformat())]
+            save_chat_turn(conn, session_id, turn)
+        finally:
+            conn.close()
+        
+        # Return the first 50 messages, as the history endpoint does
+        messages = (stored + turn)[:50]
         formatted_messages = []
         for role, content, created_at in messages:
             formatted_messages.append({
@@ -0,0 +1,193 @@
+"""
+Check that parse_and_validate (single-pass TypeAdapter.validate_json) gives
+exactly the same output as the previous pipeline
+(json.loads -> normalize_menu -> MenuDoc(**data) -> model_dump) on a fixture
+corpus of synthetic menus, hand-written edge cases and code-fence variants.
+The previous pipeline's models and normalize_menu are copied below from the
+baseline, so the check does not compare the new models with themselves.
+
+Usage (from backend/):
+    python -m benchmarks.check_equivalence
+"""
+import copy
+import json
+import re
+import sys
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from benchmarks.fixtures import synthetic_menu, synthetic_menu_json
+
+EDGE_CASES: List[Dict[str, Any]] = [
+    {},
+    {"sections": []},
+    {"source": "  Kedai Kopi  ", "sections": [{"items": []}]},
+    {"source": "x", "sections": [{"name": "   ", "time": " ", "items": [{"name": " Teh "}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "price": {"value": "RM 12"}}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "price": {"value": "free"}}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "price": {"value": 3}, "size": {"value": "500", "unit": " g "}}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "size": {"value": "n/a", "unit": ""}}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "tags": ""}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "tags": [1, " two ", ""]}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "tags": {}}]}]},
+    {"source": "x", "sections": [{"items": [{"name": "A", "desc": "  ", "extras": {"k": [1, 2]}}]}]},
+    {"source": "x", "sections": [], "meta": {"service_charge_note": None}, "schema": {"name": "canta.menu", "version": "1.0"}},
+    {"source": "x", "sections": [], "unexpected": True},
+]
+
+
+# The baseline pipeline, copied from services/vision/gpt4o.py as it was
+# before the single-pass TypeAdapter, so the check compares against the
+# old behaviour rather than against the new models.
+
+class LegacyPrice(BaseModel):
+    value: Optional[float] = None
+    currency: str = "MYR"
+
+
+class LegacySize(BaseModel):
+    value: Optional[float] = None
+    unit: Optional[str] = None
+
+
+class LegacyItem(BaseModel):
+    name: str
+    price: LegacyPrice
+    size: LegacySize = Field(default_factory=LegacySize)
+    desc: Optional[str] = None
+    tags: Optional[List[str]] = None
+    extras: Dict[str, Any] = Field(default_factory=dict)
+
+
+class LegacySection(BaseModel):
+    name: Optional[str] = None
+    time: Optional[str] = None
+    items: List[LegacyItem] = Field(default_factory=list)
+
+
+class LegacyMenuDoc(BaseModel):
+    source: str
+    sections: List[LegacySection]
+    meta: Dict[str, Any] = Field(default_factory=dict)
+    schema: Dict[str, str] = Field(default_factory=lambda: {"name": "canta.menu", "version": "1.0"})
+
+    model_config = ConfigDict(extra="ignore")
+
+
+def legacy_normalize_money(value: Union[str, int, float, None]) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return round(float(value), 2)
+    if isinstance(value, str):
+        cleaned = re.sub(r'[RM\s$€£¥₹]', '', value.strip())
+        match = re.search(r'(\d+(?:\.\d+)?)', cleaned)
+        if match:
+            return round(float(match.group(1)), 2)
+    return None
+
+
+def legacy_normalize_menu(data: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(data, dict):
+        return data
+    if "source" not in data:
+        data["source"] = "Unknown"
+    if "sections" not in data:
+        data["sections"] = []
+    if "schema" not in data:
+        data["schema"] = {"name": "canta.menu", "version": "1.0"}
+    if "meta" not in data:
+        data["meta"] = {}
+    for section in data.get("sections", []):
+        if not isinstance(section, dict):
+            continue
+        for key in ["name", "time"]:
+            if key in section and isinstance(section[key], str):
+                section[key] = section[key].strip() or None
+        if "items" not in section:
+            section["items"] = []
+        for item in section.get("items", []):
+            if not isinstance(item, dict):
+                continue
+            for key in ["name", "desc"]:
+                if key in item and isinstance(item[key], str):
+                    item[key] = item[key].strip() or None
+            if "price" not in item:
+                item["price"] = {"value": None, "currency": "MYR"}
+            elif isinstance(item["price"], dict):
+                if "value" in item["price"]:
+                    item["price"]["value"] = legacy_normalize_money(item["price"]["value"])
+                if "currency" not in item["price"]:
+                    item["price"]["currency"] = "MYR"
+            if "size" not in item:
+                item["size"] = {"value": None, "unit": None}
+            elif isinstance(item["size"], dict):
+                if "value" in item["size"] and item["size"]["value"] is not None:
+                    try:
+                        item["size"]["value"] = float(item["size"]["value"])
+                    except (ValueError, TypeError):
+                        item["size"]["value"] = None
+                if "unit" in item["size"] and isinstance(item["size"]["unit"], str):
+                    item["size"]["unit"] = item["size"]["unit"].strip() or None
+            if "tags" in item:
+                if isinstance(item["tags"], str):
+                    item["tags"] = [tag.strip() for tag in item["tags"].split(",") if tag.strip()]
+                elif isinstance(item["tags"], list):
+                    item["tags"] = [str(tag).strip() for tag in item["tags"] if str(tag).strip()]
+                if not item["tags"]:
+                    item["tags"] = None
+            if "extras" not in item:
+                item["extras"] = {}
+    return data
+
+
+def legacy_parse_and_validate(raw_json: str) -> Dict[str, Any]:
+    """json.loads -> normalize_menu -> MenuDoc(**data) -> model_dump, as in the baseline."""
+    cleaned = raw_json.strip()
+    if cleaned.startswith("```json"):
+        cleaned = cleaned[7:]
+    if cleaned.endswith("```"):
+        cleaned = cleaned[:-3]
+    data = json.loads(cleaned.strip())
+    return LegacyMenuDoc(**legacy_normalize_menu(data)).model_dump()
+
+
+def corpus() -> List[Tuple[str, str]]:
+    cases = [(f"synthetic[{n}, seed={seed}]", synthetic_menu_json(n, seed=seed, fenced=seed % 2 == 0))
+             for n in (1, 10, 100, 1000) for seed in range(5)]
+    cases += [(f"edge[{i}]", json.dumps(case)) for i, case in enumerate(EDGE_CASES)]
+    # A few raw dicts that the validators must also handle without a prior normalize pass
+    cases += [("synthetic-unfenced[50]", json.dumps(synthetic_menu(50, seed=99)))]
+    body = json.dumps(EDGE_CASES[3])
+    cases += [(f"fence[{i}]", raw) for i, raw in enumerate((
+        f"```json\n{body}\n```", f"  ```json{body}```  ", f"```\n{body}\n```", f"{body}\n```",
+        "```json\n```", "not json", "[]", "null",
+    ))]
+    return cases
+
+
+def _outcome(fn, raw: str) -> Tuple[str, Any]:
+    try:
+        return "ok", fn(raw)
+    except Exception as e:  # compare failure vs success, not error text
+        return "error", type(e).__name__
+
+
+def main() -> int:
+    from services.vision.gpt4o import parse_and_validate
+
+    mismatches = 0
+    cases = corpus()
+    for name, raw in cases:
+        expected = _outcome(legacy_parse_and_validate, copy.copy(raw))
+        actual = _outcome(parse_and_validate, raw)
+        if expected[0] != actual[0] or (expected[0] == "ok" and expected[1] != actual[1]):
+            mismatches += 1
+            print(f"MISMATCH {name}:\n  legacy: {str(expected)[:300]}\n  new:    {str(actual)[:300]}")
+    print(f"{len(cases) - mismatches}/{len(cases)} cases identical")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
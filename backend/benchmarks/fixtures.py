@@ -0,0 +1,105 @@
+import json
+import random
+import sqlite3
+from typing import Any, Dict, List
+
+# Deterministic synthetic inputs for the benchmarks. The shapes mirror what
+# gpt-4o-mini actually returns: untrimmed strings, "RM 12.50" prices, tags as
+# comma-separated strings, missing optional keys and a ```json fence.
+
+DISHES = ["Nasi Lemak", "Mee Goreng", "Roti Canai", "Teh Tarik", "Milo Ais",
+          "Char Kuey Teow", "Laksa", "Satay Ayam", "Kopi O", "Cendol"]
+UNITS = ["g", "kg", "ml", "l", "pcs", "pack", None]
+SECTIONS = ["Breakfast", "Mains", "Drinks", "Desserts", "Sides"]
+
+
+def _messy_price(rng: random.Random) -> Any:
+    value = round(rng.uniform(1, 80), 2)
+    return rng.choice([value, f"RM {value}", f"RM{value:.2f}", f" {value} ", None, int(value)])
+
+
+def _messy_item(rng: random.Random, i: int) -> Dict[str, Any]:
+    item: Dict[str, Any] = {"name": f"  {rng.choice(DISHES)} {i}  "}
+    if rng.random() < 0.9:
+        item["price"] = {"value": _messy_price(rng)}
+        if rng.random() < 0.7:
+            item["price"]["currency"] = "MYR"
+    if rng.random() < 0.6:
+        item["size"] = {"value": rng.choice([rng.randint(1, 1000), str(rng.randint(1, 1000)), "n/a"]),
+                        "unit": rng.choice(UNITS)}
+    if rng.random() < 0.5:
+        item["desc"] = rng.choice(["", "  Spicy  ", "House special with sambal"])
+    roll = rng.random()
+    if roll < 0.3:
+        item["tags"] = "halal, spicy , , signature"
+    elif roll < 0.6:
+        item["tags"] = ["halal", " ", "vegetarian "]
+    if rng.random() < 0.3:
+        item["extras"] = {"large": f"RM {rng.randint(5, 30)}"}
+    return item
+
+
+def synthetic_menu(n_items: int, seed: int = 42) -> Dict[str, Any]:
+    """A raw (pre-normalization) menu dict with `n_items` items."""
+    rng = random.Random(seed + n_items)
+    sections: List[Dict[str, Any]] = []
+    per_section = max(1, n_items // len(SECTIONS))
+    for s, name in enumerate(SECTIONS):
+        count = per_section if s < len(SECTIONS) - 1 else n_items - per_section * (len(SECTIONS) - 1)
+        if count <= 0:
+            continue
+        section: Dict[str, Any] = {"name": f" {name} ", "time": rng.choice(["", "lunch", None])}
+        section["items"] = [_messy_item(rng, s * per_section + i) for i in range(count)]
+        sections.append(section)
+    return {"source": "Synthetic kopitiam menu", "sections": sections, "meta": {"service_charge_note": True}}
+
+
+def synthetic_menu_json(n_items: int, seed: int = 42, fenced: bool = True) -> str:
+    """Raw model output for a synthetic menu, optionally wrapped in a ```json fence."""
+    body = json.dumps(synthetic_menu(n_items, seed), ensure_ascii=False)
+    return f"```json\n{body}\n```" if fenced else body
+
+
+def money_inputs(n: int = 1000, seed: int = 7) -> List[Any]:
+    rng = random.Random(seed)
+    return [_messy_price(rng) for _ in range(n)]
+
+
+def catalog_db(items_per_page: int, pages: int = 1, seed: int = 3) -> sqlite3.Connection:
+    """In-memory catalog with `pages` pages of `items_per_page` items each."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    conn.executescript('''
+        CREATE TABLE catalog_pages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, source_id TEXT NOT NULL,
+            page INTEGER NOT NULL, page_width INTEGER NOT NULL, page_height INTEGER NOT NULL
+        );
+        CREATE TABLE catalog_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, page_id INTEGER NOT NULL,
+            bbox_x INTEGER NOT NULL, bbox_y INTEGER NOT NULL, bbox_w INTEGER NOT NULL, bbox_h INTEGER NOT NULL,
+            name TEXT, brand TEXT, variants_json TEXT, price_value REAL, price_currency TEXT DEFAULT 'MYR',
+            size_value REAL, size_unit TEXT, barcode TEXT, tags_json TEXT, raw_text TEXT,
+            confidence REAL NOT NULL, status TEXT DEFAULT 'ai'
+        );
+    ''')
+    for p in range(1, pages + 1):
+        page_id = conn.execute(
+            'INSERT INTO catalog_pages (source_id, page, page_width, page_height) VALUES (?, ?, ?, ?)',
+            ('bench', p, 2480, 3508)).lastrowid
+        conn.executemany('''
+            INSERT INTO catalog_items (page_id, bbox_x, bbox_y, bbox_w, bbox_h, name, brand, variants_json,
+                price_value, price_currency, size_value, size_unit, barcode, tags_json, raw_text, confidence, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            page_id, rng.randint(0, 2400), rng.randint(0, 3400), rng.randint(40, 400), rng.randint(40, 400),
+            f"{rng.choice(DISHES)} {i}", rng.choice(["Nestle", "Gardenia", "F&N", None]),
+            json.dumps(["Original", "Less Sugar"]) if rng.random() < 0.3 else None,
+            round(rng.uniform(1, 80), 2), 'MYR', float(rng.randint(1, 1000)), rng.choice(UNITS),
+            str(rng.randint(10 ** 12, 10 ** 13 - 1)) if rng.random() < 0.5 else None,
+            json.dumps(["promo", "halal"]) if rng.random() < 0.5 else None,
+            f"{rng.choice(DISHES)} RM{rng.uniform(1, 80):.2f}", round(rng.random(), 3),
+            rng.choice(['ai', 'edited', 'verified']),
+        ) for i in range(items_per_page)])
+    conn.commit()
+    return conn
@@ -0,0 +1,121 @@
+"""
+Tail latency of /api/chat/send with and without hedged OpenAI calls.
+
+The backend runs in a child process against loadtest.fake_openai with a
+long-tailed latency model plus rare very slow responses (--slow-rate), once
+with OPENAI_HEDGING off and once with it on. Each client thread keeps its own
+chat session and sends messages back to back. Extra upstream requests are
+read from the fake server's /_stats and the hedge and win rates from
+/api/health/hedging.
+
+Usage (from backend/):
+    python -m benchmarks.hedging                                   # 600 messages, 3% at 5 s
+    python -m benchmarks.hedging --messages 1000 --slow-rate 0.02 --slow-ms 8000 --json hedging.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, List
+
+from benchmarks.image_offload import _percentile
+from benchmarks.upload_memory import BACKEND_DIR, _free_port, _wait_for
+
+
+def run_one(hedging: bool, args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    fake_port, app_port = _free_port(), _free_port()
+    env = {**os.environ, 'OPENAI_API_KEY': 'sk-fake', 'OPENAI_BASE_URL': f'http://127.0.0.1:{fake_port}/v1',
+           'PYTHONPATH': BACKEND_DIR, 'OPENAI_HEDGING': 'on' if hedging else 'off',
+           'HEDGE_BUDGET': str(args.budget), 'HEDGE_PERCENTILE': str(args.percentile)}
+    scratch = tempfile.mkdtemp(prefix='hedging-')
+    fake = subprocess.Popen([sys.executable, '-m', 'loadtest.fake_openai', '--port', str(fake_port),
+                             '--latency', args.latency, '--slow-rate', str(args.slow_rate),
+                             '--slow-ms', str(args.slow_ms)],
+                            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.upload_memory', '--serve', str(app_port)],
+                              cwd=scratch, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{app_port}'
+    latencies: List[float] = []
+    failures = 0
+    lock = threading.Lock()
+    try:
+        _wait_for(f'http://127.0.0.1:{fake_port}/_stats')
+        _wait_for(f'{base_url}/api/health')
+        per_client = args.messages // args.clients
+
+        def chat():
+            nonlocal failures
+            session_id = str(uuid.uuid4())
+            with httpx.Client(base_url=base_url, timeout=120) as client:
+                for n in range(per_client):
+                    started = time.perf_counter()
+                    response = client.post('/api/chat/send', json={'session_id': session_id,
+                                                                   'message': f'What do you recommend? ({n})'})
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        if response.status_code == 200:
+                            latencies.append(elapsed)
+                        else:
+                            failures += 1
+
+        threads = [threading.Thread(target=chat) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        upstream = httpx.get(f'http://127.0.0.1:{fake_port}/_stats').json()
+        hedge = httpx.get(f'{base_url}/api/health/hedging').json()
+    finally:
+        server.terminate()
+        fake.terminate()
+    return {
+        "hedging": hedging,
+        "messages": len(latencies),
+        "failures": failures,
+        "upstream_requests": upstream["requests"],
+        "extra_upstream": round(upstream["requests"] / max(1, len(latencies) + failures) - 1, 4),
+        "hedge_rate": hedge["hedge_rate"],
+        "win_rate": hedge["win_rate"],
+        "p50_ms": round(_percentile(latencies, 0.50), 1),
+        "p95_ms": round(_percentile(latencies, 0.95), 1),
+        "p99_ms": round(_percentile(latencies, 0.99), 1),
+        "max_ms": round(max(latencies), 1) if latencies else 0.0,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=600)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--latency', default='lognormal:300,0.3', help='fake server latency model')
+    parser.add_argument('--slow-rate', type=float, default=0.03)
+    parser.add_argument('--slow-ms', type=float, default=5000)
+    parser.add_argument('--budget', type=float, default=0.1, help='HEDGE_BUDGET for the hedged run')
+    parser.add_argument('--percentile', type=float, default=95, help='HEDGE_PERCENTILE for the hedged run')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    rows = [run_one(hedging, args) for hedging in (False, True)]
+    print(f"{args.messages} messages, {args.clients} clients, latency {args.latency}, "
+          f"{args.slow_rate:g} at {args.slow_ms:g} ms")
+    print(f"{'hedging':>8} {'ok':>5} {'extra':>6} {'hedged':>7} {'won':>6} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for row in rows:
+        print(f"{'on' if row['hedging'] else 'off':>8} {row['messages']:>5} {row['extra_upstream']:>6.1%} "
+              f"{row['hedge_rate']:>7.1%} {row['win_rate']:>6.1%} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['p99_ms']:>8} {row['max_ms']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"runs": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
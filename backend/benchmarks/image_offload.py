@@ -0,0 +1,132 @@
+"""
+API latency while page images are being ingested, with and without the
+image worker pool.
+
+For each IMAGE_WORKERS setting the backend runs in a child process against
+loadtest.fake_openai. Ingestion threads upload page images (stored and
+thumbnailed) and run tiled extractions on them, while a probe thread times a
+cheap read endpoint. IMAGE_WORKERS=0 runs the Pillow work on the request
+threads, as before the pool existed.
+
+Usage (from backend/):
+    python -m benchmarks.image_offload                          # workers 0 and 4
+    python -m benchmarks.image_offload --workers 0,2,4 --seconds 30 --json offload.json
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.upload_memory import BACKEND_DIR, _free_port, _wait_for
+
+
+def page_jpeg(width: int = 3000, height: int = 4000) -> bytes:
+    """A page-sized JPEG with enough detail to make decoding and resizing cost something."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for y in range(0, height, 24):
+        draw.text((40, y), f"Nasi lemak ayam goreng RM{y % 97}.50  " * 12, fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def run_one(workers: int, seconds: float, ingesters: int, image: bytes) -> Dict[str, Any]:
+    import httpx
+
+    fake_port, app_port = _free_port(), _free_port()
+    env = {**os.environ, 'OPENAI_API_KEY': 'sk-fake', 'OPENAI_BASE_URL': f'http://127.0.0.1:{fake_port}/v1',
+           'PYTHONPATH': BACKEND_DIR, 'IMAGE_WORKERS': str(workers)}
+    scratch = tempfile.mkdtemp(prefix='image-offload-')
+    fake = subprocess.Popen([sys.executable, '-m', 'loadtest.fake_openai', '--port', str(fake_port),
+                             '--latency', 'fixed:200'], cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.upload_memory', '--serve', str(app_port)],
+                              cwd=scratch, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{app_port}'
+    latencies: List[float] = []
+    pages = 0
+    lock = threading.Lock()
+    try:
+        _wait_for(f'http://127.0.0.1:{fake_port}/_stats')
+        _wait_for(f'{base_url}/api/health')
+        deadline = time.time() + seconds
+
+        def ingest(worker: int):
+            nonlocal pages
+            with httpx.Client(base_url=base_url, timeout=300) as client:
+                page = 0
+                while time.time() < deadline:
+                    page += 1
+                    # A new trailing byte gives every upload its own digest, so thumbnails render each time
+                    data = image + f'{worker}-{page}'.encode()
+                    client.post(f'/api/catalog/bench-{worker}/page/{page}/image',
+                                files={'file': ('page.jpg', data, 'image/jpeg')})
+                    client.post('/api/vision/detect-items', files={'file': ('page.jpg', data, 'image/jpeg')},
+                                data={'tiling': 'on'})
+                    with lock:
+                        pages += 1
+
+        def probe():
+            with httpx.Client(base_url=base_url, timeout=30) as client:
+                while time.time() < deadline:
+                    started = time.perf_counter()
+                    client.get('/api/health')
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    time.sleep(0.02)
+
+        threads = [threading.Thread(target=ingest, args=(i,)) for i in range(ingesters)]
+        threads.append(threading.Thread(target=probe))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        fake.terminate()
+    return {
+        "image_workers": workers,
+        "pages": pages,
+        "pages_per_second": round(pages / seconds, 2),
+        "probe_requests": len(latencies),
+        "probe_p50_ms": round(_percentile(latencies, 0.50), 1),
+        "probe_p95_ms": round(_percentile(latencies, 0.95), 1),
+        "probe_p99_ms": round(_percentile(latencies, 0.99), 1),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='0,4', help='IMAGE_WORKERS settings to compare')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--ingesters', type=int, default=4, help='concurrent ingestion clients')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    image = page_jpeg()
+    rows = [run_one(int(w), args.seconds, args.ingesters, image) for w in args.workers.split(',')]
+    print(f"page {len(image) / 1024 / 1024:.1f} MB, {args.ingesters} ingesters, {args.seconds:g}s, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'pages':>6} {'pages/s':>8} {'probe p50':>10} {'p95':>8} {'p99':>8}")
+    for row in rows:
+        print(f"{row['image_workers']:>8} {row['pages']:>6} {row['pages_per_second']:>8} "
+              f"{row['probe_p50_ms']:>10} {row['probe_p95_ms']:>8} {row['probe_p99_ms']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"cpus": os.cpu_count(), "runs": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Cost of re-uploading a catalog page: full extraction versus re-reading only
+the tiles whose perceptual signature changed.
+
+A synthetic A4 menu page (300 dpi, small print) is uploaded to
+POST /api/catalog/<source>/page/<n>/extract, then uploaded again unchanged,
+re-encoded as JPEG, and with one and three prices edited. The first row is
+the existing full tiled extraction (/api/vision/detect-items, tiling=on) of
+the same page for comparison. Calls, tokens and cost come from the
+llm_usage rows of each request. The app runs in this process against
+loadtest.fake_openai in a child process.
+
+Usage (from backend/):
+    python -m benchmarks.incremental_extract
+    python -m benchmarks.incremental_extract --width 2480 --height 3508 --json incremental.json
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.upload_memory import BACKEND_DIR, _free_port, _wait_for
+
+# The bitmap font is drawn at 1/SCALE and scaled up, so glyphs are ~30px tall
+SCALE = 3
+ROW_PITCH = 25
+
+
+def menu_page(width: int, height: int, edits: Dict[Tuple[int, int], str], fmt: str = 'PNG', **save) -> bytes:
+    """A page of three columns of 'Nasi lemak r-c RM9.90' lines; `edits` replaces prices by (row, column)."""
+    from PIL import Image, ImageDraw
+
+    small = Image.new('L', (width // SCALE, height // SCALE), 255)
+    draw = ImageDraw.Draw(small)
+    column_width = small.width // 3
+    for row in range(small.height // ROW_PITCH):
+        for column in range(3):
+            price = edits.get((row, column), '9.90')
+            draw.text((10 + column * column_width, 8 + row * ROW_PITCH), f"Nasi lemak {row}-{column} RM{price}", fill=0)
+    image = small.resize((width, height), Image.Resampling.BICUBIC).convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **save)
+    return buffer.getvalue()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=2480)
+    parser.add_argument('--height', type=int, default=3508)
+    parser.add_argument('--latency', default='fixed:200', help='fake server latency model')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    fake_port = _free_port()
+    os.environ.update({'OPENAI_API_KEY': 'sk-fake', 'OPENAI_BASE_URL': f'http://127.0.0.1:{fake_port}/v1'})
+    fake = subprocess.Popen([sys.executable, '-m', 'loadtest.fake_openai', '--port', str(fake_port),
+                             '--latency', args.latency], cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    os.chdir(tempfile.mkdtemp(prefix='incremental-extract-'))
+    try:
+        _wait_for(f'http://127.0.0.1:{fake_port}/_stats')
+        import logging
+
+        import app as backend
+        from services.usage import flush_usage
+
+        logging.disable(logging.INFO)
+        backend.init_db()
+        client = backend.app.test_client()
+
+        rows = int(args.height // SCALE // ROW_PITCH)
+        one_edit = {(rows // 4, 0): '12.50'}
+        three_edits = {**one_edit, (rows // 2, 1): '7.20', (rows - 3, 2): '15.00'}
+        scenarios: List[Tuple[str, str, bytes, str]] = [
+            ('full tiled', 'detect', menu_page(args.width, args.height, one_edit), 'image/png'),
+            ('first upload', 'extract', menu_page(args.width, args.height, {}), 'image/png'),
+            ('unchanged', 'extract', menu_page(args.width, args.height, {}), 'image/png'),
+            ('jpeg q85', 'extract', menu_page(args.width, args.height, {}, 'JPEG', quality=85), 'image/jpeg'),
+            ('1 price', 'extract', menu_page(args.width, args.height, one_edit), 'image/png'),
+            ('3 prices', 'extract', menu_page(args.width, args.height, three_edits), 'image/png'),
+        ]
+        results: List[Dict[str, Any]] = []
+        for name, kind, image, mime in scenarios:
+            started = time.perf_counter()
+            if kind == 'detect':
+                response = client.post('/api/vision/detect-items', content_type='multipart/form-data',
+                                       data={'file': (io.BytesIO(image), 'page', mime), 'tiling': 'on'})
+            else:
+                response = client.post('/api/catalog/bench/page/1/extract', content_type='multipart/form-data',
+                                       data={'file': (io.BytesIO(image), 'page', mime)})
+            seconds = time.perf_counter() - started
+            body = response.get_json()
+            if response.status_code != 200:
+                raise RuntimeError(f"{name}: {response.status_code} {body}")
+            flush_usage()
+            conn = sqlite3.connect(backend.storage.database)
+            calls, prompt, cost = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(cost_usd), 0)
+                FROM llm_usage WHERE extraction_id = ?
+            ''', (body.get('extraction_id'),)).fetchone()
+            conn.close()
+            results.append({
+                "scenario": name,
+                "tiles": body.get('tiles'),
+                "refreshed_tiles": len(body['refreshed_tiles']) if 'refreshed_tiles' in body else None,
+                "calls": calls,
+                "prompt_tokens": prompt,
+                "cost_usd": round(cost, 6),
+                "seconds": round(seconds, 2),
+                "items": body.get('items'),
+            })
+    finally:
+        fake.terminate()
+
+    print(f"{args.width}x{args.height} page, fake latency {args.latency}")
+    print(f"{'scenario':>12} {'tiles':>6} {'re-read':>8} {'calls':>6} {'prompt tok':>11} {'cost $':>10} {'seconds':>8}")
+    for row in results:
+        print(f"{row['scenario']:>12} {row['tiles'] or '-':>6} "
+              f"{'-' if row['refreshed_tiles'] is None else row['refreshed_tiles']:>8} {row['calls']:>6} "
+              f"{row['prompt_tokens']:>11} {row['cost_usd']:>10.6f} {row['seconds']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"width": args.width, "height": args.height, "runs": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+Offline evaluation of vision routing policies.
+
+Every image in the dataset is extracted once per policy and the policies are
+compared on cost, latency and accuracy. Labels are optional: a `<name>.json`
+next to `<name>.png`/`.jpg` holds the expected canta.menu document. Images
+without a label only count towards cost and latency.
+
+Usage (from backend/):
+    python -m benchmarks.routing_eval --dataset eval_images/ --policies fixed,adaptive,economy
+    # cost/latency only, against loadtest.fake_openai:
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=sk-fake \\
+        python -m benchmarks.routing_eval --synthetic 4
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loadtest.driver import percentile, synthetic_page_png
+
+_SPACE_RE = re.compile(r'\s+')
+IMAGE_TYPES = {'.png': 'image/png', '.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.webp': 'image/webp'}
+
+
+def load_dataset(path: str) -> List[Tuple[str, bytes, str, Optional[Dict[str, Any]]]]:
+    cases = []
+    for filename in sorted(os.listdir(path)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() not in IMAGE_TYPES:
+            continue
+        with open(os.path.join(path, filename), 'rb') as f:
+            image = f.read()
+        label = None
+        label_path = os.path.join(path, stem + '.json')
+        if os.path.exists(label_path):
+            with open(label_path) as f:
+                label = json.load(f)
+        cases.append((filename, image, IMAGE_TYPES[ext.lower()], label))
+    return cases
+
+
+def synthetic_dataset(count: int) -> List[Tuple[str, bytes, str, Optional[Dict[str, Any]]]]:
+    """Unlabelled product crops and A4 pages, half each."""
+    cases = []
+    for i in range(count):
+        size = (480, 480) if i % 2 == 0 else (1654, 2339)
+        cases.append((f"synthetic-{i}-{size[0]}x{size[1]}.png", synthetic_page_png(*size), 'image/png', None))
+    return cases
+
+
+def _items(menu: Dict[str, Any]) -> Dict[str, Optional[float]]:
+    return {_SPACE_RE.sub(' ', item.get('name') or '').strip().casefold(): (item.get('price') or {}).get('value')
+            for section in menu.get('sections', []) for item in section.get('items', [])}
+
+
+def _same_price(a: Optional[float], b: Optional[float]) -> bool:
+    return a == b or (a is not None and b is not None and abs(a - b) <= 0.01)
+
+
+def score(predicted: Dict[str, Any], expected: Dict[str, Any]) -> Dict[str, float]:
+    """Item-name precision/recall/F1 and price accuracy over the matched names."""
+    got, want = _items(predicted), _items(expected)
+    matched = set(got) & set(want)
+    precision = len(matched) / len(got) if got else 0.0
+    recall = len(matched) / len(want) if want else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    prices = [_same_price(got[name], want[name]) for name in matched]
+    return {"precision": precision, "recall": recall, "f1": f1,
+            "price_accuracy": sum(prices) / len(prices) if prices else 0.0}
+
+
+def run_policy(policy: str, cases) -> List[Dict[str, Any]]:
+    from services.usage import usage_context
+    from services.vision.routing import extract_menu_routed
+
+    rows = []
+    for name, image, mime, label in cases:
+        extraction_id = f"{policy}:{name}"
+        started = time.perf_counter()
+        with usage_context(source_id='routing-eval', extraction_id=extraction_id):
+            try:
+                menu, ok = extract_menu_routed(image, mime, policy=policy), True
+            except Exception as e:
+                print(f"  {policy} {name}: failed: {e}", file=sys.stderr)
+                menu, ok = {}, False
+        rows.append({
+            "policy": policy,
+            "image": name,
+            "ok": ok,
+            "latency_s": time.perf_counter() - started,
+            "attempts": len(((menu.get('meta') or {}).get('routing') or {}).get('attempts', [])),
+            "score": score(menu, label) if ok and label is not None else None,
+        })
+    return rows
+
+
+def summarize(rows: List[Dict[str, Any]], db_path: str) -> Dict[str, Dict[str, Any]]:
+    from services.usage import flush_usage
+
+    flush_usage()
+    conn = sqlite3.connect(db_path)
+    cost = defaultdict(float)
+    calls = defaultdict(int)
+    for extraction_id, n, usd in conn.execute(
+            'SELECT extraction_id, COUNT(*), SUM(cost_usd) FROM llm_usage GROUP BY extraction_id'):
+        policy = extraction_id.split(':', 1)[0]
+        cost[policy] += usd
+        calls[policy] += n
+    conn.close()
+
+    summary = {}
+    by_policy = defaultdict(list)
+    for row in rows:
+        by_policy[row['policy']].append(row)
+    for policy, group in by_policy.items():
+        latencies = sorted(row['latency_s'] for row in group)
+        scored = [row['score'] for row in group if row['score']]
+        summary[policy] = {
+            "images": len(group),
+            "failures": sum(not row['ok'] for row in group),
+            "calls": calls[policy],
+            "escalated": sum(row['attempts'] > 1 for row in group),
+            "cost_usd": cost[policy],
+            "cost_per_image_usd": cost[policy] / len(group),
+            "p50_s": percentile(latencies, 50),
+            "p95_s": percentile(latencies, 95),
+            "f1": sum(s['f1'] for s in scored) / len(scored) if scored else None,
+            "price_accuracy": sum(s['price_accuracy'] for s in scored) / len(scored) if scored else None,
+        }
+    return summary
+
+
+def report(summary: Dict[str, Dict[str, Any]]) -> None:
+    header = (f"{'policy':10} {'imgs':>5} {'fail':>5} {'calls':>6} {'escal':>6} {'$/img':>10} "
+              f"{'p50 s':>7} {'p95 s':>7} {'F1':>6} {'price':>6}")
+    print(header)
+    print('-' * len(header))
+    fmt = lambda v: f"{v:6.3f}" if v is not None else f"{'-':>6}"
+    for policy, row in summary.items():
+        print(f"{policy:10} {row['images']:5d} {row['failures']:5d} {row['calls']:6d} {row['escalated']:6d} "
+              f"{row['cost_per_image_usd']:10.6f} {row['p50_s']:7.2f} {row['p95_s']:7.2f} "
+              f"{fmt(row['f1'])} {fmt(row['price_accuracy'])}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dataset', help='directory of images with optional <name>.json labels')
+    parser.add_argument('--synthetic', type=int, default=0, help='use N unlabelled synthetic images instead')
+    parser.add_argument('--policies', default='fixed,adaptive,economy')
+    parser.add_argument('--json', metavar='PATH', help='also write per-image rows and the summary as JSON')
+    args = parser.parse_args()
+
+    if not args.dataset and not args.synthetic:
+        parser.error('pass --dataset DIR or --synthetic N')
+    cases = load_dataset(args.dataset) if args.dataset else synthetic_dataset(args.synthetic)
+
+    from services.usage import USAGE_TABLE_SQL, configure_usage
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='routing-eval-'), 'usage.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute(USAGE_TABLE_SQL)
+    conn.close()
+    configure_usage(db_path)
+
+    rows = []
+    for policy in args.policies.split(','):
+        print(f"Running policy {policy} on {len(cases)} images...")
+        rows += run_policy(policy.strip(), cases)
+    summary = summarize(rows, db_path)
+    print()
+    report(summary)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"summary": summary, "rows": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
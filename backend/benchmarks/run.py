@@ -0,0 +1,220 @@
+"""
+Micro-benchmarks for the vision post-processing and catalog serialization
+hot paths.
+
+Usage (from backend/):
+    python -m benchmarks.run                          # run everything
+    python -m benchmarks.run --filter normalize_menu  # subset by name
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+Each benchmark reports ops/sec (from the median round), mean/stdev per op
+and tracemalloc peak allocation per op. `--compare` prints the change
+against a saved run and exits non-zero with `--fail-on-regression` when any
+benchmark slows down by more than `--threshold`.
+"""
+import argparse
+import contextlib
+import copy
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.fixtures import catalog_db, money_inputs, synthetic_menu, synthetic_menu_json
+
+MENU_SIZES = (10, 1_000, 50_000)
+PAGE_DENSITIES = (10, 200, 2_000)
+
+
+@dataclass
+class Benchmark:
+    name: str
+    fn: Callable[[Any], Any]
+    setup: Optional[Callable[[], Any]] = None
+    # Number of logical operations per call of `fn` (for batched tiny ops)
+    batch: int = 1
+
+
+def _quiet(fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """Silence the DEBUG prints in the vision module while still paying for them."""
+    def wrapped(arg):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return fn(arg)
+    return wrapped
+
+
+def build_benchmarks() -> List[Benchmark]:
+    from benchmarks.check_equivalence import legacy_parse_and_validate
+    from services.catalog import serialize_item
+    from services.vision.gpt4o import MenuDoc, normalize_menu, normalize_money, parse_and_validate
+
+    benches: List[Benchmark] = []
+
+    money = money_inputs(1000)
+    benches.append(Benchmark(
+        "normalize_money[x1000]",
+        lambda _: [normalize_money(v) for v in money],
+        batch=len(money),
+    ))
+
+    for size in MENU_SIZES:
+        raw = synthetic_menu(size)
+        raw_json = synthetic_menu_json(size)
+        normalized = normalize_menu(copy.deepcopy(raw))
+
+        benches.append(Benchmark(
+            f"normalize_menu[{size}]",
+            normalize_menu,
+            # normalize_menu mutates its input, so each round gets a fresh copy
+            setup=lambda raw=raw: copy.deepcopy(raw),
+        ))
+        benches.append(Benchmark(
+            f"menudoc_validate[{size}]",
+            lambda data: MenuDoc.model_validate(data).model_dump(),
+            setup=lambda normalized=normalized: normalized,
+        ))
+        benches.append(Benchmark(
+            f"parse_and_validate[{size}]",
+            _quiet(parse_and_validate),
+            setup=lambda raw_json=raw_json: raw_json,
+        ))
+        benches.append(Benchmark(
+            f"legacy_parse_and_validate[{size}]",
+            legacy_parse_and_validate,
+            setup=lambda raw_json=raw_json: raw_json,
+        ))
+
+    for density in PAGE_DENSITIES:
+        conn = catalog_db(density)
+
+        def serialize_page(_, conn=conn):
+            rows = conn.execute('SELECT * FROM catalog_items WHERE page_id = ? ORDER BY confidence ASC', (1,)).fetchall()
+            return json.dumps({"items": [serialize_item(row) for row in rows]})
+
+        benches.append(Benchmark(f"serialize_page[{density}]", serialize_page))
+
+    return benches
+
+
+def measure(bench: Benchmark, min_time: float, min_rounds: int, max_rounds: int) -> Dict[str, Any]:
+    """Time `bench` until both min_time and min_rounds are reached."""
+    times: List[float] = []
+    total = 0.0
+    while (total < min_time or len(times) < min_rounds) and len(times) < max_rounds:
+        arg = bench.setup() if bench.setup else None
+        start = time.perf_counter()
+        bench.fn(arg)
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        times.append(elapsed / bench.batch)
+
+    # Allocation profile from one extra, separately traced round
+    arg = bench.setup() if bench.setup else None
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    bench.fn(arg)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "ops_per_sec": 1.0 / median if median else float('inf'),
+        "mean_ms": statistics.fmean(times) * 1000,
+        "stdev_ms": statistics.pstdev(times) * 1000,
+        "rounds": len(times),
+        "peak_alloc_kib": (peak - before) / 1024 / bench.batch,
+        "retained_kib": (after - before) / 1024 / bench.batch,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None) -> List[tuple]:
+    """Print a result table; returns (name, ops/sec change) pairs vs baseline."""
+    header = f"{'benchmark':36} {'ops/sec':>12} {'mean ms':>10} {'stdev ms':>10} {'peak KiB':>10}"
+    if baseline:
+        header += f" {'vs base':>9}"
+    print(header)
+    print('-' * len(header))
+    changed = []
+    for name, r in results.items():
+        line = (f"{name:36} {r['ops_per_sec']:12.1f} {r['mean_ms']:10.3f} "
+                f"{r['stdev_ms']:10.3f} {r['peak_alloc_kib']:10.1f}")
+        if baseline and name in baseline:
+            delta = r['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1
+            line += f" {delta:+8.1%}"
+            changed.append((name, delta))
+        print(line)
+    return changed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--min-time', type=float, default=1.0, help='minimum seconds per benchmark')
+    parser.add_argument('--min-rounds', type=int, default=5)
+    parser.add_argument('--max-rounds', type=int, default=10_000)
+    parser.add_argument('--save', metavar='PATH', help='write results as JSON (e.g. a new baseline)')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a saved JSON run')
+    parser.add_argument('--threshold', type=float, default=0.10, help='regression threshold (fraction)')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    benches = build_benchmarks()
+    # Keep the (large) fixtures out of the cyclic GC's working set so they do
+    # not inflate the collection cost charged to whichever benchmark runs next
+    gc.collect()
+    gc.freeze()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for bench in benches:
+        if args.filter and args.filter not in bench.name:
+            continue
+        results[bench.name] = measure(bench, args.min_time, args.min_rounds, args.max_rounds)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    changed = print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                "meta": {
+                    "created_at": datetime.utcnow().isoformat(),
+                    "commit": _git_commit(),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+
+    regressions = [name for name, delta in changed if delta < -args.threshold]
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
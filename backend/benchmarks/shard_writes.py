@@ -0,0 +1,108 @@
+"""
+Catalog write throughput with one database file versus one file per source.
+
+Each writer thread owns a source and inserts items one transaction at a
+time through the storage router, the way create_item does (a connection per
+request, commit per item, all triggers live). With DB_LAYOUT=single every
+writer queues on the one SQLite write lock; with DB_LAYOUT=sharded writers
+for different sources lock different files.
+
+Usage (from backend/):
+    python -m benchmarks.shard_writes                              # 1, 4 and 8 sources
+    python -m benchmarks.shard_writes --writers 1,2,4,8,16 --seconds 10 --json shards.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+from benchmarks.image_offload import _percentile
+
+INSERT_ITEM_SQL = '''
+    INSERT INTO catalog_items (page_id, bbox_x, bbox_y, bbox_w, bbox_h, name, brand, raw_text, confidence, status)
+    VALUES ((SELECT id FROM catalog_pages WHERE source_id = ? AND page = 1), 0, 0, 100, 50, ?, 'Bench', ?, 0.5, 'ai')
+'''
+
+
+def run_one(layout: str, writers: int, seconds: float) -> Dict[str, Any]:
+    from services.storage import StorageRouter
+
+    scratch = tempfile.mkdtemp(prefix='shard-writes-')
+    storage = StorageRouter(os.path.join(scratch, 'catalog.db'), layout,
+                            os.path.join(scratch, 'shards'), os.path.join(scratch, 'chat.db'))
+    storage.init_schemas()
+    sources = [f'bench-{i}' for i in range(writers)]
+    for source_id in sources:
+        conn = storage.catalog(source_id, create=True)
+        conn.execute('INSERT INTO catalog_pages (source_id, page, page_width, page_height) VALUES (?, 1, 800, 1200)',
+                     (source_id,))
+        conn.commit()
+        conn.close()
+
+    latencies: List[float] = []
+    locked = 0
+    lock = threading.Lock()
+    deadline = time.time() + seconds
+
+    def write(source_id: str):
+        nonlocal locked
+        n = 0
+        while time.time() < deadline:
+            n += 1
+            started = time.perf_counter()
+            conn = storage.catalog(source_id)
+            try:
+                conn.execute(INSERT_ITEM_SQL, (source_id, f'Nasi lemak {n}', f'Nasi lemak {n} RM{n % 30}.50'))
+                conn.commit()
+            except sqlite3.OperationalError:
+                # Waited out the 5s busy timeout
+                with lock:
+                    locked += 1
+                continue
+            finally:
+                conn.close()
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=write, args=(source_id,)) for source_id in sources]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "layout": layout,
+        "writers": writers,
+        "writes": len(latencies),
+        "writes_per_second": round(len(latencies) / seconds, 1),
+        "locked_errors": locked,
+        "p50_ms": round(_percentile(latencies, 0.50), 2),
+        "p99_ms": round(_percentile(latencies, 0.99), 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', default='1,4,8', help='concurrent writers, one source each')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    args = parser.parse_args()
+
+    rows = [run_one(layout, int(w), args.seconds) for w in args.writers.split(',') for layout in ('single', 'sharded')]
+    print(f"{args.seconds:g}s per run, {os.cpu_count()} CPUs")
+    print(f"{'layout':>8} {'writers':>8} {'writes/s':>9} {'locked':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for row in rows:
+        print(f"{row['layout']:>8} {row['writers']:>8} {row['writes_per_second']:>9} {row['locked_errors']:>7} "
+              f"{row['p50_ms']:>8} {row['p99_ms']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"cpus": os.cpu_count(), "runs": rows}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Peak memory of the vision upload path under concurrent uploads.
+
+The backend runs in a child process (real threaded HTTP server, so the
+client's copies of the upload are not counted) against loadtest.fake_openai.
+For each concurrency level the child's peak RSS (VmHWM, reset between runs
+through /proc/<pid>/clear_refs) is compared with its RSS before the burst;
+the difference divided by the number of uploads is the cost of one upload.
+
+Usage (from backend/):
+    python -m benchmarks.upload_memory                        # 20 MB image, 1/4/8 uploads
+    python -m benchmarks.upload_memory --size-mb 8 --concurrency 1,2,4,8 --json mem.json
+"""
+import argparse
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def noise_png(size_mb: float) -> bytes:
+    """An incompressible PNG of roughly `size_mb` megabytes."""
+    from PIL import Image
+
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 30.0) -> None:
+    import httpx
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def _status_kb(pid: int, field: str) -> int:
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def _reset_peak(pid: int) -> bool:
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def serve(port: int) -> None:
+    """Child process: run the backend on `port` (cwd is a scratch directory)."""
+    import logging
+
+    sys.path.insert(0, BACKEND_DIR)
+    from werkzeug.serving import make_server
+
+    import app as backend
+
+    logging.disable(logging.INFO)
+    backend.init_db()
+    make_server('127.0.0.1', port, backend.app, threaded=True).serve_forever()
+
+
+def burst(base_url: str, image: bytes, endpoint: str, concurrency: int) -> List[int]:
+    import httpx
+
+    statuses: List[int] = []
+
+    def upload():
+        response = httpx.post(f"{base_url}{endpoint}", files={'file': ('page.png', image, 'image/png')},
+                              data={'tiling': 'off'}, timeout=300)
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=upload) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def run(size_mb: float, levels: List[int], endpoint: str) -> Dict[str, Any]:
+    image = noise_png(size_mb)
+    fake_port, app_port = _free_port(), _free_port()
+    env = {**os.environ, 'OPENAI_API_KEY': 'sk-fake', 'OPENAI_BASE_URL': f'http://127.0.0.1:{fake_port}/v1',
+           'PYTHONPATH': BACKEND_DIR}
+    scratch = tempfile.mkdtemp(prefix='upload-memory-')
+    fake = subprocess.Popen([sys.executable, '-m', 'loadtest.fake_openai', '--port', str(fake_port),
+                             '--latency', 'fixed:300'], cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.upload_memory', '--serve', str(app_port)],
+                              cwd=scratch, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{app_port}'
+    rows = []
+    try:
+        _wait_for(f'http://127.0.0.1:{fake_port}/_stats')
+        _wait_for(f'{base_url}/api/health')
+        burst(base_url, image, endpoint, 1)  # warm-up: imports, pools, allocator arenas
+        for concurrency in levels:
+            baseline = _status_kb(server.pid, 'VmRSS')
+            exact = _reset_peak(server.pid)
+            peak = baseline
+            sampling = True
+
+            def sample():
+                nonlocal peak
+                while sampling:
+                    peak = max(peak, _status_kb(server.pid, 'VmRSS'))
+                    time.sleep(0.002)
+
+            sampler = threading.Thread(target=sample)
+            sampler.start()
+            statuses = burst(base_url, image, endpoint, concurrency)
+            sampling = False
+            sampler.join()
+            if exact:
+                peak = max(peak, _status_kb(server.pid, 'VmHWM'))
+            growth = (peak - baseline) / 1024
+            rows.append({
+                "concurrency": concurrency,
+                "ok": statuses.count(200),
+                "baseline_mb": round(baseline / 1024, 1),
+                "peak_mb": round(peak / 1024, 1),
+                "per_upload_mb": round(growth / concurrency, 1),
+                "per_upload_x_image": round(growth / concurrency / (len(image) / 1024 / 1024), 2),
+            })
+    finally:
+        server.terminate()
+        fake.terminate()
+    return {"endpoint": endpoint, "image_mb": round(len(image) / 1024 / 1024, 1), "runs": rows}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=20)
+    parser.add_argument('--concurrency', default='1,4,8')
+    parser.add_argument('--endpoint', default='/api/vision/detect-items')
+    parser.add_argument('--json', metavar='PATH', help='also write the results as JSON')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    result = run(args.size_mb, [int(c) for c in args.concurrency.split(',')], args.endpoint)
+    print(f"{result['endpoint']}  image {result['image_mb']} MB")
+    print(f"{'uploads':>8} {'ok':>4} {'base MB':>8} {'peak MB':>8} {'MB/upload':>10} {'x image':>8}")
+    for row in result['runs']:
+        print(f"{row['concurrency']:>8} {row['ok']:>4} {row['baseline_mb']:>8} {row['peak_mb']:>8} "
+              f"{row['per_upload_mb']:>10} {row['per_upload_x_image']:>8}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Load-test driver for the CANTA backend.
+
+Usage (from backend/, with the backend pointed at loadtest.fake_openai):
+    python -m loadtest.driver --base-url http://localhost:5001 --duration 60 \\
+        --concurrency 16 --mix chat=40,detect=5,page=45,patch=10
+
+Each worker thread loops until the deadline, picking an operation from the
+weighted mix:
+    chat    POST  /api/chat/send            (on one of --sessions sessions)
+    detect  POST  /api/vision/detect-items  (synthetic page image)
+    page    GET   /api/catalog/<source>/page/<n>
+    patch   PATCH /api/item/<id>
+
+At the end it prints throughput and p50/p95/p99 latency per endpoint.
+"""
+import argparse
+import io
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_MIX = "chat=40,detect=5,page=45,patch=10"
+
+
+def parse_mix(spec: str) -> List[Tuple[str, int]]:
+    mix = []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        mix.append((name.strip(), int(weight)))
+    return mix
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def synthetic_page_png(width: int, height: int) -> bytes:
+    """A flyer-sized PNG with some blocks of 'text' so it is not trivially compressible."""
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(5)
+    for _ in range(200):
+        x, y = rng.randint(0, width - 100), rng.randint(0, height - 30)
+        draw.text((x, y), f"Milo 1kg RM{rng.uniform(5, 40):.2f}", fill=(rng.randint(0, 120),) * 3)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class LoadTest:
+    def __init__(self, base_url: str, source_id: str, pages: int, sessions: int, image: bytes, seed: int):
+        self.base_url = base_url.rstrip('/')
+        self.source_id = source_id
+        self.pages = pages
+        self.image = image
+        self.session_ids = [f"load-{uuid.uuid4().hex[:8]}-{i}" for i in range(sessions)]
+        self.item_ids: List[int] = []
+        self.recorder = Recorder()
+        self._seed = seed
+        self._local = threading.local()
+
+    def _client(self) -> httpx.Client:
+        if not hasattr(self._local, 'client'):
+            self._local.client = httpx.Client(base_url=self.base_url, timeout=180)
+        return self._local.client
+
+    def _timed(self, endpoint: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        response = None
+        try:
+            response = self._client().request(method, url, **kwargs)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        return response
+
+    def setup(self, items_per_page: int) -> None:
+        """Create chat sessions and seed catalog items for reads and PATCHes."""
+        client = httpx.Client(base_url=self.base_url, timeout=60)
+        for session_id in self.session_ids:
+            client.post('/api/chat/new', json={"session_id": session_id})
+        for page in range(1, self.pages + 1):
+            for i in range(items_per_page):
+                response = client.post(f'/api/catalog/{self.source_id}/page/{page}/items', json={
+                    "bbox_x": 10 * i, "bbox_y": 20 * i, "bbox_w": 120, "bbox_h": 80,
+                    "name": f"Load item {page}-{i}", "price": {"value": 9.9, "currency": "MYR"},
+                    "confidence": random.random(), "status": "ai",
+                })
+                if response.status_code == 200:
+                    self.item_ids.append(response.json()["id"])
+        client.close()
+
+    def op_chat(self, rng: random.Random) -> None:
+        self._timed('POST /api/chat/send', 'POST', '/api/chat/send', json={
+            "session_id": rng.choice(self.session_ids),
+            "message": rng.choice(["Ada nasi lemak?", "What drinks do you have?", "Recommend something spicy"]),
+        })
+
+    def op_detect(self, rng: random.Random) -> None:
+        self._timed('POST /api/vision/detect-items', 'POST', '/api/vision/detect-items',
+                    files={"file": ("page.png", self.image, "image/png")},
+                    data={"source_id": self.source_id})
+
+    def op_page(self, rng: random.Random) -> None:
+        page = rng.randint(1, self.pages)
+        self._timed('GET /api/catalog/<source_id>/page/<page>', 'GET',
+                    f'/api/catalog/{self.source_id}/page/{page}')
+
+    def op_patch(self, rng: random.Random) -> None:
+        if not self.item_ids:
+            return
+        self._timed('PATCH /api/item/<item_id>', 'PATCH', f'/api/item/{rng.choice(self.item_ids)}', json={
+            "price": {"value": round(rng.uniform(1, 50), 2)},
+            "status": rng.choice(["edited", "verified"]),
+        })
+
+    def worker(self, index: int, mix: List[Tuple[str, int]], deadline: float) -> None:
+        rng = random.Random(self._seed + index)
+        names = [name for name, _ in mix]
+        weights = [weight for _, weight in mix]
+        while time.perf_counter() < deadline:
+            getattr(self, f"op_{rng.choices(names, weights)[0]}")(rng)
+
+    def run(self, mix: List[Tuple[str, int]], concurrency: int, duration: float) -> float:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.worker, args=(i, mix, deadline), daemon=True)
+                   for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def report(recorder: Recorder, elapsed: float) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    header = f"{'endpoint':44} {'reqs':>7} {'err%':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print('-' * len(header))
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        row = {
+            "requests": len(values),
+            "error_rate": recorder.errors[endpoint] / len(values),
+            "rps": len(values) / elapsed,
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+        }
+        summary[endpoint] = row
+        print(f"{endpoint:44} {row['requests']:7d} {row['error_rate']:6.1%} {row['rps']:8.2f} "
+              f"{row['p50_ms']:9.1f} {row['p95_ms']:9.1f} {row['p99_ms']:9.1f}")
+    total = sum(len(v) for v in recorder.latencies.values())
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://localhost:5001')
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--source-id', default='loadtest')
+    parser.add_argument('--pages', type=int, default=5)
+    parser.add_argument('--items-per-page', type=int, default=50)
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--image-size', default='1654x2339', help='WxH of the synthetic upload (A4 @ 200dpi)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', metavar='PATH', help='also write the summary as JSON')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    width, height = (int(v) for v in args.image_size.lower().split('x'))
+    image = synthetic_page_png(width, height) if any(name == 'detect' for name, _ in mix) else b''
+
+    test = LoadTest(args.base_url, args.source_id, args.pages, args.sessions, image, args.seed)
+    print(f"Seeding {args.sessions} sessions and {args.pages}x{args.items_per_page} items...")
+    test.setup(args.items_per_page)
+    print(f"Running {args.concurrency} workers for {args.duration:.0f}s, mix {args.mix}\n")
+    elapsed = test.run(mix, args.concurrency, args.duration)
+    summary = report(test.recorder, elapsed)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"elapsed_s": elapsed, "mix": args.mix, "concurrency": args.concurrency,
+                       "endpoints": summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+"""
+Local fake of the OpenAI chat completions API for load testing.
+
+Usage (from backend/):
+    python -m loadtest.fake_openai --port 8089 --latency lognormal:800,0.5 --error-rate 0.02
+
+Then start the backend against it:
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=sk-fake python app.py
+
+Latency distributions (milliseconds):
+    fixed:MS                 constant delay
+    uniform:LO,HI            uniform between LO and HI
+    lognormal:MEDIAN,SIGMA   long-tailed, like the real API
+    (add `--slow-rate P --slow-ms MS` to inject rare very slow responses)
+
+Requests carrying an image get a canned canta.menu document; chat requests
+that offer `functions` get a `get_menu_items` function call with probability
+`--function-call-rate`, and a plain text reply otherwise. `"stream": true`
+requests get the same content as chat.completion.chunk SSE events.
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.fixtures import synthetic_menu_json
+
+
+# Streaming responses are replayed in small pieces at roughly model speed
+STREAM_CHUNK_CHARS = 24
+STREAM_CHUNK_DELAY_S = 0.005
+
+
+class LatencyModel:
+    """Samples a response delay in seconds from a configured distribution."""
+
+    def __init__(self, spec: str, slow_rate: float = 0.0, slow_ms: float = 0.0, seed: int = 0):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(p) for p in params.split(',') if p]
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        if kind not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.slow_rate and self._rng.random() < self.slow_rate:
+                return self.slow_ms / 1000
+            if self.kind == 'fixed':
+                ms = self.params[0]
+            elif self.kind == 'uniform':
+                ms = self._rng.uniform(self.params[0], self.params[1])
+            else:
+                median, sigma = self.params
+                ms = self._rng.lognormvariate(math.log(median), sigma)
+        return ms / 1000
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    total = 0
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, str):
+            total += len(content) // 4
+        elif isinstance(content, list):
+            for part in content:
+                if part.get('type') == 'text':
+                    total += len(part.get('text', '')) // 4
+                elif (part.get('image_url') or {}).get('detail') == 'low':
+                    total += 85
+                else:
+                    # What a ~1024px image costs at high detail (4 tiles)
+                    total += 765
+    return max(total, 1)
+
+
+def _has_image(messages: List[Dict[str, Any]]) -> bool:
+    for message in messages:
+        content = message.get('content')
+        if isinstance(content, list) and any(p.get('type') == 'image_url' for p in content):
+            return True
+    return False
+
+
+class FakeOpenAI:
+    """Canned chat completions with injected latency and failures."""
+
+    def __init__(self, latency: LatencyModel, error_rate: float = 0.0, function_call_rate: float = 0.5,
+                 menu_items: int = 40):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.function_call_rate = function_call_rate
+        self.canned_menu = synthetic_menu_json(menu_items, fenced=True)
+        self.stats = {"requests": 0, "errors": 0}
+        self._rng = random.Random(1)
+        self._lock = threading.Lock()
+
+    def _roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    @staticmethod
+    def _completion(message: Dict[str, Any], prompt_tokens: int, completion_tokens: int, model: str) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop", "logprobs": None}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def chat_completions(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        messages = body.get('messages', [])
+        model = body.get('model', 'gpt-4o-mini')
+        with self._lock:
+            self.stats["requests"] += 1
+
+        time.sleep(self.latency.sample())
+
+        if self.error_rate and self._roll() < self.error_rate:
+            with self._lock:
+                self.stats["errors"] += 1
+            status = 429 if self._roll() < 0.5 else 500
+            return status, {"error": {"message": "Injected failure", "type": "server_error"}}
+
+        prompt_tokens = _estimate_tokens(messages)
+        if _has_image(messages):
+            return 200, self._completion({"role": "assistant", "content": self.canned_menu},
+                                         prompt_tokens, len(self.canned_menu) // 4, model)
+
+        last_role = messages[-1].get('role') if messages else None
+        if body.get('functions') and last_role == 'user' and self._roll() < self.function_call_rate:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "function_call": {"name": "get_menu_items", "arguments": json.dumps({"search_query": "nasi"})},
+            }
+            return 200, self._completion(message, prompt_tokens, 20, model)
+
+        reply = "Terima kasih! Our Nasi Lemak is a customer favourite - would you like to try it?"
+        return 200, self._completion({"role": "assistant", "content": reply}, prompt_tokens, len(reply) // 4, model)
+
+
+def make_server(fake: FakeOpenAI, host: str = '127.0.0.1', port: int = 8089) -> ThreadingHTTPServer:
+    """HTTP/1.1 keep-alive server for `fake` (werkzeug's dev server closes every connection)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, payload: Dict[str, Any], include_usage: bool) -> None:
+            """Replay a completion as chat.completion.chunk SSE events (chunked encoding)."""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            def write_event(data: str) -> None:
+                body = f"data: {data}\n\n".encode()
+                self.wfile.write(f"{len(body):X}\r\n".encode() + body + b"\r\n")
+                self.wfile.flush()
+
+            content = payload["choices"][0]["message"].get("content") or ""
+            base = {"id": payload["id"], "object": "chat.completion.chunk",
+                    "created": payload["created"], "model": payload["model"]}
+            pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+            for n, piece in enumerate(pieces):
+                delta = {"role": "assistant", "content": piece} if n == 0 else {"content": piece}
+                write_event(json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+                time.sleep(STREAM_CHUNK_DELAY_S)
+            write_event(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+            if include_usage:
+                write_event(json.dumps({**base, "choices": [], "usage": payload["usage"]}))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length)
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                self._send_json(404, {"error": {"message": "Not implemented by fake server"}})
+                return
+            body = json.loads(raw or b'{}')
+            status, payload = fake.chat_completions(body)
+            if body.get('stream') and status == 200:
+                self._send_stream(payload, bool((body.get('stream_options') or {}).get('include_usage')))
+            else:
+                self._send_json(status, payload)
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                self._send_json(200, fake.stats)
+            else:
+                self._send_json(404, {"error": {"message": "Not implemented by fake server"}})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='lognormal:800,0.5')
+    parser.add_argument('--slow-rate', type=float, default=0.0)
+    parser.add_argument('--slow-ms', type=float, default=15000)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--function-call-rate', type=float, default=0.5)
+    parser.add_argument('--menu-items', type=int, default=40, help='items in the canned vision response')
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.latency, args.slow_rate, args.slow_ms)
+    fake = FakeOpenAI(latency, args.error_rate, args.function_call_rate, args.menu_items)
+    server = make_server(fake, args.host, args.port)
+    print(f"Fake OpenAI listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
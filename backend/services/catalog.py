@@ -0,0 +1,28 @@
+import json
+from typing import Any, Dict, Mapping
+
+# Catalog row helpers shared by the API routes.
+
+
+def serialize_item(item: Mapping[str, Any]) -> Dict[str, Any]:
+    """Convert a catalog_items row into the API item shape."""
+    return {
+        "id": item['id'],
+        "bbox": [item['bbox_x'], item['bbox_y'], item['bbox_w'], item['bbox_h']],
+        "name": item['name'],
+        "brand": item['brand'],
+        "variants": json.loads(item['variants_json']) if item['variants_json'] else None,
+        "price": {
+            "value": item['price_value'],
+            "currency": item['price_currency']
+        },
+        "size": {
+            "value": item['size_value'],
+            "unit": item['size_unit']
+        },
+        "barcode": item['barcode'],
+        "tags": json.loads(item['tags_json']) if item['tags_json'] else None,
+        "raw_text": item['raw_text'],
+        "confidence": item['confidence'],
+        "status": item['status']
+    }
@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+# Change feed for collaborative annotation. Triggers on catalog_items append
+# one row per insert/update/delete to catalog_changes, whose AUTOINCREMENT id
+# is a monotonic cursor. Updates carry only the fields that changed, in the
+# API item shape, so clients patch their copy instead of refetching the page.
+
+CHANGES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_id TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+        delta TEXT,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+    )
+'''
+
+CHANGES_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_catalog_changes_source ON catalog_changes (source_id, id)',
+    'CREATE INDEX IF NOT EXISTS idx_catalog_changes_page ON catalog_changes (source_id, page, id)',
+]
+
+# API field -> (SQL expression over a catalog_items row alias, columns it depends on)
+_FIELDS = [
+    ('bbox', "json_array({r}.bbox_x, {r}.bbox_y, {r}.bbox_w, {r}.bbox_h)",
+     ('bbox_x', 'bbox_y', 'bbox_w', 'bbox_h')),
+    ('name', "{r}.name", ('name',)),
+    ('brand', "{r}.brand", ('brand',)),
+    ('variants', "json({r}.variants_json)", ('variants_json',)),
+    ('price', "json_object('value', {r}.price_value, 'currency', {r}.price_currency)",
+     ('price_value', 'price_currency')),
+    ('size', "json_object('value', {r}.size_value, 'unit', {r}.size_unit)", ('size_value', 'size_unit')),
+    ('barcode', "{r}.barcode", ('barcode',)),
+    ('tags', "json({r}.tags_json)", ('tags_json',)),
+    ('raw_text', "{r}.raw_text", ('raw_text',)),
+    ('confidence', "{r}.confidence", ('confidence',)),
+    ('status', "{r}.status", ('status',)),
+]
+TRACKED_COLUMNS = [column for _, _, columns in _FIELDS for column in columns]
+
+
+def _full_delta(row: str) -> str:
+    return 'json_object(' + ', '.join(f"'{key}', {expr.format(r=row)}" for key, expr, _ in _FIELDS) + ')'
+
+
+def _changed_delta() -> str:
+    """The new row's fields with every unchanged one removed ('$._' is a no-op path)."""
+    removals = ', '.join(
+        "CASE WHEN " + ' AND '.join(f"old.{c} IS new.{c}" for c in columns) + f" THEN '$.{key}' ELSE '$._' END"
+        for key, _, columns in _FIELDS
+    )
+    return f"json_remove({_full_delta('new')}, {removals})"
+
+
+def _log_sql(row: str, op: str, delta: str) -> str:
+    return f'''
+        INSERT INTO catalog_changes (source_id, page, item_id, op, delta)
+        SELECT cp.source_id, cp.page, {row}.id, '{op}', {delta}
+        FROM catalog_pages cp WHERE cp.id = {row}.page_id;
+    '''
+
+
+CHANGES_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_changes_insert AFTER INSERT ON catalog_items BEGIN
+        {_log_sql('new', 'insert', _full_delta('new'))}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_changes_update
+    AFTER UPDATE OF {', '.join(TRACKED_COLUMNS)} ON catalog_items
+    WHEN {' OR '.join(f'old.{c} IS NOT new.{c}' for c in TRACKED_COLUMNS)}
+    BEGIN
+        {_log_sql('new', 'update', _changed_delta())}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_changes_delete AFTER DELETE ON catalog_items BEGIN
+        {_log_sql('old', 'delete', 'NULL')}
+    END
+    ''',
+]
+
+MAX_CHANGES = 500
+
+_changed = threading.Condition()
+
+
+def init_changes(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(CHANGES_TABLE_SQL)
+    for index_sql in CHANGES_INDEX_SQL:
+        cursor.execute(index_sql)
+    for trigger_sql in CHANGES_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+
+
+def notify_changes() -> None:
+    """Wake feed readers in this process after a committed catalog write."""
+    with _changed:
+        _changed.notify_all()
+
+
+def wait_for_changes(timeout: float) -> None:
+    """Sleep until notify_changes() or `timeout`; writes from other processes are picked up by polling."""
+    with _changed:
+        _changed.wait(timeout)
+
+
+def latest_change_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT MAX(id) FROM catalog_changes').fetchone()
+    return row[0] or 0
+
+
+def fetch_changes(conn: sqlite3.Connection, source_id: str, page: Optional[int] = None,
+                  since: int = 0, limit: int = MAX_CHANGES) -> List[Dict[str, Any]]:
+    """Changes after cursor `since` for a source (optionally one page), oldest first."""
+    if page is None:
+        rows = conn.execute('''
+            SELECT * FROM catalog_changes WHERE source_id = ? AND id > ? ORDER BY id LIMIT ?
+        ''', (source_id, since, limit)).fetchall()
+    else:
+        rows = conn.execute('''
+            SELECT * FROM catalog_changes WHERE source_id = ? AND page = ? AND id > ? ORDER BY id LIMIT ?
+        ''', (source_id, page, since, limit)).fetchall()
+    return [{
+        "id": row['id'],
+        "op": row['op'],
+        "item_id": row['item_id'],
+        "source_id": row['source_id'],
+        "page": row['page'],
+        "delta": json.loads(row['delta']) if row['delta'] else None,
+        "at": row['created_at'],
+    } for row in rows]
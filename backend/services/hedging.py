@@ -0,0 +1,258 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+from services.metrics import HEDGE_CALLS, HEDGE_DELAY_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Hedged OpenAI calls. A few upstream responses are far slower than the
+# rest and set the p99 of the vision and chat endpoints. With
+# OPENAI_HEDGING on, a call that has not returned after the
+# HEDGE_PERCENTILE latency of its recent calls is sent a second time. The
+# first good answer is used and the other is cancelled: an attempt that has
+# not been sent yet is dropped, and a stream is closed and recorded as call
+# 'hedge_loser' with an estimate of its prompt tokens. A plain request
+# already in flight cannot be aborted through the sync SDK. It finishes in
+# the background and its usage is recorded as call 'hedge_loser'. Hedges
+# draw on a token bucket that earns HEDGE_BUDGET of a request per call, so
+# duplicates stay near that share of traffic. Each kind of call keeps its
+# own latency window, and there is no hedging until it holds
+# HEDGE_MIN_SAMPLES calls.
+
+ENABLED = os.getenv('OPENAI_HEDGING', 'off').strip().lower() in ('1', 'true', 'yes', 'on')
+PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+MIN_DELAY_MS = float(os.getenv('HEDGE_MIN_DELAY_MS', '250'))
+MAX_DELAY_MS = float(os.getenv('HEDGE_MAX_DELAY_MS', '30000'))
+BUDGET = float(os.getenv('HEDGE_BUDGET', '0.1'))
+BURST = float(os.getenv('HEDGE_BURST', '5'))
+WINDOW = int(os.getenv('HEDGE_WINDOW', '200'))
+MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))
+MAX_THREADS = int(os.getenv('HEDGE_MAX_THREADS', '32'))
+
+
+class HedgeCancelled(RuntimeError):
+    """An attempt was cancelled before it was sent."""
+
+
+class LatencyWindow:
+    """Latencies of the last `size` calls of one kind."""
+
+    def __init__(self, size: int = WINDOW):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(pct / 100 * len(samples)))]
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+class HedgeBudget:
+    """Token bucket: every call earns `ratio` of a hedge, up to `burst` saved."""
+
+    def __init__(self, ratio: float = BUDGET, burst: float = BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class _Attempt:
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.elapsed = 0.0
+        self.future: Optional[Future] = None
+
+
+class Hedger:
+    """Runs calls with an adaptive hedge; see the module comment."""
+
+    def __init__(self, enabled: bool = ENABLED, percentile: float = PERCENTILE,
+                 min_delay_ms: float = MIN_DELAY_MS, max_delay_ms: float = MAX_DELAY_MS,
+                 budget: float = BUDGET, burst: float = BURST, window: int = WINDOW,
+                 min_samples: int = MIN_SAMPLES, max_threads: int = MAX_THREADS):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.window = window
+        self.min_samples = min_samples
+        self.budget = HedgeBudget(budget, burst)
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._lock = threading.Lock()
+        # Attempts take a slot for as long as they run, abandoned ones included;
+        # with every slot taken, calls go out unhedged on the caller's thread
+        self._slots = threading.BoundedSemaphore(max(1, max_threads))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_threads), thread_name_prefix='hedge')
+        self.calls_total = 0
+        self.hedged_total = 0
+        self.hedge_wins_total = 0
+        self.budget_exhausted_total = 0
+
+    def _window(self, key: str) -> LatencyWindow:
+        with self._lock:
+            if key not in self._windows:
+                self._windows[key] = LatencyWindow(self.window)
+            return self._windows[key]
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a `key` call, or None while its window is too small."""
+        window = self._window(key)
+        if len(window) < self.min_samples:
+            return None
+        delay = min(self.max_delay, max(self.min_delay, window.percentile(self.percentile)))
+        HEDGE_DELAY_SECONDS.labels(key).set(delay)
+        return delay
+
+    def _count(self, key: str, outcome: str) -> None:
+        HEDGE_CALLS.labels(key, outcome).inc()
+        with self._lock:
+            self.calls_total += 1
+            if outcome in ('primary_won', 'hedge_won', 'failed'):
+                self.hedged_total += 1
+            if outcome == 'hedge_won':
+                self.hedge_wins_total += 1
+            if outcome == 'budget_exhausted':
+                self.budget_exhausted_total += 1
+
+    def _run(self, key: str, fn: Callable[[], Any], attempt: _Attempt, context: contextvars.Context) -> Any:
+        try:
+            if attempt.cancelled.is_set():
+                raise HedgeCancelled("Attempt cancelled before it was sent")
+            started = time.perf_counter()
+            result = context.run(fn)
+            attempt.elapsed = time.perf_counter() - started
+            self._window(key).add(attempt.elapsed)
+            return result
+        finally:
+            self._slots.release()
+
+    def _submit(self, key: str, fn: Callable[[], Any]) -> _Attempt:
+        # The caller has taken a slot for this attempt
+        attempt = _Attempt()
+        attempt.future = self._executor.submit(self._run, key, fn, attempt, contextvars.copy_context())
+        return attempt
+
+    def _cancel(self, attempt: _Attempt, discard: Optional[Callable[[Any, float], None]]) -> None:
+        attempt.cancelled.set()
+        if discard is None:
+            return
+        context = contextvars.copy_context()
+
+        def on_done(future: Future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                return
+            try:
+                context.run(discard, future.result(), attempt.elapsed)
+            except Exception as e:
+                logger.warning(f"Discarding a hedged result failed: {e}")
+
+        attempt.future.add_done_callback(on_done)
+
+    def call(self, key: str, fn: Callable[[], Any], discard: Optional[Callable[[Any, float], None]] = None) -> Any:
+        """
+        `fn()`, duplicated if it is slower than the `key` threshold. `fn` must
+        be safe to run twice at once. `discard(result, seconds)` receives the
+        losing attempt's result if it completes (close streams, record usage).
+        """
+        if not self.enabled:
+            return fn()
+
+        self.budget.earn()
+        delay = self.delay(key)
+        if delay is None or not self._slots.acquire(blocking=False):
+            # Too little history to pick a threshold, or no free thread
+            started = time.perf_counter()
+            result = fn()
+            self._window(key).add(time.perf_counter() - started)
+            self._count(key, 'not_hedged')
+            return result
+
+        primary = self._submit(key, fn)
+        done, _ = wait([primary.future], timeout=delay)
+        if done:
+            self._count(key, 'not_hedged')
+            return primary.future.result()
+        if not self.budget.spend():
+            self._count(key, 'budget_exhausted')
+            return primary.future.result()
+        if not self._slots.acquire(blocking=False):
+            self.budget.earn()
+            self._count(key, 'not_hedged')
+            return primary.future.result()
+
+        hedge = self._submit(key, fn)
+        attempts = {primary.future: primary, hedge.future: hedge}
+        pending = set(attempts)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((attempts[f] for f in done if f.exception() is None), None)
+            if winner is not None:
+                loser = hedge if winner is primary else primary
+                self._cancel(loser, discard)
+                self._count(key, 'hedge_won' if winner is hedge else 'primary_won')
+                return winner.future.result()
+        # Both failed: report the original call's error
+        self._count(key, 'failed')
+        return primary.future.result()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            windows = dict(self._windows)
+            calls, hedged, wins = self.calls_total, self.hedged_total, self.hedge_wins_total
+            exhausted = self.budget_exhausted_total
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget.ratio,
+            "budget_tokens": round(self.budget.tokens, 3),
+            "calls_total": calls,
+            "hedged_total": hedged,
+            "hedge_rate": round(hedged / calls, 4) if calls else 0.0,
+            "hedge_wins_total": wins,
+            "win_rate": round(wins / hedged, 4) if hedged else 0.0,
+            "budget_exhausted_total": exhausted,
+            "calls": {
+                key: {"samples": len(window),
+                      "delay_ms": round(self.delay(key) * 1000, 1) if len(window) >= self.min_samples else None}
+                for key, window in windows.items()
+            },
+        }
+
+
+_hedger = Hedger()
+
+
+def get_hedger() -> Hedger:
+    return _hedger
+
+
+def hedged(key: str, fn: Callable[[], Any], discard: Optional[Callable[[Any, float], None]] = None) -> Any:
+    """Run an upstream call through the shared hedger (a plain call when hedging is off)."""
+    return _hedger.call(key, fn, discard)
@@ -0,0 +1,116 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from services.imaging import oriented_size, run_image_job
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed page image store. Originals live at
+# <root>/<aa>/<bb>/<sha256> and thumbnails at <root>/thumbs/<sha256>/<width>.jpg,
+# so identical uploads are stored once and every URL is immutable (safe to
+# cache forever). Thumbnails are rendered in the image worker pool
+# (services/imaging.py) when a page is ingested; the two threads here only
+# limit how many of its slots thumbnails take at once.
+
+STORE_DIR = os.path.abspath(os.getenv('IMAGE_STORE_DIR', 'page_images'))
+THUMBNAIL_WIDTHS = tuple(int(w) for w in os.getenv('THUMBNAIL_WIDTHS', '256,1024').split(','))
+THUMBNAIL_QUALITY = 80
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnails')
+_pending: Dict[Tuple[str, int], object] = {}
+_pending_lock = threading.Lock()
+
+
+def is_digest(value: str) -> bool:
+    return bool(_SHA256_RE.match(value))
+
+
+def blob_path(digest: str) -> str:
+    return os.path.join(STORE_DIR, digest[:2], digest[2:4], digest)
+
+
+def thumbnail_path(digest: str, width: int) -> str:
+    return os.path.join(STORE_DIR, 'thumbs', digest, f'{width}.jpg')
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """Write via a temp file + rename so readers never see a partial blob."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def put_image(data: bytes) -> Tuple[str, int, int]:
+    """Store image bytes (once per content) and return (sha256, width, height)."""
+    with Image.open(io.BytesIO(data)) as image:
+        width, height = oriented_size(image)
+    digest = hashlib.sha256(data).hexdigest()
+    path = blob_path(digest)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return digest, width, height
+
+
+def render_thumbnail(digest: str, width: int) -> str:
+    """Render (if missing) the thumbnail of `digest` at `width` px and return its path."""
+    path = thumbnail_path(digest, width)
+    if os.path.exists(path):
+        return path
+    with Image.open(blob_path(digest)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                 Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    _write_atomic(path, buffer.getvalue())
+    return path
+
+
+def _render_logged(digest: str, width: int) -> None:
+    try:
+        run_image_job(render_thumbnail, digest, width)
+    except Exception as e:
+        logger.error(f"Thumbnail {width}px for {digest} failed: {e}")
+    finally:
+        with _pending_lock:
+            _pending.pop((digest, width), None)
+
+
+def schedule_thumbnails(digest: str) -> None:
+    """Queue every configured thumbnail width for background rendering."""
+    for width in THUMBNAIL_WIDTHS:
+        if os.path.exists(thumbnail_path(digest, width)):
+            continue
+        with _pending_lock:
+            if (digest, width) in _pending:
+                continue
+            _pending[(digest, width)] = _executor.submit(_render_logged, digest, width)
+
+
+def get_thumbnail(digest: str, width: int) -> Optional[str]:
+    """Path of a ready thumbnail, rendering it now if the background job has not run yet."""
+    if width not in THUMBNAIL_WIDTHS or not os.path.exists(blob_path(digest)):
+        return None
+    path = thumbnail_path(digest, width)
+    if os.path.exists(path):
+        return path
+    return run_image_job(render_thumbnail, digest, width)
@@ -0,0 +1,269 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+from services.metrics import IMAGE_JOBS, IMAGE_POOL_QUEUED, IMAGE_QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# CPU-heavy Pillow work (decoding, thumbnailing, cropping and re-encoding
+# tiles) runs in a pool of worker processes so it does not hold the GIL
+# against request threads. Images are handed over as files in
+# IMAGE_HANDOFF_DIR (/dev/shm when available, so they never touch a disk)
+# and jobs only pickle paths and small results. At most IMAGE_QUEUE_MAX jobs
+# are queued or running per web worker; callers wait up to
+# IMAGE_QUEUE_TIMEOUT seconds for a slot and then get ImagePoolBusy, which
+# the app answers with 503 and Retry-After: IMAGE_RETRY_AFTER_SECONDS. The
+# pool is replaced after IMAGE_WORKER_MAX_TASKS jobs per process, so a leak
+# or fragmented heap in Pillow cannot grow forever. IMAGE_WORKERS=0 runs
+# jobs inline on the calling thread.
+
+WORKERS = int(os.getenv('IMAGE_WORKERS', str(min(4, os.cpu_count() or 1))))
+QUEUE_MAX = int(os.getenv('IMAGE_QUEUE_MAX', str(max(1, WORKERS) * 4)))
+QUEUE_TIMEOUT = float(os.getenv('IMAGE_QUEUE_TIMEOUT', '30'))
+RETRY_AFTER_SECONDS = int(os.getenv('IMAGE_RETRY_AFTER_SECONDS', '5'))
+WORKER_MAX_TASKS = int(os.getenv('IMAGE_WORKER_MAX_TASKS', '200'))
+HANDOFF_DIR = os.getenv('IMAGE_HANDOFF_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+ORIENTATION_TAG = 0x0112    # EXIF orientation; 5-8 swap width and height
+EDGE_STRENGTH = 48          # FIND_EDGES value counted as a strong edge
+
+
+class ImagePoolBusy(RuntimeError):
+    """Every image job slot stayed taken for the whole queue timeout."""
+
+
+def oriented_size(image: Image.Image) -> Tuple[int, int]:
+    """Upright (width, height) of an opened image, read from its header without decoding it."""
+    width, height = image.size
+    if image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def measure_page(path: str) -> Tuple[int, int, float]:
+    """
+    Upright size and edge density of the image at `path`. The density is the
+    share of strong edges in a 256px grayscale thumbnail; the image is shrunk
+    before it is rotated or converted, so only one full-size decode is held
+    (JPEGs are decoded at reduced scale to begin with).
+    """
+    with Image.open(path) as image:
+        width, height = oriented_size(image)
+        image.thumbnail((256, 256))
+        thumb = ImageOps.exif_transpose(image).convert('L')
+    histogram = thumb.filter(ImageFilter.FIND_EDGES).histogram()
+    return width, height, sum(histogram[EDGE_STRENGTH:]) / max(1, sum(histogram))
+
+
+def cut_tiles(path: str, fmt: str, boxes: Sequence[Tuple[int, int, int, int]], out_dir: str) -> List[str]:
+    """Crop (x, y, width, height) boxes out of the upright image at `path`, saving each as `fmt` in `out_dir`."""
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        paths = []
+        for index, (x, y, width, height) in enumerate(boxes):
+            tile_path = os.path.join(out_dir, f'tile-{index}')
+            image.crop((x, y, x + width, y + height)).save(
+                tile_path, format=fmt, **({'quality': 92} if fmt == 'JPEG' else {}))
+            paths.append(tile_path)
+    return paths
+
+
+def tile_signature(tile: Image.Image, cell: int) -> bytes:
+    """
+    Perceptual signature of a grayscale tile: the mean of every cell x cell
+    block, zlib-compressed (mostly blank paper compresses well). Re-encoding
+    barely moves a block mean; a changed digit moves the blocks it covers
+    by more than a JPEG does.
+    """
+    grid = (max(1, tile.width // cell), max(1, tile.height // cell))
+    return zlib.compress(tile.resize(grid, Image.Resampling.BOX).tobytes())
+
+
+def signature_changed(old: Optional[bytes], new: bytes, tolerance: int) -> bool:
+    """True unless every block of `new` is within `tolerance` grey levels of `old`."""
+    if old is None:
+        return True
+    old_blocks, new_blocks = zlib.decompress(old), zlib.decompress(new)
+    if len(old_blocks) != len(new_blocks):
+        return True
+    size = (len(new_blocks), 1)
+    difference = ImageChops.difference(Image.frombytes('L', size, old_blocks), Image.frombytes('L', size, new_blocks))
+    return difference.getextrema()[1] > tolerance
+
+
+def diff_tiles(path: str, fmt: str, boxes: Sequence[Tuple[int, int, int, int]],
+               previous: Sequence[Optional[bytes]], cell: int, tolerance: int,
+               out_dir: str) -> Tuple[List[bytes], List[Optional[str]]]:
+    """
+    Signatures of the (x, y, width, height) boxes of the upright image at
+    `path`, compared with `previous` (one entry per box, None for unknown).
+    Only tiles that changed are cropped and saved as `fmt` in `out_dir`.
+    Returns (signatures, tile paths with None for unchanged tiles).
+    """
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        gray = image.convert('L')
+        if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        signatures: List[bytes] = []
+        paths: List[Optional[str]] = []
+        for index, ((x, y, width, height), old) in enumerate(zip(boxes, previous)):
+            box = (x, y, x + width, y + height)
+            signature = tile_signature(gray.crop(box), cell)
+            signatures.append(signature)
+            if not signature_changed(old, signature, tolerance):
+                paths.append(None)
+                continue
+            tile_path = os.path.join(out_dir, f'tile-{index}')
+            image.crop(box).save(tile_path, format=fmt, **({'quality': 92} if fmt == 'JPEG' else {}))
+            paths.append(tile_path)
+    return signatures, paths
+
+
+@contextmanager
+def handoff(data: bytes) -> Iterator[str]:
+    """Path of a temporary file holding `data` for a pool job to read; removed on exit."""
+    fd, path = tempfile.mkstemp(dir=HANDOFF_DIR, prefix='canta-image-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+@contextmanager
+def handoff_dir() -> Iterator[str]:
+    """Temporary directory for files a pool job writes back; removed on exit."""
+    path = tempfile.mkdtemp(dir=HANDOFF_DIR, prefix='canta-image-')
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class ImagePool:
+    """Process pool for Pillow jobs with a bounded queue and periodic recycling."""
+
+    def __init__(self, workers: int = WORKERS, queue_max: int = QUEUE_MAX,
+                 queue_timeout: float = QUEUE_TIMEOUT, max_tasks: int = WORKER_MAX_TASKS):
+        self.workers = workers
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.max_tasks = max_tasks
+        self._slots = threading.BoundedSemaphore(max(1, queue_max))
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._submitted = 0
+        self.queued = 0
+        self.completed_total = 0
+        self.failed_total = 0
+        self.rejected_total = 0
+        self.recycled_total = 0
+
+    def _executor_for_job(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # Recycling swaps in a fresh pool; the old one finishes its
+            # running jobs and then its processes exit
+            if self._executor is not None and self.max_tasks and self._submitted >= self.max_tasks * self.workers:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+                self.recycled_total += 1
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._submitted = 0
+            self._submitted += 1
+            return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` in a worker process and return its result. `fn` must be a module-level function."""
+        name = fn.__name__
+        if self.workers <= 0:
+            return fn(*args)
+
+        waited = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self.rejected_total += 1
+            IMAGE_JOBS.labels(name, 'rejected').inc()
+            raise ImagePoolBusy(f"No image worker free after {self.queue_timeout:g}s")
+        IMAGE_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - waited)
+        with self._lock:
+            self.queued += 1
+            IMAGE_POOL_QUEUED.set(self.queued)
+        try:
+            executor = self._executor_for_job()
+            try:
+                result = executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start over with a new pool
+                logger.error("Image worker pool broke while running %s; restarting it", name)
+                self._discard(executor)
+                raise
+            with self._lock:
+                self.completed_total += 1
+            IMAGE_JOBS.labels(name, 'ok').inc()
+            return result
+        except Exception:
+            with self._lock:
+                self.failed_total += 1
+            IMAGE_JOBS.labels(name, 'error').inc()
+            raise
+        finally:
+            with self._lock:
+                self.queued -= 1
+                IMAGE_POOL_QUEUED.set(self.queued)
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_max": self.queue_max,
+                "queued": self.queued,
+                "completed_total": self.completed_total,
+                "failed_total": self.failed_total,
+                "rejected_total": self.rejected_total,
+                "recycled_total": self.recycled_total,
+            }
+
+
+_pool = ImagePool()
+atexit.register(_pool.shutdown)
+
+
+def get_image_pool() -> ImagePool:
+    return _pool
+
+
+def run_image_job(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a Pillow job on the shared image pool (inline when IMAGE_WORKERS=0)."""
+    return _pool.run(fn, *args)
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+# Content-addressed menu storage. Each distinct menu is stored once in
+# `menus`, keyed by the SHA-256 of its canonical JSON; active_menu rows only
+# reference it, so thousands of sessions on one restaurant's menu share a
+# single copy. In memory, MenuIndex objects (decoded menu plus lowercase
+# search keys) are shared the same way: every live session on a menu points
+# at one instance, and a byte-bounded LRU keeps recently used ones warm.
+
+MENUS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS menus (
+        sha256 TEXT PRIMARY KEY,
+        menu_data JSON NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+'''
+
+ACTIVE_MENU_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS active_menu (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT UNIQUE NOT NULL,
+        source_id TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        menu_sha256 TEXT NOT NULL REFERENCES menus (sha256),
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )
+'''
+
+ACTIVE_MENU_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_active_menu_sha256 ON active_menu (menu_sha256)'
+
+MAX_BYTES = int(os.getenv('MENU_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def canonical_menu(menu_data: Any) -> Tuple[str, str]:
+    """(sha256, canonical JSON text) of a menu; key order and whitespace do not matter."""
+    text = json.dumps(menu_data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest(), text
+
+
+def init_menus(cursor: sqlite3.Cursor) -> None:
+    """
+    Create the menus table and active_menu. A legacy active_menu holding a
+    full menu_data copy per session is rewritten to references (its
+    triggers go with it; init_session_cache recreates them).
+    """
+    cursor.execute(MENUS_TABLE_SQL)
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(active_menu)')]
+    if 'menu_data' in columns:
+        cursor.execute('ALTER TABLE active_menu RENAME TO active_menu_legacy')
+        cursor.execute(ACTIVE_MENU_TABLE_SQL)
+        for row in cursor.execute('''
+            SELECT id, session_id, source_id, page, menu_data, created_at, updated_at FROM active_menu_legacy
+        ''').fetchall():
+            digest, text = canonical_menu(json.loads(row[4]))
+            cursor.execute('''
+                INSERT OR IGNORE INTO menus (sha256, menu_data, size_bytes, created_at) VALUES (?, ?, ?, ?)
+            ''', (digest, text, len(text), row[5]))
+            cursor.execute('''
+                INSERT INTO active_menu (id, session_id, source_id, page, menu_sha256, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (row[0], row[1], row[2], row[3], digest, row[5], row[6]))
+        cursor.execute('DROP TABLE active_menu_legacy')
+    else:
+        cursor.execute(ACTIVE_MENU_TABLE_SQL)
+    cursor.execute(ACTIVE_MENU_INDEX_SQL)
+
+
+def put_menu(conn: sqlite3.Connection, menu_data: Any) -> Tuple[str, int]:
+    """Store a menu if it is new; returns (sha256, size of its canonical JSON). Caller commits."""
+    digest, text = canonical_menu(menu_data)
+    conn.execute('''
+        INSERT OR IGNORE INTO menus (sha256, menu_data, size_bytes, created_at) VALUES (?, ?, ?, ?)
+    ''', (digest, text, len(text), datetime.utcnow().isoformat()))
+    return digest, len(text)
+
+
+def delete_unused_menu(conn: sqlite3.Connection, digest: str) -> bool:
+    """Delete a stored menu if no active_menu row points at it any more. Caller commits."""
+    return conn.execute('''
+        DELETE FROM menus WHERE sha256 = ?
+        AND NOT EXISTS (SELECT 1 FROM active_menu am WHERE am.menu_sha256 = menus.sha256)
+    ''', (digest,)).rowcount > 0
+
+
+def _search_key(value: Any) -> str:
+    # Menus are user-supplied JSON; a numeric name or tag is still searchable text
+    return str(value).lower() if value is not None else ''
+
+
+def _tag_keys(tags: Any) -> List[str]:
+    if not isinstance(tags, list):
+        tags = [tags] if tags else []
+    return [_search_key(tag) for tag in tags if tag is not None]
+
+
+class MenuIndex:
+    """A decoded menu plus precomputed lowercase search keys for its items."""
+
+    def __init__(self, digest: str, data: Any, size: int):
+        self.digest = digest
+        self.data = data
+        self.size = size
+        items = data.get('items') if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            items = None
+        self._items = [
+            (item,
+             _search_key(item.get('name')),
+             _search_key(item.get('brand')),
+             _search_key(item.get('section')),
+             _tag_keys(item.get('tags')))
+            for item in items or [] if isinstance(item, dict)
+        ]
+        self.has_items = items is not None
+
+    def search(self, query: Optional[str] = None, category: Optional[str] = None) -> List[dict]:
+        """Items whose name, brand, section or a tag contains `query`, optionally within a section."""
+        query = query.lower() if query else None
+        category = category.lower() if category else None
+        return [
+            item for item, name, brand, section, tags in self._items
+            if (not query or query in name or query in brand or query in section
+                or any(query in tag for tag in tags))
+            and (not category or category in section)
+        ]
+
+    def find(self, name: str) -> Optional[dict]:
+        """First item whose name equals `name`, ignoring case."""
+        name = name.lower()
+        for item, item_name, _, _, _ in self._items:
+            if item_name == name:
+                return item
+        return None
+
+
+class MenuRegistry:
+    """
+    Process-wide MenuIndex objects by digest. Any instance still referenced
+    by a session is found through a weak map; the most recently used ones are
+    also held strongly, up to `max_bytes` of menu JSON.
+    """
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._live: 'weakref.WeakValueDictionary[str, MenuIndex]' = weakref.WeakValueDictionary()
+        self._recent: 'OrderedDict[str, MenuIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[MenuIndex]:
+        with self._lock:
+            menu = self._live.get(digest)
+            if menu is not None:
+                self._touch(menu)
+            return menu
+
+    def add(self, digest: str, data: Any, size: int) -> MenuIndex:
+        """The shared MenuIndex for `digest`, built from `data` only if none is live."""
+        with self._lock:
+            menu = self._live.get(digest)
+            if menu is None:
+                menu = MenuIndex(digest, data, size)
+                self._live[digest] = menu
+            self._touch(menu)
+            return menu
+
+    def _touch(self, menu: MenuIndex) -> None:
+        if menu.digest in self._recent:
+            self._recent.move_to_end(menu.digest)
+            return
+        self._recent[menu.digest] = menu
+        self.bytes += menu.size
+        while self.bytes > self.max_bytes and len(self._recent) > 1:
+            _, evicted = self._recent.popitem(last=False)
+            self.bytes -= evicted.size
+
+
+_registry = MenuRegistry()
+
+
+def get_menu_registry() -> MenuRegistry:
+    return _registry
+
+
+def load_menu(conn: sqlite3.Connection, digest: str) -> Optional[MenuIndex]:
+    """The shared MenuIndex for `digest`, reading and parsing the JSON only when no worker copy exists."""
+    menu = _registry.get(digest)
+    if menu is not None:
+        return menu
+    row = conn.execute('SELECT menu_data, size_bytes FROM menus WHERE sha256 = ?', (digest,)).fetchone()
+    if row is None:
+        return None
+    return _registry.add(digest, json.loads(row[0]), row[1])
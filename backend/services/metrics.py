@@ -0,0 +1,220 @@
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Any, Optional
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Prometheus metrics for the API. Every timing is labelled with the Flask
+# route template (e.g. "/api/item/<int:item_id>") so label cardinality stays
+# bounded; work done outside a request is labelled "offline".
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+
+REQUEST_SECONDS = Histogram(
+    'canta_request_seconds',
+    'HTTP request latency',
+    ['route', 'method'],
+    buckets=STAGE_BUCKETS,
+)
+REQUESTS_TOTAL = Counter(
+    'canta_requests_total',
+    'HTTP requests by status code',
+    ['route', 'method', 'status'],
+)
+STAGE_SECONDS = Histogram(
+    'canta_stage_seconds',
+    'Time spent in each processing stage',
+    ['route', 'stage'],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS_TOTAL = Counter(
+    'canta_stage_errors_total',
+    'Errors raised inside a processing stage',
+    ['route', 'stage'],
+)
+DB_QUERY_SECONDS = Histogram(
+    'canta_db_query_seconds',
+    'SQLite statement execution time',
+    ['route'],
+    buckets=STAGE_BUCKETS,
+)
+TOKENS_TOTAL = Counter(
+    'canta_openai_tokens_total',
+    'OpenAI tokens consumed',
+    ['model', 'call', 'kind'],
+)
+SESSION_CACHE_LOOKUPS = Counter(
+    'canta_session_cache_lookups_total',
+    'Chat session cache lookups by result (hit, miss, stale)',
+    ['result'],
+)
+SESSION_CACHE_BYTES = Gauge(
+    'canta_session_cache_bytes',
+    'Estimated size of the chat session cache in this worker',
+)
+RETENTION_SESSIONS = Counter(
+    'canta_retention_sessions_total',
+    'Expired chat sessions archived and deleted',
+)
+RETENTION_ROWS_DELETED = Counter(
+    'canta_retention_rows_deleted_total',
+    'Rows deleted by retention, by table',
+    ['table'],
+)
+RETENTION_PAGES_FREED = Counter(
+    'canta_retention_pages_freed_total',
+    'Database pages returned to the filesystem by incremental vacuum',
+)
+RETENTION_RUN_PROGRESS = Gauge(
+    'canta_retention_run_sessions',
+    'Sessions processed so far by the running (or last) retention pass',
+)
+RETENTION_LAST_RUN = Gauge(
+    'canta_retention_last_run_timestamp_seconds',
+    'Unix time the last retention pass finished',
+)
+IMAGE_JOBS = Counter(
+    'canta_image_jobs_total',
+    'Pillow jobs run on the image worker pool, by outcome (ok, error, rejected)',
+    ['job', 'outcome'],
+)
+IMAGE_POOL_QUEUED = Gauge(
+    'canta_image_pool_queued',
+    'Image jobs queued or running in this web worker',
+)
+IMAGE_QUEUE_WAIT_SECONDS = Histogram(
+    'canta_image_queue_wait_seconds',
+    'Time an image job waited for a free queue slot',
+    buckets=STAGE_BUCKETS,
+)
+HEDGE_CALLS = Counter(
+    'canta_hedge_calls_total',
+    'Hedgeable OpenAI calls by outcome (not_hedged, primary_won, hedge_won, failed, budget_exhausted)',
+    ['call', 'outcome'],
+)
+HEDGE_DELAY_SECONDS = Gauge(
+    'canta_hedge_delay_seconds',
+    'Current wait before a duplicate request is sent',
+    ['call'],
+)
+
+
+def current_route() -> str:
+    """Route template of the current request, or 'offline'."""
+    if has_request_context():
+        rule = request.url_rule
+        return rule.rule if rule is not None else 'unmatched'
+    return 'offline'
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of work as a named stage of the current route."""
+    route = current_route()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS_TOTAL.labels(route, name).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(route, name).observe(time.perf_counter() - start)
+
+
+def record_usage(model: str, usage: Any, call: str) -> None:
+    """Count prompt/completion tokens from an OpenAI `usage` object."""
+    if usage is None:
+        return
+    prompt = getattr(usage, 'prompt_tokens', None) or 0
+    completion = getattr(usage, 'completion_tokens', None) or 0
+    TOKENS_TOTAL.labels(model, call, 'prompt').inc(prompt)
+    TOKENS_TOTAL.labels(model, call, 'completion').inc(completion)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports statement execution time per route."""
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            DB_QUERY_SECONDS.labels(current_route()).observe(time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            DB_QUERY_SECONDS.labels(current_route()).observe(time.perf_counter() - start)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors are all TimedCursor instances."""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class _OpenAIPoolCollector:
+    """Exposes the shared OpenAI HTTP pool counters at scrape time."""
+
+    def collect(self):
+        from services.openai_client import get_pool_stats
+
+        stats = get_pool_stats()
+        if not stats:
+            return
+        yield GaugeMetricFamily('canta_openai_pool_in_flight', 'OpenAI requests in flight', value=stats['in_flight'])
+        yield GaugeMetricFamily('canta_openai_pool_max_connections', 'Configured pool size', value=stats['max_connections'])
+        yield GaugeMetricFamily('canta_openai_pool_saturation', 'In-flight requests / pool size', value=stats['saturation'])
+        yield CounterMetricFamily('canta_openai_pool_saturated', 'Requests issued while the pool was full', value=stats['saturated_total'])
+        yield CounterMetricFamily('canta_openai_pool_requests', 'Requests sent through the pool', value=stats['requests_total'])
+        yield CounterMetricFamily('canta_openai_pool_new_connections', 'Connections opened', value=stats['new_connections_total'])
+        yield CounterMetricFamily('canta_openai_pool_reused_connections', 'Requests served on a reused connection', value=stats['reused_connections_total'])
+
+
+_collector_registered = False
+
+
+def init_metrics(app, registry=REGISTRY) -> None:
+    """Install request timing hooks and the /metrics endpoint on `app`."""
+    global _collector_registered
+    if not _collector_registered:
+        registry.register(_OpenAIPoolCollector())
+        _collector_registered = True
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start: Optional[float] = g.pop('_metrics_start', None)
+        if start is not None:
+            route = current_route()
+            REQUEST_SECONDS.labels(route, request.method).observe(time.perf_counter() - start)
+            REQUESTS_TOTAL.labels(route, request.method, str(response.status_code)).inc()
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
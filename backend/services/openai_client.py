@@ -0,0 +1,196 @@
+import os
+import threading
+from typing import Optional, Dict, Any
+
+import httpx
+from openai import OpenAI
+
+# Shared OpenAI client used by both the chat path (app.py) and the vision
+# service (services/vision/gpt4o.py). Pool limits, keep-alive, HTTP/2 and
+# timeouts are read from the environment once when the client is built.
+
+_client: Optional[OpenAI] = None
+_http_client: Optional[httpx.Client] = None
+_client_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def load_pool_config() -> Dict[str, Any]:
+    """Read HTTP pool settings for OpenAI traffic from the environment."""
+    return {
+        "max_connections": _env_int("OPENAI_MAX_CONNECTIONS", 50),
+        "max_keepalive_connections": _env_int("OPENAI_MAX_KEEPALIVE", 20),
+        "keepalive_expiry": _env_float("OPENAI_KEEPALIVE_EXPIRY", 30.0),
+        "http2": _env_bool("OPENAI_HTTP2", True),
+        "connect_timeout": _env_float("OPENAI_CONNECT_TIMEOUT", 5.0),
+        "read_timeout": _env_float("OPENAI_READ_TIMEOUT", 120.0),
+        "write_timeout": _env_float("OPENAI_WRITE_TIMEOUT", 30.0),
+        "pool_timeout": _env_float("OPENAI_POOL_TIMEOUT", 10.0),
+    }
+
+
+class PoolStats:
+    """Thread-safe counters for pool saturation and connection reuse."""
+
+    def __init__(self, max_connections: int):
+        self._lock = threading.Lock()
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.new_connections_total = 0
+        self.saturated_total = 0
+        self.errors_total = 0
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.requests_total += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if self.in_flight > self.max_connections:
+                self.saturated_total += 1
+
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            # httpcore only opens TCP for requests that could not reuse a
+            # pooled connection, so counting connects gives us reuse for free.
+            if event_name == "connection.connect_tcp.complete":
+                with self._lock:
+                    self.new_connections_total += 1
+
+        request.extensions["trace"] = trace
+
+    def on_response(self, response: httpx.Response) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if response.status_code >= 500:
+                self.errors_total += 1
+
+    def on_transport_error(self) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self.errors_total += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests_total - self.new_connections_total)
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "saturation": round(self.in_flight / self.max_connections, 4) if self.max_connections else 0.0,
+                "saturated_total": self.saturated_total,
+                "requests_total": self.requests_total,
+                "new_connections_total": self.new_connections_total,
+                "reused_connections_total": reused,
+                "reuse_ratio": round(reused / self.requests_total, 4) if self.requests_total else 0.0,
+                "errors_total": self.errors_total,
+            }
+
+
+_pool_stats: Optional[PoolStats] = None
+
+
+class _InstrumentedTransport(httpx.HTTPTransport):
+    """HTTP transport that releases the in-flight slot on transport errors."""
+
+    def __init__(self, stats: PoolStats, **kwargs):
+        super().__init__(**kwargs)
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            return super().handle_request(request)
+        except httpx.TransportError:
+            self._stats.on_transport_error()
+            raise
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_http_client(config: Optional[Dict[str, Any]] = None) -> httpx.Client:
+    """Build the tuned httpx client that backs every OpenAI call."""
+    global _pool_stats
+    config = config or load_pool_config()
+
+    limits = httpx.Limits(
+        max_connections=config["max_connections"],
+        max_keepalive_connections=config["max_keepalive_connections"],
+        keepalive_expiry=config["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(
+        connect=config["connect_timeout"],
+        read=config["read_timeout"],
+        write=config["write_timeout"],
+        pool=config["pool_timeout"],
+    )
+    # HTTP/2 needs the optional h2 package; fall back to HTTP/1.1 without it
+    http2 = config["http2"] and _http2_available()
+
+    stats = PoolStats(config["max_connections"])
+    _pool_stats = stats
+
+    transport = _InstrumentedTransport(stats, limits=limits, http2=http2)
+    return httpx.Client(
+        transport=transport,
+        timeout=timeout,
+        follow_redirects=True,
+        event_hooks={"request": [stats.on_request], "response": [stats.on_response]},
+    )
+
+
+def get_openai_client() -> OpenAI:
+    """Get or initialize the shared OpenAI client."""
+    global _client, _http_client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.getenv('OPENAI_API_KEY')
+                if not api_key:
+                    raise RuntimeError("OPENAI_API_KEY not found in environment variables")
+                _http_client = build_http_client()
+                _client = OpenAI(
+                    api_key=api_key,
+                    http_client=_http_client,
+                    base_url=os.getenv('OPENAI_BASE_URL') or None,
+                    max_retries=_env_int("OPENAI_MAX_RETRIES", 2),
+                )
+    return _client
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Return pool saturation and connection reuse counters."""
+    if _pool_stats is None:
+        return {}
+    stats = _pool_stats.snapshot()
+    stats["http2"] = bool(
+        _http_client is not None
+        and getattr(_http_client._transport, "_pool", None) is not None
+        and getattr(_http_client._transport._pool, "_http2", False)
+    )
+    return stats
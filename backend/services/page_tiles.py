@@ -0,0 +1,219 @@
+import json
+import re
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+# Tile signatures for incremental re-extraction. A page extracted through
+# POST /api/catalog/<source_id>/page/<page>/extract keeps one perceptual
+# signature per tile of its grid. When the page is uploaded again, only the
+# tiles whose signature moved are sent to the vision model, and only the
+# items in those tiles are touched. Every point of the page is owned by the
+# tile it sits deepest inside, so an item in the overlap of a changed and
+# an unchanged tile belongs to exactly one of them.
+#
+# Merging into a refreshed region:
+# - A stored AI item is matched to a new item by name and box. It takes the
+#   new values, and it is deleted if the tile no longer shows it.
+# - Items a person edited or verified are never overwritten. If the new
+#   reading disagrees, or the item is gone, the item goes back to the review
+#   queue as 'edited' and is listed under needs_review.
+# - New items with no match are inserted as 'ai'.
+
+PAGE_TILES_SQL = '''
+    CREATE TABLE IF NOT EXISTS page_tiles (
+        page_id INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        signature BLOB NOT NULL,
+        image_sha256 TEXT,
+        extracted_at TEXT NOT NULL,
+        PRIMARY KEY (page_id, x, y, width, height)
+    )
+'''
+
+Box = Tuple[int, int, int, int]
+
+MATCH_OVERLAP = 0.3
+_NAME_SPACE_RE = re.compile(r'\s+')
+
+
+class TilesChanged(RuntimeError):
+    """The page's tiles were re-extracted by another request in the meantime."""
+
+
+def init_page_tiles(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(PAGE_TILES_SQL)
+
+
+def load_signatures(conn: sqlite3.Connection, page_id: Optional[int]) -> Dict[Box, bytes]:
+    """Stored signature of each tile box of a page."""
+    if page_id is None:
+        return {}
+    rows = conn.execute('SELECT x, y, width, height, signature FROM page_tiles WHERE page_id = ?', (page_id,))
+    return {(row['x'], row['y'], row['width'], row['height']): bytes(row['signature']) for row in rows}
+
+
+def owner(boxes: Sequence[Box], x: float, y: float) -> int:
+    """Index of the box that (x, y) lies deepest inside (distance to its nearest edge)."""
+    def depth(box: Box) -> float:
+        bx, by, bw, bh = box
+        return min(x - bx, bx + bw - x, y - by, by + bh - y)
+
+    return max(range(len(boxes)), key=lambda i: depth(boxes[i]))
+
+
+def _center(bbox: Sequence[float]) -> Tuple[float, float]:
+    return bbox[0] + bbox[2] / 2, bbox[1] + bbox[3] / 2
+
+
+def _row_bbox(row: sqlite3.Row) -> List[int]:
+    return [row['bbox_x'], row['bbox_y'], row['bbox_w'], row['bbox_h']]
+
+
+def _name_key(name: Optional[str]) -> str:
+    return _NAME_SPACE_RE.sub(' ', (name or '')).strip().casefold()
+
+
+def _overlap_ratio(a: Sequence[float], b: Sequence[float]) -> float:
+    """Intersection area over the smaller box."""
+    ix = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    iy = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    return (ix * iy) / max(1, min(a[2] * a[3], b[2] * b[3]))
+
+
+def _same_reading(row: sqlite3.Row, item: Dict[str, Any]) -> bool:
+    return (_name_key(row['name']) == _name_key(item['name'])
+            and row['price_value'] == item['price_value']
+            and row['size_value'] == item['size_value']
+            and (row['size_unit'] or None) == (item['size_unit'] or None))
+
+
+def _match(item: Dict[str, Any], candidates: List[sqlite3.Row]) -> Optional[sqlite3.Row]:
+    key = _name_key(item['name'])
+    best, best_overlap = None, MATCH_OVERLAP
+    for row in candidates:
+        if _name_key(row['name']) != key:
+            continue
+        overlap = _overlap_ratio(_row_bbox(row), item['bbox'])
+        if overlap >= best_overlap:
+            best, best_overlap = row, overlap
+    return best
+
+
+def _insert(conn: sqlite3.Connection, page_id: int, item: Dict[str, Any]) -> None:
+    conn.execute('''
+        INSERT INTO catalog_items (
+            page_id, bbox_x, bbox_y, bbox_w, bbox_h, name, price_value, price_currency,
+            size_value, size_unit, tags_json, raw_text, confidence, status
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'ai')
+    ''', (page_id, *item['bbox'], item['name'], item['price_value'], item['price_currency'],
+          item['size_value'], item['size_unit'], json.dumps(item['tags']) if item['tags'] else None,
+          item['raw_text'], item['confidence']))
+
+
+def _update(conn: sqlite3.Connection, item_id: int, item: Dict[str, Any]) -> None:
+    conn.execute('''
+        UPDATE catalog_items SET
+            bbox_x = ?, bbox_y = ?, bbox_w = ?, bbox_h = ?, name = ?, price_value = ?, price_currency = ?,
+            size_value = ?, size_unit = ?, tags_json = ?, raw_text = ?, confidence = ?
+        WHERE id = ?
+    ''', (*item['bbox'], item['name'], item['price_value'], item['price_currency'], item['size_value'],
+          item['size_unit'], json.dumps(item['tags']) if item['tags'] else None, item['raw_text'],
+          item['confidence'], item_id))
+
+
+def merge_tile_items(conn: sqlite3.Connection, page_id: int, boxes: Sequence[Box], refreshed: Set[int],
+                     items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Merge the items read from the `refreshed` tiles into the page's stored
+    items (see the module comment). Runs inside the caller's transaction.
+    """
+    summary: Dict[str, Any] = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0,
+                               "outside_refreshed_tiles": 0, "needs_review": []}
+
+    def refreshed_at(bbox: Sequence[float]) -> bool:
+        return owner(boxes, *_center(bbox)) in refreshed
+
+    rows = conn.execute('SELECT * FROM catalog_items WHERE page_id = ? ORDER BY id', (page_id,)).fetchall()
+    stale = [row for row in rows if refreshed_at(_row_bbox(row))]
+    review: List[int] = []
+
+    for item in items:
+        if not refreshed_at(item['bbox']):
+            # Seen in a tile's margin, but the tile owning it did not change
+            summary['outside_refreshed_tiles'] += 1
+            continue
+        row = _match(item, stale)
+        if row is None:
+            _insert(conn, page_id, item)
+            summary['inserted'] += 1
+            continue
+        stale.remove(row)
+        if _same_reading(row, item):
+            summary['unchanged'] += 1
+        elif row['status'] == 'ai':
+            _update(conn, row['id'], item)
+            summary['updated'] += 1
+        else:
+            review.append(row['id'])
+
+    for row in stale:
+        if row['status'] == 'ai':
+            conn.execute('DELETE FROM review_leases WHERE item_id = ?', (row['id'],))
+            conn.execute('DELETE FROM catalog_items WHERE id = ?', (row['id'],))
+            summary['deleted'] += 1
+        else:
+            review.append(row['id'])
+
+    conn.executemany("UPDATE catalog_items SET status = 'edited' WHERE id = ? AND status = 'verified'",
+                     [(item_id,) for item_id in review])
+    summary['needs_review'] = sorted(review)
+    return summary
+
+
+def save_signatures(conn: sqlite3.Connection, page_id: int, boxes: Sequence[Box], signatures: Sequence[bytes],
+                    refreshed: Set[int], failed: Set[int], digest: str) -> None:
+    """
+    Store the signatures of the refreshed tiles. Unchanged tiles keep the
+    signature they were extracted with, so small drifts cannot add up over
+    many uploads. Failed tiles and boxes of an older grid are dropped, so
+    the next upload extracts them again.
+    """
+    keep = {box for index, box in enumerate(boxes) if index not in failed}
+    conn.executemany('DELETE FROM page_tiles WHERE page_id = ? AND x = ? AND y = ? AND width = ? AND height = ?',
+                     [(page_id, *box) for box in load_signatures(conn, page_id) if box not in keep])
+    now = datetime.utcnow().isoformat()
+    conn.executemany('''
+        INSERT INTO page_tiles (page_id, x, y, width, height, signature, image_sha256, extracted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (page_id, x, y, width, height) DO UPDATE SET
+            signature = excluded.signature,
+            image_sha256 = excluded.image_sha256,
+            extracted_at = excluded.extracted_at
+    ''', [(page_id, *boxes[index], signatures[index], digest, now) for index in sorted(refreshed)])
+
+
+def apply_tile_extraction(conn: sqlite3.Connection, page_id: int, expected: Dict[Box, bytes], boxes: Sequence[Box],
+                          signatures: Sequence[bytes], refreshed: Set[int], failed: Set[int],
+                          items: List[Dict[str, Any]], digest: str) -> Dict[str, Any]:
+    """
+    Merge the refreshed tiles' items and store their signatures in one
+    IMMEDIATE transaction. Raises TilesChanged if the stored signatures are
+    no longer the `expected` ones the page was diffed against.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if load_signatures(conn, page_id) != expected:
+            raise TilesChanged("Page was re-extracted by another request")
+        summary = merge_tile_items(conn, page_id, boxes, refreshed, items)
+        save_signatures(conn, page_id, boxes, signatures, refreshed, failed, digest)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return summary
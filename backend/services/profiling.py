@@ -0,0 +1,97 @@
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import time
+import uuid
+from typing import Optional
+
+from flask import abort, g, request, send_from_directory
+
+logger = logging.getLogger(__name__)
+
+# Opt-in per-request profiling. When PROFILE_ADMIN_TOKEN is unset no hooks are
+# installed at all, so production traffic pays nothing. When it is set, a
+# request carrying `X-Profile: 1` (or `?__profile=1`) and a matching
+# `X-Profile-Token` header runs under cProfile; the pstats artifact is written
+# to PROFILE_DIR and the top frames are summarized in `X-Profile-Top`.
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_FLAG = '__profile'
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'
+TOP_FRAMES = 8
+
+
+def _requested() -> bool:
+    return request.headers.get(PROFILE_HEADER) == '1' or request.args.get(PROFILE_QUERY_FLAG) == '1'
+
+
+def _authorized(admin_token: str) -> bool:
+    supplied = request.headers.get(PROFILE_TOKEN_HEADER, '')
+    return hmac.compare_digest(supplied.encode(), admin_token.encode())
+
+
+def summarize_top_frames(profiler: cProfile.Profile, limit: int = TOP_FRAMES) -> str:
+    """Compact 'func (file:line) cum_ms' summary of the hottest frames."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    frames = []
+    for func in stats.fcn_list[:limit]:
+        filename, line, name = func
+        _, _, _, cumtime, _ = stats.stats[func]
+        frames.append(f"{name} ({os.path.basename(filename)}:{line}) {cumtime * 1000:.1f}ms")
+    return '; '.join(frames)
+
+
+def init_profiler(app, admin_token: Optional[str] = None, profile_dir: Optional[str] = None) -> None:
+    """Install the profiling hooks on `app` if an admin token is configured."""
+    admin_token = admin_token or os.getenv('PROFILE_ADMIN_TOKEN')
+    if not admin_token:
+        return
+    profile_dir = os.path.abspath(profile_dir or os.getenv('PROFILE_DIR', 'profiles'))
+    os.makedirs(profile_dir, exist_ok=True)
+
+    @app.before_request
+    def _start_profile():
+        if not _requested():
+            return
+        if not _authorized(admin_token):
+            logger.warning("Rejected profiling request with missing or invalid token")
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return
+        g._profiler = profiler
+        g._profile_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop('_profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.pop('_profile_start')) * 1000
+
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-') or 'root'
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{slug}-{uuid.uuid4().hex[:8]}.pstats"
+        profiler.dump_stats(os.path.join(profile_dir, name))
+
+        response.headers['X-Profile-Artifact'] = name
+        response.headers['X-Profile-Elapsed-Ms'] = f"{elapsed_ms:.1f}"
+        response.headers['X-Profile-Top'] = summarize_top_frames(profiler)
+        logger.info(f"Profiled {request.method} {route} in {elapsed_ms:.1f}ms -> {name}")
+        return response
+
+    @app.route('/api/admin/profiles/<name>', methods=['GET'])
+    def download_profile(name):
+        """Download a pstats artifact (view with `snakeviz` or `python -m pstats`)"""
+        if not _authorized(admin_token):
+            abort(403)
+        return send_from_directory(profile_dir, name, as_attachment=True)
@@ -0,0 +1,341 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.metrics import (
+    RETENTION_LAST_RUN,
+    RETENTION_PAGES_FREED,
+    RETENTION_ROWS_DELETED,
+    RETENTION_RUN_PROGRESS,
+    RETENTION_SESSIONS,
+)
+from services.session_cache import get_session_cache, raise_version_floor
+
+logger = logging.getLogger(__name__)
+
+# Retention for chat data. A background pass finds conversations with no
+# message or menu activity for CHAT_RETENTION_DAYS, writes them (messages,
+# active_menu reference and the menus they point at) to gzip NDJSON files in
+# CHAT_ARCHIVE_DIR, then deletes them in small IMMEDIATE transactions so the
+# write lock is held for milliseconds at a time. Menus no session references
+# any more are dropped with them. Freed pages are handed back with
+# `PRAGMA incremental_vacuum` in small steps. Progress is recorded in
+# retention_runs and exported as Prometheus metrics. Retention is off unless
+# CHAT_RETENTION_DAYS is set.
+
+RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '0'))
+ARCHIVE_DIR = os.path.abspath(os.getenv('CHAT_ARCHIVE_DIR', 'chat_archives'))
+BATCH_SESSIONS = int(os.getenv('RETENTION_BATCH_SESSIONS', '100'))
+INTERVAL_SECONDS = float(os.getenv('RETENTION_INTERVAL_SECONDS', '3600'))
+VACUUM_STEP_PAGES = int(os.getenv('RETENTION_VACUUM_STEP_PAGES', '256'))
+# Pause between batches so chat writes get the lock in between
+BATCH_PAUSE_SECONDS = 0.05
+# A 'running' row older than this is treated as a crashed pass
+STALE_RUN_SECONDS = 600
+
+RETENTION_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, created_at)',
+]
+
+RUNS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS retention_runs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL CHECK (status IN ('running', 'done', 'failed')),
+        cutoff TEXT NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        messages INTEGER NOT NULL DEFAULT 0,
+        menus INTEGER NOT NULL DEFAULT 0,
+        archives INTEGER NOT NULL DEFAULT 0,
+        pages_freed INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        started_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        finished_at TEXT
+    )
+'''
+
+_EXPIRED_SQL = '''
+    SELECT c.id, c.session_id FROM conversations c
+    WHERE {scope} AND c.created_at < :cutoff
+      AND NOT EXISTS (SELECT 1 FROM messages m
+                      WHERE m.session_id = c.session_id AND m.created_at >= :cutoff)
+      AND NOT EXISTS (SELECT 1 FROM active_menu am
+                      WHERE am.session_id = c.session_id AND am.updated_at >= :cutoff)
+'''
+
+
+def init_retention(cursor: sqlite3.Cursor) -> None:
+    for index_sql in RETENTION_INDEX_SQL:
+        cursor.execute(index_sql)
+    cursor.execute(RUNS_TABLE_SQL)
+
+
+def find_expired(conn: sqlite3.Connection, cutoff: str, after_id: int, limit: int) -> List[Tuple[int, str]]:
+    """Up to `limit` inactive conversations with id > `after_id`, in id order."""
+    rows = conn.execute(_EXPIRED_SQL.format(scope='c.id > :after') + ' ORDER BY c.id LIMIT :limit',
+                        {'cutoff': cutoff, 'after': after_id, 'limit': limit}).fetchall()
+    return [(row[0], row[1]) for row in rows]
+
+
+def _placeholders(values) -> str:
+    return ', '.join('?' for _ in values)
+
+
+def archive_sessions(conn: sqlite3.Connection, session_ids: List[str], path: str) -> None:
+    """
+    Write one `session` line per conversation (with its messages and menu
+    reference) and one `menu` line per referenced menu to a gzip NDJSON file.
+    The file is fsynced and renamed into place before anything is deleted.
+    """
+    marks = _placeholders(session_ids)
+    conversations = conn.execute(f'''
+        SELECT session_id, user_id, created_at FROM conversations WHERE session_id IN ({marks})
+    ''', session_ids).fetchall()
+    messages: Dict[str, List[Dict[str, Any]]] = {}
+    for session_id, role, content, created_at in conn.execute(f'''
+        SELECT session_id, role, content, created_at FROM messages
+        WHERE session_id IN ({marks}) ORDER BY session_id, created_at
+    ''', session_ids):
+        messages.setdefault(session_id, []).append({"role": role, "content": content, "created_at": created_at})
+    menus = {row[0]: row[1:] for row in conn.execute(f'''
+        SELECT session_id, source_id, page, menu_sha256, updated_at FROM active_menu WHERE session_id IN ({marks})
+    ''', session_ids)}
+    digests = sorted({menu[2] for menu in menus.values()})
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            for session_id, user_id, created_at in conversations:
+                menu = menus.get(session_id)
+                record = {
+                    "type": "session",
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "created_at": created_at,
+                    "messages": messages.get(session_id, []),
+                    "active_menu": {"source_id": menu[0], "page": menu[1], "menu_sha256": menu[2],
+                                    "updated_at": menu[3]} if menu else None,
+                }
+                out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+            if digests:
+                for sha256, menu_data in conn.execute(f'''
+                    SELECT sha256, menu_data FROM menus WHERE sha256 IN ({_placeholders(digests)})
+                ''', digests):
+                    record = {"type": "menu", "sha256": sha256, "menu_data": json.loads(menu_data)}
+                    out.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+
+def delete_sessions(conn: sqlite3.Connection, sessions: List[Tuple[int, str]], cutoff: str) -> Dict[str, int]:
+    """
+    Delete archived conversations in one short IMMEDIATE transaction.
+    Expiry is re-checked under the write lock, so a session that received a
+    message after it was archived is kept. The session version floor is
+    raised first, so a recreated session never reuses a cached version.
+    """
+    ids = [conversation_id for conversation_id, _ in sessions]
+    still_expired: List[str] = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        still_expired = [row[1] for row in conn.execute(
+            _EXPIRED_SQL.format(scope=f'c.id IN ({", ".join(str(int(i)) for i in ids)})'), {'cutoff': cutoff})]
+        counts = {"sessions": 0, "messages": 0, "menus": 0}
+        if still_expired:
+            marks = _placeholders(still_expired)
+            digests = [row[0] for row in conn.execute(f'''
+                SELECT DISTINCT menu_sha256 FROM active_menu WHERE session_id IN ({marks})
+            ''', still_expired)]
+            # active_menu first: its delete trigger bumps conversations.version
+            conn.execute(f'DELETE FROM active_menu WHERE session_id IN ({marks})', still_expired)
+            counts["messages"] = conn.execute(f'DELETE FROM messages WHERE session_id IN ({marks})',
+                                              still_expired).rowcount
+            raise_version_floor(conn, still_expired)
+            counts["sessions"] = conn.execute(f'DELETE FROM conversations WHERE session_id IN ({marks})',
+                                              still_expired).rowcount
+            if digests:
+                counts["menus"] = conn.execute(f'''
+                    DELETE FROM menus WHERE sha256 IN ({_placeholders(digests)})
+                    AND NOT EXISTS (SELECT 1 FROM active_menu am WHERE am.menu_sha256 = menus.sha256)
+                ''', digests).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    # Other workers see the raised floor; this one can drop its entries now
+    cache = get_session_cache()
+    for session_id in still_expired:
+        cache.invalidate(session_id)
+    return counts
+
+
+def incremental_vacuum(conn: sqlite3.Connection, step_pages: int = VACUUM_STEP_PAGES,
+                       max_steps: int = 1000) -> int:
+    """Return free pages to the filesystem `step_pages` at a time; 0 unless auto_vacuum is INCREMENTAL."""
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    freed = 0
+    for _ in range(max_steps):
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            break
+        # execute() steps the pragma once (one page); executescript() runs it to completion
+        conn.executescript(f'PRAGMA incremental_vacuum({min(step_pages, free)})')
+        step = free - conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if step <= 0:
+            break
+        freed += step
+        RETENTION_PAGES_FREED.inc(step)
+        time.sleep(BATCH_PAUSE_SECONDS)
+    return freed
+
+
+def _start_run(conn: sqlite3.Connection, cutoff: str) -> Optional[str]:
+    """Record a new run, unless another worker's run is still alive."""
+    now = datetime.utcnow()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        busy = conn.execute('''
+            SELECT 1 FROM retention_runs WHERE status = 'running' AND updated_at > ?
+        ''', ((now - timedelta(seconds=STALE_RUN_SECONDS)).isoformat(),)).fetchone()
+        if busy:
+            conn.rollback()
+            return None
+        conn.execute("UPDATE retention_runs SET status = 'failed', error = 'abandoned' WHERE status = 'running'")
+        run_id = uuid.uuid4().hex
+        conn.execute('''
+            INSERT INTO retention_runs (id, status, cutoff, started_at, updated_at) VALUES (?, 'running', ?, ?, ?)
+        ''', (run_id, cutoff, now.isoformat(), now.isoformat()))
+        conn.commit()
+        return run_id
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _update_run(conn: sqlite3.Connection, run_id: str, totals: Dict[str, int], status: str = 'running',
+                error: Optional[str] = None) -> None:
+    now = datetime.utcnow().isoformat()
+    conn.execute('''
+        UPDATE retention_runs SET status = ?, sessions = ?, messages = ?, menus = ?, archives = ?,
+            pages_freed = ?, error = ?, updated_at = ?, finished_at = ?
+        WHERE id = ?
+    ''', (status, totals['sessions'], totals['messages'], totals['menus'], totals['archives'],
+          totals['pages_freed'], error, now, None if status == 'running' else now, run_id))
+    conn.commit()
+
+
+def run_retention(db_path: str, days: int = RETENTION_DAYS, archive_dir: str = ARCHIVE_DIR,
+                  batch_sessions: int = BATCH_SESSIONS, vacuum: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    One retention pass: archive and delete every conversation inactive for
+    `days`, batch by batch, then incrementally vacuum. Returns the run's
+    totals, or None if another worker is already running one.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        run_id = _start_run(conn, cutoff)
+        if run_id is None:
+            return None
+        os.makedirs(archive_dir, exist_ok=True)
+        totals = {"sessions": 0, "messages": 0, "menus": 0, "archives": 0, "pages_freed": 0}
+        RETENTION_RUN_PROGRESS.set(0)
+        try:
+            after_id = 0
+            while True:
+                sessions = find_expired(conn, cutoff, after_id, batch_sessions)
+                if not sessions:
+                    break
+                after_id = sessions[-1][0]
+                path = os.path.join(archive_dir, f"chat-{run_id[:12]}-{totals['archives']:05d}.ndjson.gz")
+                archive_sessions(conn, [session_id for _, session_id in sessions], path)
+                counts = delete_sessions(conn, sessions, cutoff)
+                totals["archives"] += 1
+                for key in ("sessions", "messages", "menus"):
+                    totals[key] += counts[key]
+                RETENTION_SESSIONS.inc(counts["sessions"])
+                RETENTION_ROWS_DELETED.labels('conversations').inc(counts["sessions"])
+                RETENTION_ROWS_DELETED.labels('messages').inc(counts["messages"])
+                RETENTION_ROWS_DELETED.labels('menus').inc(counts["menus"])
+                RETENTION_RUN_PROGRESS.set(totals["sessions"])
+                _update_run(conn, run_id, totals)
+                time.sleep(BATCH_PAUSE_SECONDS)
+            if vacuum:
+                totals["pages_freed"] = incremental_vacuum(conn)
+            _update_run(conn, run_id, totals, status='done')
+        except Exception as e:
+            conn.rollback()
+            _update_run(conn, run_id, totals, status='failed', error=str(e))
+            raise
+        RETENTION_LAST_RUN.set(time.time())
+        logger.info(f"Retention pass {run_id}: {totals}")
+        return {"id": run_id, "cutoff": cutoff, **totals}
+    finally:
+        conn.close()
+
+
+def recent_runs(conn: sqlite3.Connection, limit: int = 10) -> List[Dict[str, Any]]:
+    cursor = conn.execute('SELECT * FROM retention_runs ORDER BY started_at DESC LIMIT ?', (limit,))
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+class RetentionWorker:
+    """Daemon thread running a retention pass every `interval` seconds."""
+
+    def __init__(self, db_path: str, days: int, interval: float = INTERVAL_SECONDS):
+        self.db_path = db_path
+        self.days = days
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                run_retention(self.db_path, self.days)
+            except Exception as e:
+                logger.error(f"Retention pass failed: {e}")
+
+
+_worker: Optional[RetentionWorker] = None
+
+
+def configure_retention(db_path: str, days: int = RETENTION_DAYS) -> None:
+    """Start the background retention worker for `db_path` if retention is enabled."""
+    global _worker
+    if _worker is None and days > 0:
+        _worker = RetentionWorker(db_path, days)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Archive and delete inactive chat sessions.")
+    parser.add_argument('--db', default='catalog.db')
+    parser.add_argument('--days', type=int, default=RETENTION_DAYS or 30)
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='switch an existing database to auto_vacuum=INCREMENTAL (runs a full VACUUM once)')
+    args = parser.parse_args()
+
+    if args.enable_incremental_vacuum:
+        conn = sqlite3.connect(args.db)
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        conn.close()
+    result = run_retention(args.db, args.days, args.archive_dir)
+    print(json.dumps(result, indent=2) if result else "Another retention pass is running")
+
+
+if __name__ == '__main__':
+    main()
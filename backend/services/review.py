@@ -0,0 +1,214 @@
+import sqlite3
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from services.catalog import serialize_item
+
+if TYPE_CHECKING:
+    from services.storage import StorageRouter
+
+# Global review queue: unverified items across every source, worst confidence
+# first. Pages are walked with a (confidence, id) keyset cursor over
+# idx_catalog_items_review, never with OFFSET. Annotators claim batches; a
+# claim writes short-lived rows to review_leases inside one IMMEDIATE
+# transaction, so parallel reviewers never receive the same item and an
+# abandoned claim simply expires.
+
+REVIEW_INDEX_SQL = '''
+    CREATE INDEX IF NOT EXISTS idx_catalog_items_review ON catalog_items (status, confidence, id)
+'''
+
+LEASES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS review_leases (
+        item_id INTEGER PRIMARY KEY,
+        reviewer TEXT NOT NULL,
+        expires_at TEXT NOT NULL
+    )
+'''
+
+QUEUE_STATUSES = ('ai', 'edited')
+DEFAULT_LEASE_SECONDS = 600
+MAX_BATCH = 100
+
+
+def init_review(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(REVIEW_INDEX_SQL)
+    cursor.execute(LEASES_TABLE_SQL)
+
+
+def encode_cursor(confidence: float, item_id: int) -> str:
+    return f"{confidence!r}:{item_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """Parse a queue cursor; raises ValueError on malformed input."""
+    if not cursor:
+        return None
+    confidence, _, item_id = cursor.rpartition(':')
+    return float(confidence), int(item_id)
+
+
+def _select_batch(conn: sqlite3.Connection, reviewer: Optional[str], status: str, limit: int,
+                  after: Optional[Tuple[float, int]], source_id: Optional[str],
+                  max_confidence: Optional[float], now: str) -> List[sqlite3.Row]:
+    conditions = ['ci.status = ?']
+    params: List[Any] = [status]
+    if after is not None:
+        conditions.append('(ci.confidence, ci.id) > (?, ?)')
+        params.extend(after)
+    if max_confidence is not None:
+        conditions.append('ci.confidence <= ?')
+        params.append(max_confidence)
+    if source_id:
+        conditions.append('cp.source_id = ?')
+        params.append(source_id)
+    # Items leased to someone else are skipped; the caller's own leases stay visible
+    conditions.append('''NOT EXISTS (
+        SELECT 1 FROM review_leases rl
+        WHERE rl.item_id = ci.id AND rl.expires_at > ? AND rl.reviewer IS NOT ?
+    )''')
+    params.extend([now, reviewer])
+
+    return conn.execute(f'''
+        SELECT ci.*, cp.source_id AS source_id, cp.page AS page
+        FROM catalog_items ci INDEXED BY idx_catalog_items_review
+        JOIN catalog_pages cp ON cp.id = ci.page_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY ci.confidence, ci.id
+        LIMIT ?
+    ''', (*params, limit)).fetchall()
+
+
+def _batch_response(rows: List[sqlite3.Row], limit: int) -> Dict[str, Any]:
+    items = []
+    for row in rows:
+        item = serialize_item(row)
+        item.update({"source_id": row['source_id'], "page": row['page']})
+        items.append(item)
+    last = rows[-1] if rows else None
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(last['confidence'], last['id']) if last is not None else None,
+        "has_more": len(rows) == limit,
+    }
+
+
+def peek_queue(conn: sqlite3.Connection, status: str = 'ai', limit: int = 20, cursor: Optional[str] = None,
+               source_id: Optional[str] = None, max_confidence: Optional[float] = None,
+               reviewer: Optional[str] = None) -> Dict[str, Any]:
+    """Browse the queue without claiming anything."""
+    limit = max(1, min(limit, MAX_BATCH))
+    now = datetime.utcnow().isoformat()
+    rows = _select_batch(conn, reviewer, status, limit, decode_cursor(cursor), source_id, max_confidence, now)
+    return _batch_response(rows, limit)
+
+
+def _lease(conn: sqlite3.Connection, reviewer: str, status: str, limit: int, after: Optional[Tuple[float, int]],
+           source_id: Optional[str], max_confidence: Optional[float], now: datetime,
+           expires_at: str) -> List[sqlite3.Row]:
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM review_leases WHERE expires_at <= ?', (now.isoformat(),))
+        rows = _select_batch(conn, reviewer, status, limit, after, source_id, max_confidence, now.isoformat())
+        conn.executemany('''
+            INSERT OR REPLACE INTO review_leases (item_id, reviewer, expires_at) VALUES (?, ?, ?)
+        ''', [(row['id'], reviewer, expires_at) for row in rows])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rows
+
+
+def claim_batch(conn: sqlite3.Connection, reviewer: str, status: str = 'ai', limit: int = 20,
+                cursor: Optional[str] = None, source_id: Optional[str] = None,
+                max_confidence: Optional[float] = None,
+                lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Dict[str, Any]:
+    """
+    Lease the next `limit` unclaimed items to `reviewer`.
+
+    Selection and lease writes share one IMMEDIATE transaction, which takes
+    SQLite's write lock up front, so concurrent claims are serialized and
+    never hand out the same item twice.
+    """
+    limit = max(1, min(limit, MAX_BATCH))
+    now = datetime.utcnow()
+    expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+    rows = _lease(conn, reviewer, status, limit, decode_cursor(cursor), source_id, max_confidence, now, expires_at)
+
+    response = _batch_response(rows, limit)
+    response.update({"reviewer": reviewer, "lease_expires_at": expires_at})
+    return response
+
+
+def _queue_order(row: sqlite3.Row) -> Tuple[float, int]:
+    return row['confidence'], row['id']
+
+
+def peek_catalogs(storage: 'StorageRouter', status: str = 'ai', limit: int = 20, cursor: Optional[str] = None,
+                  source_id: Optional[str] = None, max_confidence: Optional[float] = None,
+                  reviewer: Optional[str] = None) -> Dict[str, Any]:
+    """peek_queue over every catalog file: each shard's first `limit` items, merged in queue order."""
+    limit = max(1, min(limit, MAX_BATCH))
+    now = datetime.utcnow().isoformat()
+    after = decode_cursor(cursor)
+    batches = storage.fan_out(lambda conn: _select_batch(
+        conn, reviewer, status, limit, after, source_id, max_confidence, now), source_id)
+    rows = sorted((row for batch in batches for row in batch), key=_queue_order)[:limit]
+    return _batch_response(rows, limit)
+
+
+def claim_catalogs(storage: 'StorageRouter', reviewer: str, status: str = 'ai', limit: int = 20,
+                   cursor: Optional[str] = None, source_id: Optional[str] = None,
+                   max_confidence: Optional[float] = None,
+                   lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Dict[str, Any]:
+    """
+    claim_batch over every catalog file. The global next `limit` items are
+    picked without locking, then each shard leases its share in its own
+    IMMEDIATE transaction. If another reviewer took some of them in between,
+    that shard hands out its next eligible items instead; an item is still
+    never leased twice.
+    """
+    if source_id or not storage.sharded:
+        found = storage.fan_out(lambda conn: claim_batch(
+            conn, reviewer, status, limit, cursor, source_id, max_confidence, lease_seconds), source_id)
+        if found:
+            return found[0]
+
+    limit = max(1, min(limit, MAX_BATCH))
+    now = datetime.utcnow()
+    expires_at = (now + timedelta(seconds=lease_seconds)).isoformat()
+    after = decode_cursor(cursor)
+
+    paths = storage.catalog_paths(source_id)
+    candidates = []
+    for index, path in enumerate(paths):
+        conn = storage.connect(path)
+        try:
+            rows = _select_batch(conn, reviewer, status, limit, after, source_id, max_confidence, now.isoformat())
+        finally:
+            conn.close()
+        candidates.extend((_queue_order(row), index) for row in rows)
+    shares: Dict[int, int] = {}
+    for _, index in sorted(candidates)[:limit]:
+        shares[index] = shares.get(index, 0) + 1
+
+    rows = []
+    for index, share in shares.items():
+        conn = storage.connect(paths[index])
+        try:
+            rows += _lease(conn, reviewer, status, share, after, source_id, max_confidence, now, expires_at)
+        finally:
+            conn.close()
+
+    response = _batch_response(sorted(rows, key=_queue_order), limit)
+    response.update({"reviewer": reviewer, "lease_expires_at": expires_at})
+    return response
+
+
+def release_items(conn: sqlite3.Connection, reviewer: str, item_ids: List[int]) -> int:
+    """Drop `reviewer`'s leases on `item_ids` so others can pick them up."""
+    cursor = conn.executemany('DELETE FROM review_leases WHERE item_id = ? AND reviewer = ?',
+                              [(item_id, reviewer) for item_id in item_ids])
+    conn.commit()
+    return cursor.rowcount
@@ -0,0 +1,184 @@
+import re
+import sqlite3
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from services.catalog import serialize_item
+
+if TYPE_CHECKING:
+    from services.storage import StorageRouter
+
+# Full-text search over catalog items. catalog_items_fts is an external-content
+# FTS5 index (no second copy of the text) over name, brand, raw_text and the
+# tags JSON; the triggers below keep it in step with every insert, update and
+# delete on catalog_items.
+
+FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS catalog_items_fts USING fts5(
+        name, brand, raw_text, tags_json,
+        content='catalog_items',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+'''
+
+FTS_TRIGGERS_SQL = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS catalog_items_fts_insert AFTER INSERT ON catalog_items BEGIN
+        INSERT INTO catalog_items_fts (rowid, name, brand, raw_text, tags_json)
+        VALUES (new.id, new.name, new.brand, new.raw_text, new.tags_json);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS catalog_items_fts_delete AFTER DELETE ON catalog_items BEGIN
+        INSERT INTO catalog_items_fts (catalog_items_fts, rowid, name, brand, raw_text, tags_json)
+        VALUES ('delete', old.id, old.name, old.brand, old.raw_text, old.tags_json);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS catalog_items_fts_update
+    AFTER UPDATE OF name, brand, raw_text, tags_json ON catalog_items BEGIN
+        INSERT INTO catalog_items_fts (catalog_items_fts, rowid, name, brand, raw_text, tags_json)
+        VALUES ('delete', old.id, old.name, old.brand, old.raw_text, old.tags_json);
+        INSERT INTO catalog_items_fts (rowid, name, brand, raw_text, tags_json)
+        VALUES (new.id, new.name, new.brand, new.raw_text, new.tags_json);
+    END
+    ''',
+]
+
+# bm25 column weights: name, brand, raw_text, tags
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+MAX_PER_PAGE = 100
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def init_search(cursor: sqlite3.Cursor) -> None:
+    """Create the FTS index and triggers, backfilling the index on first creation."""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_items_fts'"
+    ).fetchone()
+    cursor.execute(FTS_TABLE_SQL)
+    for trigger_sql in FTS_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+    if not exists:
+        cursor.execute("INSERT INTO catalog_items_fts (catalog_items_fts) VALUES ('rebuild')")
+
+
+def build_match_query(text: str) -> Optional[str]:
+    """
+    Turn free text into a safe FTS5 query: every word must match (quoted so
+    FTS syntax in user input is inert) and the last word matches as a prefix.
+    """
+    terms = _TERM_RE.findall(text or '')
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _filters(source_id: Optional[str], status: Optional[str], min_price: Optional[float],
+             max_price: Optional[float], size_unit: Optional[str]) -> Tuple[List[str], List[Any]]:
+    conditions: List[str] = []
+    params: List[Any] = []
+    if source_id:
+        conditions.append('cp.source_id = ?')
+        params.append(source_id)
+    if status:
+        conditions.append('ci.status = ?')
+        params.append(status)
+    if min_price is not None:
+        conditions.append('ci.price_value >= ?')
+        params.append(min_price)
+    if max_price is not None:
+        conditions.append('ci.price_value <= ?')
+        params.append(max_price)
+    if size_unit:
+        conditions.append('ci.size_unit = ? COLLATE NOCASE')
+        params.append(size_unit)
+    return conditions, params
+
+
+def _ranked(conn: sqlite3.Connection, match: str, conditions: List[str], params: List[Any],
+            limit: int, offset: int) -> List[Dict[str, Any]]:
+    """Matching items in API shape, best score first."""
+    weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+    rows = conn.execute(f'''
+        SELECT ci.*, cp.source_id AS source_id, cp.page AS page,
+               bm25(catalog_items_fts, {weights}) AS score,
+               snippet(catalog_items_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet
+        FROM catalog_items_fts
+        JOIN catalog_items ci ON ci.id = catalog_items_fts.rowid
+        JOIN catalog_pages cp ON cp.id = ci.page_id
+        WHERE {' AND '.join(['catalog_items_fts MATCH ?'] + conditions)}
+        ORDER BY score
+        LIMIT ? OFFSET ?
+    ''', (match, *params, limit, offset)).fetchall()
+
+    results = []
+    for row in rows:
+        result = serialize_item(row)
+        result.update({
+            "source_id": row['source_id'],
+            "page": row['page'],
+            "score": -row['score'],
+            "snippet": row['snippet'],
+        })
+        results.append(result)
+    return results
+
+
+def _response(text: str, page: int, per_page: int) -> Dict[str, Any]:
+    return {"query": text, "page": page, "per_page": per_page, "has_more": False, "results": []}
+
+
+def search_items(conn: sqlite3.Connection, text: str, source_id: Optional[str] = None,
+                 status: Optional[str] = None, min_price: Optional[float] = None,
+                 max_price: Optional[float] = None, size_unit: Optional[str] = None,
+                 page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+    """Ranked, filtered, paginated item search across every source and page."""
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    match = build_match_query(text)
+    response = _response(text, page, per_page)
+    if match is None:
+        return response
+
+    conditions, params = _filters(source_id, status, min_price, max_price, size_unit)
+    # Fetch one extra row to know whether another page exists without a COUNT(*)
+    results = _ranked(conn, match, conditions, params, per_page + 1, (page - 1) * per_page)
+    response["has_more"] = len(results) > per_page
+    response["results"] = results[:per_page]
+    return response
+
+
+def search_catalogs(storage: 'StorageRouter', text: str, source_id: Optional[str] = None,
+                    status: Optional[str] = None, min_price: Optional[float] = None,
+                    max_price: Optional[float] = None, size_unit: Optional[str] = None,
+                    page: int = 1, per_page: int = 20) -> Dict[str, Any]:
+    """
+    search_items over every catalog file. Each shard returns its best
+    page * per_page + 1 results, which are merged by score; bm25 statistics
+    are per shard, so the order across sources is approximate.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    page = max(1, page)
+    if source_id or not storage.sharded:
+        # One catalog file at most: search it directly, with OFFSET paging
+        found = storage.fan_out(lambda conn: search_items(
+            conn, text, source_id, status, min_price, max_price, size_unit, page, per_page), source_id)
+        return found[0] if found else _response(text, page, per_page)
+
+    match = build_match_query(text)
+    response = _response(text, page, per_page)
+    if match is None:
+        return response
+
+    conditions, params = _filters(None, status, min_price, max_price, size_unit)
+    batches = storage.fan_out(lambda conn: _ranked(conn, match, conditions, params, page * per_page + 1, 0))
+    results = sorted((result for batch in batches for result in batch),
+                     key=lambda result: (-result['score'], result['id']))
+    results = results[(page - 1) * per_page:]
+    response["has_more"] = len(results) > per_page
+    response["results"] = results[:per_page]
+    return response
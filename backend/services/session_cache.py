@@ -0,0 +1,236 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from services.menus import MenuIndex, load_menu
+from services.metrics import SESSION_CACHE_BYTES, SESSION_CACHE_LOOKUPS
+
+# Per-worker LRU of chat session state: the first HISTORY_LIMIT messages and
+# the active menu, a MenuIndex shared with every other session on the same
+# menu (services/menus.py; it is not counted in a session's size).
+# conversations.version is bumped by triggers on
+# every messages/active_menu write, whichever worker makes it, so a lookup
+# costs one primary-key read of that counter; a mismatch means another worker
+# (or a direct DB write) got there first and the entry is reloaded. Writes go
+# to SQLite first and are then applied to the cached entry. Versions never
+# repeat for a session_id: retention raises session_version_floor to the
+# highest version it deletes, and a recreated conversation starts above it,
+# so a worker still caching the deleted session sees a mismatch.
+
+HISTORY_LIMIT = 50
+MAX_BYTES = int(os.getenv('SESSION_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+VERSION_FLOOR_SQL = '''
+    CREATE TABLE IF NOT EXISTS session_version_floor (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+'''
+
+# First version of a new conversations row
+_NEW_VERSION = '(SELECT version + 1 FROM session_version_floor WHERE id = 1)'
+
+_BUMP_SQL = f'''
+    INSERT INTO conversations (session_id, created_at, version)
+    VALUES (new.session_id, strftime('%Y-%m-%dT%H:%M:%f', 'now'), {_NEW_VERSION})
+    ON CONFLICT (session_id) DO UPDATE SET version = version + 1;
+'''
+
+VERSION_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS conversations_version_message AFTER INSERT ON messages BEGIN
+        {_BUMP_SQL}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS conversations_version_menu_insert AFTER INSERT ON active_menu BEGIN
+        {_BUMP_SQL}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS conversations_version_menu_update AFTER UPDATE ON active_menu BEGIN
+        {_BUMP_SQL}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS conversations_version_menu_delete AFTER DELETE ON active_menu BEGIN
+        {_BUMP_SQL.replace('new.', 'old.')}
+    END
+    ''',
+]
+
+
+@dataclass
+class SessionState:
+    messages: List[Tuple[str, str, str]]
+    menu: Optional[MenuIndex]
+    version: int
+    size: int
+
+
+def init_session_cache(cursor: sqlite3.Cursor) -> None:
+    """Add conversations.version and the triggers that bump it (idempotent)."""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(conversations)')]
+    if 'version' not in columns:
+        cursor.execute('ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    cursor.execute(VERSION_FLOOR_SQL)
+    cursor.execute('INSERT OR IGNORE INTO session_version_floor (id, version) VALUES (1, 0)')
+    # Older databases have bump triggers that start new rows at version 1
+    outdated = cursor.execute('''
+        SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'conversations_version_%'
+        AND sql NOT LIKE '%session_version_floor%'
+    ''').fetchall()
+    for (name,) in outdated:
+        cursor.execute(f'DROP TRIGGER {name}')
+    for trigger_sql in VERSION_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+
+
+def create_conversation(conn: sqlite3.Connection, session_id: str, created_at: str) -> None:
+    """Insert the conversations row if it is missing, versioned above any deleted session. Caller commits."""
+    conn.execute(f'''
+        INSERT OR IGNORE INTO conversations (session_id, created_at, version)
+        VALUES (?, ?, {_NEW_VERSION})
+    ''', (session_id, created_at))
+
+
+def raise_version_floor(conn: sqlite3.Connection, session_ids: List[str]) -> None:
+    """Lift session_version_floor to the sessions' versions before their rows are deleted. Caller commits."""
+    conn.execute(f'''
+        UPDATE session_version_floor SET version = MAX(version, COALESCE(
+            (SELECT MAX(version) FROM conversations WHERE session_id IN ({', '.join('?' for _ in session_ids)})), 0))
+        WHERE id = 1
+    ''', session_ids)
+
+
+def session_version(conn: sqlite3.Connection, session_id: str) -> int:
+    row = conn.execute('SELECT version FROM conversations WHERE session_id = ?', (session_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def _messages_size(messages) -> int:
+    return sum(len(content) + 64 for _, content, _ in messages)
+
+
+class SessionCache:
+    """Byte-bounded LRU of SessionState keyed by session_id."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: 'OrderedDict[str, SessionState]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, version: int) -> Optional[SessionState]:
+        """The cached state if it is still at `version`; stale entries are dropped."""
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is None:
+                SESSION_CACHE_LOOKUPS.labels('miss').inc()
+                return None
+            if state.version != version:
+                self._drop(session_id)
+                SESSION_CACHE_LOOKUPS.labels('stale').inc()
+                return None
+            self._entries.move_to_end(session_id)
+            SESSION_CACHE_LOOKUPS.labels('hit').inc()
+            return state
+
+    def put(self, session_id: str, state: SessionState) -> None:
+        with self._lock:
+            self._drop(session_id)
+            if state.size > self.max_bytes:
+                return
+            self._entries[session_id] = state
+            self.bytes += state.size
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            SESSION_CACHE_BYTES.set(self.bytes)
+
+    def apply_messages(self, session_id: str, version: int, messages: List[Tuple[str, str, str]]) -> None:
+        """
+        Write-through for committed messages, `version` being the one read
+        back in the writing transaction. The entry is updated only if nobody
+        else wrote since it was cached (the version moved by exactly our
+        rows); otherwise it is dropped and the next lookup reloads.
+        """
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is None:
+                return
+            if state.version + len(messages) != version:
+                self._drop(session_id)
+                return
+            # Copy on write: readers may still hold the old list
+            kept = (state.messages + messages)[:HISTORY_LIMIT]
+            size = state.size - _messages_size(state.messages) + _messages_size(kept)
+            self.bytes += size - state.size
+            self._entries[session_id] = SessionState(kept, state.menu, version, size)
+            self._entries.move_to_end(session_id)
+            SESSION_CACHE_BYTES.set(self.bytes)
+
+    def apply_menu(self, session_id: str, version: int, menu: MenuIndex) -> None:
+        """Write-through for a committed active menu (same version rule as apply_messages)."""
+        with self._lock:
+            state = self._entries.get(session_id)
+            if state is None:
+                return
+            if state.version + 1 != version:
+                self._drop(session_id)
+                return
+            self._entries[session_id] = SessionState(state.messages, menu, version, state.size)
+            self._entries.move_to_end(session_id)
+            SESSION_CACHE_BYTES.set(self.bytes)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def _drop(self, session_id: str) -> None:
+        state = self._entries.pop(session_id, None)
+        if state is not None:
+            self.bytes -= state.size
+            SESSION_CACHE_BYTES.set(self.bytes)
+
+
+_cache = SessionCache()
+
+
+def get_session_cache() -> SessionCache:
+    return _cache
+
+
+def load_session(conn: sqlite3.Connection, session_id: str) -> SessionState:
+    """
+    A session's first HISTORY_LIMIT messages and active menu, from the cache
+    when its version still matches and from SQLite otherwise. The menu JSON
+    is only read and parsed when no session in this worker holds it yet.
+    """
+    # Read the version first: data newer than it only costs one extra reload
+    version = session_version(conn, session_id)
+    state = _cache.get(session_id, version)
+    if state is not None:
+        return state
+
+    rows = conn.execute('''
+        SELECT role, content, created_at FROM messages
+        WHERE session_id = ?
+        ORDER BY created_at ASC
+        LIMIT ?
+    ''', (session_id, HISTORY_LIMIT)).fetchall()
+    menu_row = conn.execute('''
+        SELECT menu_sha256 FROM active_menu WHERE session_id = ?
+    ''', (session_id,)).fetchone()
+
+    messages = [(row['role'], row['content'], row['created_at']) for row in rows]
+    state = SessionState(
+        messages=messages,
+        menu=load_menu(conn, menu_row['menu_sha256']) if menu_row else None,
+        version=version,
+        size=_messages_size(messages),
+    )
+    _cache.put(session_id, state)
+    return state
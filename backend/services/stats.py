@@ -0,0 +1,161 @@
+import sqlite3
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from services.storage import StorageRouter
+
+# Incrementally maintained annotation statistics. catalog_stats holds one
+# counter per (source_id, page, key); page = -1 is the whole-source total.
+# Keys: 'items', 'pages', 'status:<status>' and 'confidence:<0-9>' (tenths of
+# confidence). Triggers on catalog_items and catalog_pages adjust the
+# counters on every write, so reading a source's stats is a primary-key range
+# lookup instead of a scan over catalog_items.
+
+SOURCE_TOTAL = -1
+CONFIDENCE_BUCKETS = 10
+STATUSES = ('ai', 'edited', 'verified')
+
+STATS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_stats (
+        source_id TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (source_id, page, key)
+    ) WITHOUT ROWID
+'''
+
+_BUCKET = "MIN({n} - 1, MAX(0, CAST({row}.confidence * {n} AS INTEGER)))"
+
+
+def _adjust_sql(row: str, delta: str) -> str:
+    """Add `delta` to the item, status and confidence counters of `row` (new/old) for its page and source."""
+    bucket = _BUCKET.format(n=CONFIDENCE_BUCKETS, row=row)
+    return f'''
+        INSERT INTO catalog_stats (source_id, page, key, count)
+        SELECT cp.source_id, CASE scope.whole WHEN 1 THEN {SOURCE_TOTAL} ELSE cp.page END, counter.key, {delta}
+        FROM catalog_pages cp,
+             (SELECT 0 AS whole UNION ALL SELECT 1) scope,
+             (SELECT 'items' AS key
+              UNION ALL SELECT 'status:' || {row}.status
+              UNION ALL SELECT 'confidence:' || {bucket}) counter
+        WHERE cp.id = {row}.page_id
+        ON CONFLICT (source_id, page, key) DO UPDATE SET count = count + excluded.count;
+    '''
+
+
+STATS_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_stats_item_insert AFTER INSERT ON catalog_items BEGIN
+        {_adjust_sql('new', '1')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_stats_item_delete AFTER DELETE ON catalog_items BEGIN
+        {_adjust_sql('old', '-1')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_stats_item_update
+    AFTER UPDATE OF status, confidence, page_id ON catalog_items
+    WHEN old.status IS NOT new.status OR old.confidence IS NOT new.confidence OR old.page_id IS NOT new.page_id
+    BEGIN
+        {_adjust_sql('old', '-1')}
+        {_adjust_sql('new', '1')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_stats_page_insert AFTER INSERT ON catalog_pages BEGIN
+        INSERT INTO catalog_stats (source_id, page, key, count)
+        VALUES (new.source_id, {SOURCE_TOTAL}, 'pages', 1)
+        ON CONFLICT (source_id, page, key) DO UPDATE SET count = count + 1;
+    END
+    ''',
+]
+
+_BACKFILL_SQL = [
+    f'''
+    INSERT INTO catalog_stats (source_id, page, key, count)
+    SELECT source_id, {SOURCE_TOTAL}, 'pages', COUNT(*) FROM catalog_pages GROUP BY source_id
+    ''',
+] + [
+    f'''
+    INSERT INTO catalog_stats (source_id, page, key, count)
+    SELECT cp.source_id, {scope}, {key}, COUNT(*)
+    FROM catalog_items ci JOIN catalog_pages cp ON cp.id = ci.page_id
+    GROUP BY 1, 2, 3
+    '''
+    for scope in ('cp.page', str(SOURCE_TOTAL))
+    for key in ("'items'", "'status:' || ci.status",
+                "'confidence:' || " + _BUCKET.format(n=CONFIDENCE_BUCKETS, row='ci'))
+]
+
+
+def init_stats(cursor: sqlite3.Cursor) -> None:
+    """Create the stats table and triggers, backfilling the counters on first creation."""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'catalog_stats'"
+    ).fetchone()
+    cursor.execute(STATS_TABLE_SQL)
+    for trigger_sql in STATS_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+    if not exists:
+        for backfill_sql in _BACKFILL_SQL:
+            cursor.execute(backfill_sql)
+
+
+def _shape(counters: Dict[str, int]) -> Dict[str, Any]:
+    items = counters.get('items', 0)
+    status = {name: counters.get(f'status:{name}', 0) for name in STATUSES}
+    return {
+        "items": items,
+        "status": status,
+        "verified_ratio": status['verified'] / items if items else 0.0,
+        "confidence_histogram": [counters.get(f'confidence:{i}', 0) for i in range(CONFIDENCE_BUCKETS)],
+    }
+
+
+def source_stats(conn: sqlite3.Connection, source_id: str, include_pages: bool = False) -> Dict[str, Any]:
+    """Counters for one source (a primary-key range read), optionally with a per-page breakdown."""
+    rows = conn.execute('''
+        SELECT key, count FROM catalog_stats WHERE source_id = ? AND page = ?
+    ''', (source_id, SOURCE_TOTAL)).fetchall()
+    counters = {row[0]: row[1] for row in rows}
+    result = {"source_id": source_id, "pages": counters.get('pages', 0), **_shape(counters)}
+
+    if include_pages:
+        pages: Dict[int, Dict[str, int]] = {}
+        for page, key, count in conn.execute('''
+            SELECT page, key, count FROM catalog_stats WHERE source_id = ? AND page != ? ORDER BY page
+        ''', (source_id, SOURCE_TOTAL)):
+            pages.setdefault(page, {})[key] = count
+        result["per_page"] = [{"page": page, **_shape(counters)} for page, counters in pages.items()]
+    return result
+
+
+def all_source_stats(conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+    """Whole-source counters for every source (one row group per source, no item scan)."""
+    sources: Dict[str, Dict[str, int]] = {}
+    for source_id, key, count in conn.execute('''
+        SELECT source_id, key, count FROM catalog_stats WHERE page = ? ORDER BY source_id
+    ''', (SOURCE_TOTAL,)):
+        sources.setdefault(source_id, {})[key] = count
+    return [{"source_id": source_id, "pages": counters.get('pages', 0), **_shape(counters)}
+            for source_id, counters in sources.items()]
+
+
+def source_catalog_stats(storage: 'StorageRouter', source_id: str, include_pages: bool = False) -> Dict[str, Any]:
+    """source_stats from the source's catalog file; all zeros if it has none yet."""
+    found = storage.fan_out(lambda conn: source_stats(conn, source_id, include_pages), source_id)
+    if found:
+        return found[0]
+    result = {"source_id": source_id, "pages": 0, **_shape({})}
+    if include_pages:
+        result["per_page"] = []
+    return result
+
+
+def all_catalog_stats(storage: 'StorageRouter') -> List[Dict[str, Any]]:
+    """all_source_stats over every catalog file, ordered by source_id."""
+    sources = [source for batch in storage.fan_out(all_source_stats) for source in batch]
+    return sorted(sources, key=lambda source: source['source_id'])
@@ -0,0 +1,497 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.changes import init_changes
+from services.menus import init_menus
+from services.page_tiles import init_page_tiles
+from services.metrics import TimedConnection
+from services.retention import init_retention
+from services.review import init_review
+from services.search import init_search
+from services.session_cache import init_session_cache
+from services.stats import init_stats
+from services.sync import init_sync
+from services.usage import USAGE_INDEX_SQL, USAGE_TABLE_SQL
+
+logger = logging.getLogger(__name__)
+
+# Which database file each kind of data lives in. With DB_LAYOUT=single
+# (the default) everything is in one file, as it always was. With
+# DB_LAYOUT=sharded each source_id gets its own catalog file in
+# CATALOG_SHARD_DIR, chat data (conversations, messages, menus) moves to
+# CHAT_DATABASE and the main database keeps images, extractions, usage and
+# the shard registry, so writers for different tenants take different
+# SQLite locks. Items get globally unique ids: a shard's AUTOINCREMENT
+# counters start at shard_no << ID_BITS, so an item id names its shard.
+# Items migrated from a single database keep their old ids, which are
+# looked up in legacy_item_shards. Cross-source reads (search, stats, the
+# review queue) run against every shard and merge the results.
+
+LAYOUTS = ('single', 'sharded')
+LAYOUT = os.getenv('DB_LAYOUT', 'single')
+SHARD_DIR = os.path.abspath(os.getenv('CATALOG_SHARD_DIR', 'catalog_shards'))
+CHAT_DATABASE = os.getenv('CHAT_DATABASE', 'chat.db')
+
+ID_BITS = 32
+# Tables whose AUTOINCREMENT ids must be unique across shards
+GLOBAL_ID_TABLES = ('catalog_pages', 'catalog_items')
+
+CATALOG_PAGES_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_pages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_id TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        page_width INTEGER NOT NULL,
+        page_height INTEGER NOT NULL,
+        image_sha256 TEXT,
+        UNIQUE(source_id, page)
+    )
+'''
+
+CATALOG_ITEMS_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        page_id INTEGER NOT NULL,
+        bbox_x INTEGER NOT NULL,
+        bbox_y INTEGER NOT NULL,
+        bbox_w INTEGER NOT NULL,
+        bbox_h INTEGER NOT NULL,
+        name TEXT,
+        brand TEXT,
+        variants_json TEXT,
+        price_value REAL,
+        price_currency TEXT DEFAULT 'MYR',
+        size_value REAL,
+        size_unit TEXT,
+        barcode TEXT,
+        tags_json TEXT,
+        raw_text TEXT,
+        confidence REAL NOT NULL,
+        status TEXT DEFAULT 'ai' CHECK (status IN ('ai', 'edited', 'verified')),
+        FOREIGN KEY (page_id) REFERENCES catalog_pages (id)
+    )
+'''
+
+CONVERSATIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS conversations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT UNIQUE NOT NULL,
+        user_id TEXT,
+        created_at TEXT NOT NULL
+    )
+'''
+
+MESSAGES_SQL = '''
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL CHECK (role IN ('user', 'assistant', 'system')),
+        content TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        FOREIGN KEY (session_id) REFERENCES conversations (session_id)
+    )
+'''
+
+EXTRACTIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS extractions (
+        id TEXT PRIMARY KEY,
+        source_id TEXT,
+        page INTEGER,
+        session_id TEXT,
+        menu_data JSON NOT NULL,
+        item_count INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+'''
+
+EXTRACTIONS_INDEX_SQL = 'CREATE INDEX IF NOT EXISTS idx_extractions_source ON extractions (source_id, page)'
+
+PAGE_IMAGES_SQL = '''
+    CREATE TABLE IF NOT EXISTS page_images (
+        sha256 TEXT PRIMARY KEY,
+        mime TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        created_at TEXT NOT NULL
+    )
+'''
+
+SHARDS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_shards (
+        source_id TEXT PRIMARY KEY,
+        shard_no INTEGER UNIQUE NOT NULL,
+        file TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+'''
+
+LEGACY_ITEMS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS legacy_item_shards (
+        item_id INTEGER PRIMARY KEY,
+        shard_no INTEGER NOT NULL
+    )
+'''
+
+# Catalog tables copied per source by the migration, with the rows that belong to the source
+_MIGRATED_CATALOG_TABLES = [
+    ('catalog_pages', 'source_id = :source_id'),
+    ('catalog_items', 'page_id IN (SELECT id FROM legacy.catalog_pages WHERE source_id = :source_id)'),
+    ('review_leases', '''item_id IN (SELECT ci.id FROM legacy.catalog_items ci
+                                     JOIN legacy.catalog_pages cp ON cp.id = ci.page_id
+                                     WHERE cp.source_id = :source_id)'''),
+    ('catalog_changes', 'source_id = :source_id'),
+    ('catalog_tombstones', 'source_id = :source_id'),
+    ('page_tiles', 'page_id IN (SELECT id FROM legacy.catalog_pages WHERE source_id = :source_id)'),
+]
+_MIGRATED_CHAT_TABLES = ('conversations', 'messages', 'menus', 'active_menu', 'retention_runs')
+
+
+def init_catalog_schema(cursor: sqlite3.Cursor) -> None:
+    """Catalog pages and items with their search, stats, review, change feed and sync structures."""
+    cursor.execute(CATALOG_PAGES_SQL)
+    cursor.execute(CATALOG_ITEMS_SQL)
+
+    # Older databases predate catalog_pages.image_sha256
+    page_columns = [row[1] for row in cursor.execute('PRAGMA table_info(catalog_pages)')]
+    if 'image_sha256' not in page_columns:
+        cursor.execute('ALTER TABLE catalog_pages ADD COLUMN image_sha256 TEXT')
+
+    # Full-text index over catalog_items, kept in sync by triggers
+    init_search(cursor)
+    # Per-source/per-page annotation counters, kept in sync by triggers
+    init_stats(cursor)
+    # Review queue index and claim leases
+    init_review(cursor)
+    # Change log feeding the live change feed
+    init_changes(cursor)
+    # Row revisions and tombstones for delta exports
+    init_sync(cursor)
+    # Tile signatures for incremental re-extraction
+    init_page_tiles(cursor)
+
+
+def init_chat_schema(cursor: sqlite3.Cursor) -> None:
+    """Conversations, messages, menus and their cache/retention structures."""
+    # Only takes effect on a new database; lets retention reclaim space with incremental_vacuum
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    cursor.execute(CONVERSATIONS_SQL)
+    cursor.execute(MESSAGES_SQL)
+    # Content-addressed menus and the per-session active_menu references
+    init_menus(cursor)
+    # conversations.version bumps for cross-worker session cache invalidation
+    init_session_cache(cursor)
+    # Session lookup index and retention run log
+    init_retention(cursor)
+
+
+def init_main_schema(cursor: sqlite3.Cursor) -> None:
+    """Extractions, the page image index, LLM usage and the shard registry."""
+    cursor.execute(EXTRACTIONS_SQL)
+    cursor.execute(EXTRACTIONS_INDEX_SQL)
+    cursor.execute(PAGE_IMAGES_SQL)
+    cursor.execute(USAGE_TABLE_SQL)
+    for index_sql in USAGE_INDEX_SQL:
+        cursor.execute(index_sql)
+    cursor.execute(SHARDS_TABLE_SQL)
+    cursor.execute(LEGACY_ITEMS_TABLE_SQL)
+
+
+def _shard_file(shard_no: int, source_id: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '-', source_id).strip('-')[:40] or 'source'
+    return f"{shard_no:05d}-{slug}.db"
+
+
+def _raise_sequence(conn: sqlite3.Connection, table: str, floor: int) -> None:
+    """Make `table`'s next AUTOINCREMENT id at least floor + 1."""
+    conn.execute('''
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT ?, ? WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)
+    ''', (table, floor, table))
+    conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (floor, table))
+
+
+def _init_shard(path: str, shard_no: int) -> None:
+    """Create (or upgrade) a shard's schema and start its id counters at shard_no << ID_BITS."""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        init_catalog_schema(conn.cursor())
+        for table in GLOBAL_ID_TABLES:
+            _raise_sequence(conn, table, shard_no << ID_BITS)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class StorageRouter:
+    """Opens connections to the database file that holds each kind of data."""
+
+    def __init__(self, database: str, layout: str = LAYOUT, shard_dir: str = SHARD_DIR,
+                 chat_database: str = CHAT_DATABASE):
+        if layout not in LAYOUTS:
+            raise ValueError(f"DB_LAYOUT must be one of {', '.join(LAYOUTS)}, not {layout!r}")
+        self.database = database
+        self.layout = layout
+        self.sharded = layout == 'sharded'
+        self.shard_dir = shard_dir
+        self.chat_database = chat_database if self.sharded else database
+        self._lock = threading.Lock()
+        self._shards: Dict[str, Tuple[int, str]] = {}   # source_id -> (shard_no, path)
+        self._paths: Dict[int, str] = {}                # shard_no -> path
+
+    def connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, factory=TimedConnection)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def main(self) -> sqlite3.Connection:
+        """Images, extractions and usage."""
+        return self.connect(self.database)
+
+    def chat(self) -> sqlite3.Connection:
+        """Conversations, messages and menus."""
+        return self.connect(self.chat_database)
+
+    def init_schemas(self) -> None:
+        """Create or upgrade every table this layout uses (shards included)."""
+        if not self.sharded:
+            conn = sqlite3.connect(self.database)
+            cursor = conn.cursor()
+            init_chat_schema(cursor)
+            init_catalog_schema(cursor)
+            init_main_schema(cursor)
+            conn.commit()
+            conn.close()
+            return
+
+        for path, init_schema in ((self.database, init_main_schema), (self.chat_database, init_chat_schema)):
+            conn = sqlite3.connect(path)
+            init_schema(conn.cursor())
+            conn.commit()
+            conn.close()
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self._load_registry()
+        for shard_no, path in list(self._paths.items()):
+            _init_shard(path, shard_no)
+
+    def _load_registry(self) -> None:
+        conn = sqlite3.connect(self.database)
+        try:
+            rows = conn.execute('SELECT source_id, shard_no, file FROM catalog_shards').fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for source_id, shard_no, file in rows:
+                path = os.path.join(self.shard_dir, file)
+                self._shards[source_id] = (shard_no, path)
+                self._paths[shard_no] = path
+
+    def _create_shard(self, source_id: str) -> None:
+        # The registry row and the shard's schema are written under the main
+        # database's write lock, so no worker sees a shard without tables
+        os.makedirs(self.shard_dir, exist_ok=True)
+        conn = sqlite3.connect(self.database, timeout=30)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if conn.execute('SELECT 1 FROM catalog_shards WHERE source_id = ?', (source_id,)).fetchone() is None:
+                shard_no = conn.execute('SELECT COALESCE(MAX(shard_no), 0) + 1 FROM catalog_shards').fetchone()[0]
+                file = _shard_file(shard_no, source_id)
+                _init_shard(os.path.join(self.shard_dir, file), shard_no)
+                conn.execute('''
+                    INSERT INTO catalog_shards (source_id, shard_no, file, created_at) VALUES (?, ?, ?, ?)
+                ''', (source_id, shard_no, file, datetime.utcnow().isoformat()))
+                logger.info(f"Created catalog shard {file} for source {source_id}")
+            conn.commit()
+        finally:
+            conn.close()
+        self._load_registry()
+
+    def catalog_path(self, source_id: str, create: bool = False) -> Optional[str]:
+        """File holding `source_id`'s catalog; None if it has none yet and `create` is false."""
+        if not self.sharded:
+            return self.database
+        if source_id not in self._shards:
+            # Another worker may have created it since the registry was read
+            self._load_registry()
+        if source_id not in self._shards and create:
+            self._create_shard(source_id)
+        shard = self._shards.get(source_id)
+        return shard[1] if shard else None
+
+    def shard_no(self, source_id: str) -> Optional[int]:
+        shard = self._shards.get(source_id)
+        return shard[0] if shard else None
+
+    def catalog_path_for_item(self, item_id: int) -> Optional[str]:
+        """File holding catalog item `item_id`, or None if no shard can hold it."""
+        if not self.sharded:
+            return self.database
+        shard_no = item_id >> ID_BITS
+        if shard_no == 0:
+            conn = sqlite3.connect(self.database)
+            try:
+                row = conn.execute('SELECT shard_no FROM legacy_item_shards WHERE item_id = ?', (item_id,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return None
+            shard_no = row[0]
+        if shard_no not in self._paths:
+            self._load_registry()
+        return self._paths.get(shard_no)
+
+    def catalog_paths(self, source_id: Optional[str] = None) -> List[str]:
+        """Every catalog file, or just `source_id`'s (none if it has no shard)."""
+        if source_id:
+            path = self.catalog_path(source_id)
+            return [path] if path else []
+        if not self.sharded:
+            return [self.database]
+        self._load_registry()
+        return [self._paths[shard_no] for shard_no in sorted(self._paths)]
+
+    def catalog(self, source_id: str, create: bool = False) -> Optional[sqlite3.Connection]:
+        path = self.catalog_path(source_id, create)
+        return self.connect(path) if path else None
+
+    def catalog_for_item(self, item_id: int) -> Optional[sqlite3.Connection]:
+        path = self.catalog_path_for_item(item_id)
+        return self.connect(path) if path else None
+
+    def fan_out(self, fn: Callable[[sqlite3.Connection], Any], source_id: Optional[str] = None) -> List[Any]:
+        """`fn(conn)` for every catalog file (or `source_id`'s only), in shard order."""
+        results = []
+        for path in self.catalog_paths(source_id):
+            conn = self.connect(path)
+            try:
+                results.append(fn(conn))
+            finally:
+                conn.close()
+        return results
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _copy_rows(conn: sqlite3.Connection, table: str, where: str = '1', params: Optional[Dict[str, Any]] = None) -> int:
+    """Copy `table` rows matching `where` from the attached legacy database, by the columns both sides have."""
+    legacy_columns = set(_columns(conn, 'legacy', table))
+    columns = ', '.join(c for c in _columns(conn, 'main', table) if c in legacy_columns)
+    if not columns:
+        return 0
+    cursor = conn.execute(f'''
+        INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM legacy.{table} WHERE {where}
+    ''', params or {})
+    return cursor.rowcount
+
+
+def migrate_source(router: StorageRouter, source_id: str) -> Dict[str, int]:
+    """
+    Copy one source's catalog rows from the single database into its shard,
+    keeping ids, change-feed cursors and sync revisions. Triggers are dropped
+    while copying and the FTS index and stats are rebuilt afterwards.
+    """
+    path = router.catalog_path(source_id, create=True)
+    shard_no = router.shard_no(source_id)
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        conn.execute('ATTACH DATABASE ? AS legacy', (os.path.abspath(router.database),))
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute('SELECT 1 FROM catalog_pages LIMIT 1').fetchone():
+            conn.rollback()
+            return {}
+        for (trigger,) in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'trigger'").fetchall():
+            conn.execute(f'DROP TRIGGER main.{trigger}')
+        counts = {table: _copy_rows(conn, table, where, {'source_id': source_id})
+                  for table, where in _MIGRATED_CATALOG_TABLES}
+        # Cursors and revisions handed out before the split were global, so
+        # the shard's counters continue above the old database's
+        conn.execute('''
+            UPDATE catalog_clock SET revision = MAX(revision, (SELECT revision FROM legacy.catalog_clock WHERE id = 1))
+        ''')
+        legacy_changes = conn.execute(
+            "SELECT seq FROM legacy.sqlite_sequence WHERE name = 'catalog_changes'").fetchone()
+        _raise_sequence(conn, 'catalog_changes', legacy_changes[0] if legacy_changes else 0)
+        conn.execute('''
+            INSERT OR REPLACE INTO legacy.legacy_item_shards (item_id, shard_no)
+            SELECT id, ? FROM main.catalog_items
+        ''', (shard_no,))
+        # Dropped tables are recreated and backfilled by init_catalog_schema
+        conn.execute('DROP TABLE catalog_items_fts')
+        conn.execute('DROP TABLE catalog_stats')
+        init_catalog_schema(conn.cursor())
+        for table in GLOBAL_ID_TABLES:
+            _raise_sequence(conn, table, shard_no << ID_BITS)
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+def migrate_chat(router: StorageRouter) -> Dict[str, int]:
+    """Copy conversations, messages, menus and retention runs into the chat database."""
+    conn = sqlite3.connect(router.chat_database, timeout=30)
+    try:
+        conn.execute('ATTACH DATABASE ? AS legacy', (os.path.abspath(router.database),))
+        conn.execute('BEGIN IMMEDIATE')
+        if conn.execute('SELECT 1 FROM conversations LIMIT 1').fetchone():
+            conn.rollback()
+            return {}
+        counts = {table: _copy_rows(conn, table) for table in _MIGRATED_CHAT_TABLES}
+        # Versions of sessions deleted before the split must not be reused either
+        conn.execute('''
+            UPDATE session_version_floor
+            SET version = MAX(version, (SELECT version FROM legacy.session_version_floor WHERE id = 1))
+        ''')
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+def migrate(database: str, shard_dir: str = SHARD_DIR, chat_database: str = CHAT_DATABASE) -> Dict[str, Any]:
+    """Split a single-layout database into the sharded layout. Sources already migrated are skipped."""
+    # Bring the old database up to the current schema first, so both sides have the same columns
+    StorageRouter(database, 'single').init_schemas()
+    router = StorageRouter(database, 'sharded', shard_dir, chat_database)
+    router.init_schemas()
+
+    conn = sqlite3.connect(database)
+    sources = [row[0] for row in conn.execute('SELECT DISTINCT source_id FROM catalog_pages ORDER BY source_id')]
+    conn.close()
+    return {
+        "chat": migrate_chat(router),
+        "sources": {source_id: migrate_source(router, source_id) for source_id in sources},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Split catalog.db into per-source catalog shards and a chat database.")
+    parser.add_argument('--db', default='catalog.db')
+    parser.add_argument('--shard-dir', default=SHARD_DIR)
+    parser.add_argument('--chat-db', default=CHAT_DATABASE)
+    parser.add_argument('--migrate', action='store_true', help='copy the data; without it only the plan is printed')
+    args = parser.parse_args()
+
+    if not args.migrate:
+        conn = sqlite3.connect(args.db)
+        sources = conn.execute('SELECT source_id, COUNT(*) FROM catalog_pages GROUP BY source_id').fetchall()
+        conn.close()
+        print(f"{len(sources)} sources would move to {args.shard_dir}, chat data to {args.chat_db}:")
+        for source_id, pages in sources:
+            print(f"  {source_id}: {pages} pages")
+        return
+    print(json.dumps(migrate(args.db, args.shard_dir, args.chat_db), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import sqlite3
+from typing import Any, Dict, Optional
+
+from services.catalog import serialize_item
+from services.changes import TRACKED_COLUMNS
+
+# Row-level change tracking for delta exports. catalog_clock holds a single
+# monotonic revision; triggers bump it on every insert, update and delete of
+# catalog_pages/catalog_items, stamp the row's `revision` and `updated_at`,
+# and record deletions in catalog_tombstones. A sync job keeps the revision
+# returned by its last export and asks only for rows above it.
+
+CLOCK_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_clock (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        revision INTEGER NOT NULL
+    )
+'''
+
+TOMBSTONES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS catalog_tombstones (
+        kind TEXT NOT NULL CHECK (kind IN ('page', 'item')),
+        row_id INTEGER NOT NULL,
+        source_id TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        revision INTEGER NOT NULL,
+        deleted_at TEXT NOT NULL,
+        PRIMARY KEY (kind, row_id)
+    )
+'''
+
+SYNC_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_catalog_items_revision ON catalog_items (revision)',
+    'CREATE INDEX IF NOT EXISTS idx_catalog_pages_revision ON catalog_pages (source_id, revision)',
+    'CREATE INDEX IF NOT EXISTS idx_catalog_tombstones_revision ON catalog_tombstones (source_id, revision)',
+]
+
+PAGE_COLUMNS = ('source_id', 'page', 'page_width', 'page_height', 'image_sha256')
+
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+_BUMP = 'UPDATE catalog_clock SET revision = revision + 1 WHERE id = 1;'
+_CURRENT = '(SELECT revision FROM catalog_clock WHERE id = 1)'
+
+
+def _stamp(table: str) -> str:
+    return f'''
+        {_BUMP}
+        UPDATE {table} SET revision = {_CURRENT}, updated_at = {_NOW} WHERE id = new.id;
+    '''
+
+
+def _changed(columns) -> str:
+    return ' OR '.join(f'old.{c} IS NOT new.{c}' for c in columns)
+
+
+# Stamping updates only revision/updated_at, which no UPDATE OF trigger watches,
+# so it does not cascade into the FTS, stats or change-feed triggers.
+SYNC_TRIGGERS_SQL = [
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_item_insert AFTER INSERT ON catalog_items BEGIN
+        {_stamp('catalog_items')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_item_update
+    AFTER UPDATE OF {', '.join(TRACKED_COLUMNS)}, page_id ON catalog_items
+    WHEN {_changed(TRACKED_COLUMNS + ['page_id'])}
+    BEGIN
+        {_stamp('catalog_items')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_item_delete AFTER DELETE ON catalog_items BEGIN
+        {_BUMP}
+        INSERT OR REPLACE INTO catalog_tombstones (kind, row_id, source_id, page, revision, deleted_at)
+        SELECT 'item', old.id, cp.source_id, cp.page, {_CURRENT}, {_NOW}
+        FROM catalog_pages cp WHERE cp.id = old.page_id;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_page_insert AFTER INSERT ON catalog_pages BEGIN
+        {_stamp('catalog_pages')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_page_update
+    AFTER UPDATE OF {', '.join(PAGE_COLUMNS)} ON catalog_pages
+    WHEN {_changed(PAGE_COLUMNS)}
+    BEGIN
+        {_stamp('catalog_pages')}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS catalog_sync_page_delete AFTER DELETE ON catalog_pages BEGIN
+        {_BUMP}
+        INSERT OR REPLACE INTO catalog_tombstones (kind, row_id, source_id, page, revision, deleted_at)
+        VALUES ('page', old.id, old.source_id, old.page, {_CURRENT}, {_NOW});
+    END
+    ''',
+]
+
+
+def init_sync(cursor: sqlite3.Cursor) -> None:
+    """Add revision/updated_at columns, the clock, tombstones and triggers (idempotent)."""
+    cursor.execute(CLOCK_TABLE_SQL)
+    cursor.execute(TOMBSTONES_TABLE_SQL)
+    cursor.execute('INSERT OR IGNORE INTO catalog_clock (id, revision) VALUES (1, 1)')
+    for table in ('catalog_pages', 'catalog_items'):
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+        if 'revision' not in columns:
+            # Existing rows start at revision 1, so a delta from 0 covers them
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN revision INTEGER NOT NULL DEFAULT 1')
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN updated_at TEXT')
+            cursor.execute(f'UPDATE {table} SET updated_at = {_NOW}')
+    for index_sql in SYNC_INDEX_SQL:
+        cursor.execute(index_sql)
+    for trigger_sql in SYNC_TRIGGERS_SQL:
+        cursor.execute(trigger_sql)
+
+
+def current_revision(conn: sqlite3.Connection) -> int:
+    row = conn.execute('SELECT revision FROM catalog_clock WHERE id = 1').fetchone()
+    return row[0] if row else 0
+
+
+def _page(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "page": row['page'],
+        "page_width": row['page_width'],
+        "page_height": row['page_height'],
+        "image_sha256": row['image_sha256'],
+        "revision": row['revision'],
+        "updated_at": row['updated_at'],
+    }
+
+
+def delta_export(conn: sqlite3.Connection, source_id: str, since: Optional[int] = None,
+                 since_time: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Pages, items and tombstones of `source_id` changed after revision `since`
+    (or after ISO timestamp `since_time`). All reads happen in one transaction
+    and are capped at the returned `revision`, the watermark for the next call.
+    """
+    if since is not None:
+        column, bound = 'revision', since
+    else:
+        column, bound = 'updated_at', since_time
+
+    conn.execute('BEGIN')
+    try:
+        upto = current_revision(conn)
+        pages = conn.execute(f'''
+            SELECT * FROM catalog_pages
+            WHERE source_id = ? AND {column} > ? AND revision <= ?
+            ORDER BY revision
+        ''', (source_id, bound, upto)).fetchall()
+        items = conn.execute(f'''
+            SELECT ci.*, cp.page AS page FROM catalog_items ci
+            JOIN catalog_pages cp ON cp.id = ci.page_id
+            WHERE cp.source_id = ? AND ci.{column} > ? AND ci.revision <= ?
+            ORDER BY ci.revision
+        ''', (source_id, bound, upto)).fetchall()
+        tombstones = conn.execute(f'''
+            SELECT kind, row_id, page, revision, deleted_at FROM catalog_tombstones
+            WHERE source_id = ? AND {'revision' if since is not None else 'deleted_at'} > ? AND revision <= ?
+            ORDER BY revision
+        ''', (source_id, bound, upto)).fetchall()
+    finally:
+        conn.rollback()
+
+    export_items = []
+    for row in items:
+        item = serialize_item(row)
+        item.update({"page": row['page'], "revision": row['revision'], "updated_at": row['updated_at']})
+        export_items.append(item)
+
+    return {
+        "source_id": source_id,
+        "mode": "delta",
+        "since": since if since is not None else since_time,
+        "revision": upto,
+        "pages": [_page(row) for row in pages],
+        "items": export_items,
+        "tombstones": [{
+            "kind": row['kind'],
+            "id": row['row_id'],
+            "page": row['page'],
+            "revision": row['revision'],
+            "deleted_at": row['deleted_at'],
+        } for row in tombstones],
+    }
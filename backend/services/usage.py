@@ -0,0 +1,224 @@
+import atexit
+import contextvars
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from services.metrics import current_route, record_usage
+
+logger = logging.getLogger(__name__)
+
+# Token/cost accounting for every OpenAI completion. Callers tag the current
+# request with `usage_context(session_id=..., source_id=..., extraction_id=...)`
+# and the vision/chat code calls `record_completion` after each completion.
+# Rows are queued and written to the `llm_usage` table in batches by a single
+# background thread so request threads never wait on SQLite for accounting.
+
+# USD per 1M tokens: (prompt, completion)
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+USAGE_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS llm_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        source_id TEXT,
+        extraction_id TEXT,
+        route TEXT,
+        call TEXT NOT NULL,
+        model TEXT NOT NULL,
+        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+        completion_tokens INTEGER NOT NULL DEFAULT 0,
+        cost_usd REAL NOT NULL DEFAULT 0,
+        latency_ms REAL NOT NULL,
+        created_at TEXT NOT NULL
+    )
+'''
+
+USAGE_INDEX_SQL = [
+    'CREATE INDEX IF NOT EXISTS idx_llm_usage_session ON llm_usage (session_id)',
+    'CREATE INDEX IF NOT EXISTS idx_llm_usage_source ON llm_usage (source_id)',
+    'CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage (created_at)',
+]
+
+_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar('usage_context', default={})
+
+
+@contextmanager
+def usage_context(**fields):
+    """Attach session/source/extraction ids to completions made in this block."""
+    merged = {**_context.get(), **{k: v for k, v in fields.items() if v is not None}}
+    token = _context.set(merged)
+    try:
+        yield merged
+    finally:
+        _context.reset(token)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimate USD cost of a completion from the static price table."""
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+class UsageWriter:
+    """Background thread that batches usage rows into SQLite."""
+
+    def __init__(self, db_path: str, batch_size: int = 50, flush_interval: float = 2.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[tuple]" = queue.Queue(maxsize=10000)
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="usage-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row: tuple) -> None:
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            logger.warning("Usage queue full, dropping usage record")
+
+    def _drain(self, first: Optional[tuple] = None) -> List[tuple]:
+        batch = [first] if first is not None else []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[tuple]) -> None:
+        if not batch:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                conn.executemany('''
+                    INSERT INTO llm_usage (
+                        session_id, source_id, extraction_id, route, call, model,
+                        prompt_tokens, completion_tokens, cost_usd, latency_ms, created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', batch)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to write {len(batch)} usage records: {e}")
+        finally:
+            self._done(batch)
+
+    def _done(self, batch: List[tuple]) -> None:
+        # Pairs with Queue.join() in flush()
+        for _ in batch:
+            self._queue.task_done()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            with self._flush_lock:
+                self._write(self._drain(first))
+
+    def flush(self) -> None:
+        """Write everything queued so far (used before aggregate reads)."""
+        with self._flush_lock:
+            while not self._queue.empty():
+                self._write(self._drain())
+        # The writer thread may hold rows it took off the queue before we got the lock
+        self._queue.join()
+
+
+_writer: Optional[UsageWriter] = None
+
+
+def configure_usage(db_path: str, batch_size: int = 50, flush_interval: float = 2.0) -> None:
+    """Start the usage writer for `db_path`. Without it only metrics are kept."""
+    global _writer
+    if _writer is None:
+        _writer = UsageWriter(db_path, batch_size, flush_interval)
+        atexit.register(_writer.flush)
+
+
+def flush_usage() -> None:
+    if _writer is not None:
+        _writer.flush()
+
+
+def record_completion(model: str, usage: Any, latency_s: float, call: str) -> None:
+    """Record one completion's tokens, cost and latency."""
+    record_usage(model, usage, call)
+    if _writer is None:
+        return
+
+    prompt = (getattr(usage, 'prompt_tokens', None) or 0) if usage is not None else 0
+    completion = (getattr(usage, 'completion_tokens', None) or 0) if usage is not None else 0
+    ctx = _context.get()
+    _writer.submit((
+        ctx.get('session_id'),
+        ctx.get('source_id'),
+        ctx.get('extraction_id'),
+        current_route(),
+        call,
+        model,
+        prompt,
+        completion,
+        estimate_cost(model, prompt, completion),
+        round(latency_s * 1000, 2),
+        datetime.utcnow().isoformat(),
+    ))
+
+
+_AGGREGATE_COLUMNS = '''
+    COUNT(*) AS calls,
+    COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+    COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+    COALESCE(SUM(cost_usd), 0) AS cost_usd,
+    COALESCE(AVG(latency_ms), 0) AS avg_latency_ms,
+    COALESCE(MAX(latency_ms), 0) AS max_latency_ms,
+    COALESCE(SUM(call = 'repair'), 0) AS repair_calls,
+    COALESCE(SUM(call = 'tool_round_trip'), 0) AS tool_round_trips
+'''
+
+
+def _rows(cursor) -> List[Dict[str, Any]]:
+    columns = [c[0] for c in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def usage_by_key(conn: sqlite3.Connection, column: str, value: str) -> Dict[str, Any]:
+    """Aggregate usage for one session_id or source_id, with a per-call breakdown."""
+    if column not in ('session_id', 'source_id'):
+        raise ValueError(f"Unsupported usage key: {column}")
+    flush_usage()
+    totals = _rows(conn.execute(f'SELECT {_AGGREGATE_COLUMNS} FROM llm_usage WHERE {column} = ?', (value,)))[0]
+    by_call = _rows(conn.execute(f'''
+        SELECT call, model, {_AGGREGATE_COLUMNS}
+        FROM llm_usage WHERE {column} = ?
+        GROUP BY call, model ORDER BY cost_usd DESC
+    ''', (value,)))
+    extractions = _rows(conn.execute(f'''
+        SELECT extraction_id, {_AGGREGATE_COLUMNS}
+        FROM llm_usage WHERE {column} = ? AND extraction_id IS NOT NULL
+        GROUP BY extraction_id ORDER BY cost_usd DESC LIMIT 100
+    ''', (value,)))
+    return {column: value, "totals": totals, "by_call": by_call, "extractions": extractions}
+
+
+def usage_by_day(conn: sqlite3.Connection, days: int = 30) -> List[Dict[str, Any]]:
+    """Aggregate usage per UTC day for the last `days` days."""
+    flush_usage()
+    since = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    return _rows(conn.execute(f'''
+        SELECT substr(created_at, 1, 10) AS day, {_AGGREGATE_COLUMNS}
+        FROM llm_usage WHERE created_at >= ?
+        GROUP BY day ORDER BY day DESC
+    ''', (since,)))
@@ -1,58 +1,111 @@
 import os
-import base64
 import json
+import logging
 import re
+import time
 from typing import Optional, List, Dict, Any, Union
 from openai import OpenAI
-from pydantic import BaseModel, Field, ValidationError, ConfigDict
+from openai.types.chat import ChatCompletion
+from pydantic import BaseModel, Field, ValidationError, ConfigDict, TypeAdapter, field_validator
 from dotenv import load_dotenv
 
+from services.openai_client import get_openai_client
+from services.hedging import hedged
+from services.imaging import ImagePoolBusy
+from services.metrics import stage
+from services.vision.payload import IMAGE_URL, VisionBody
+from services.usage import record_completion
+
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-_client: Optional[OpenAI] = None
+logger = logging.getLogger(__name__)
 
 def _get_client() -> OpenAI:
-    """Get or initialize OpenAI client with error handling."""
-    global _client
-    if _client is None:
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not found in environment variables")
-        _client = OpenAI(api_key=api_key)
-    return _client
-
-# Canonical schema models
+    """Get the shared, pooled OpenAI client."""
+    return get_openai_client()
+
+def _strip_or_none(value: Any) -> Any:
+    """Trim strings, turning empty ones into None; leave other values alone."""
+    if isinstance(value, str):
+        return value.strip() or None
+    return value
+
+# Canonical schema models. The field validators carry the normalization rules
+# (money parsing, trimming, tag splitting, defaults) so raw model output can be
+# validated in a single pass with MENU_ADAPTER.validate_json.
 class Price(BaseModel):
     value: Optional[float] = None
     currency: str = "MYR"
 
+    @field_validator("value", mode="before")
+    @classmethod
+    def _normalize_value(cls, value: Any) -> Optional[float]:
+        return normalize_money(value)
+
 class Size(BaseModel):
     value: Optional[float] = None
     unit: Optional[str] = None
 
+    @field_validator("value", mode="before")
+    @classmethod
+    def _normalize_value(cls, value: Any) -> Optional[float]:
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return None
+
+    @field_validator("unit", mode="before")
+    @classmethod
+    def _normalize_unit(cls, value: Any) -> Any:
+        return _strip_or_none(value)
+
 class Item(BaseModel):
     name: str
-    price: Price
+    price: Price = Field(default_factory=Price)
     size: Size = Field(default_factory=Size)
     desc: Optional[str] = None
     tags: Optional[List[str]] = None
     extras: Dict[str, Any] = Field(default_factory=dict)
 
+    @field_validator("name", "desc", mode="before")
+    @classmethod
+    def _trim(cls, value: Any) -> Any:
+        return _strip_or_none(value)
+
+    @field_validator("tags", mode="before")
+    @classmethod
+    def _normalize_tags(cls, value: Any) -> Any:
+        if isinstance(value, str):
+            # Split comma-separated string
+            value = [tag.strip() for tag in value.split(",") if tag.strip()]
+        elif isinstance(value, list):
+            value = [str(tag).strip() for tag in value if str(tag).strip()]
+        return value or None
+
 class Section(BaseModel):
     name: Optional[str] = None
     time: Optional[str] = None
     items: List[Item] = Field(default_factory=list)
 
+    @field_validator("name", "time", mode="before")
+    @classmethod
+    def _trim(cls, value: Any) -> Any:
+        return _strip_or_none(value)
+
 class MenuDoc(BaseModel):
-    source: str
-    sections: List[Section]
+    source: str = "Unknown"
+    sections: List[Section] = Field(default_factory=list)
     meta: Dict[str, Any] = Field(default_factory=dict)
     schema: Dict[str, str] = Field(default_factory=lambda: {"name": "canta.menu", "version": "1.0"})
     
     model_config = ConfigDict(extra="ignore")
 
+# Built once; validate_json parses and validates raw model output in one pass
+MENU_ADAPTER = TypeAdapter(MenuDoc)
+
 # Prompts
 EXTRACT_PROMPT = """
 Analyze this menu/catalog image and extract the information as JSON following the "canta.menu v1" schema exactly.
@@ -102,36 +155,50 @@ Error:
 Return ONLY valid JSON following the canta.menu v1 schema. No commentary.
 """
 
-def _b64(file_bytes: bytes, mime: str) -> str:
-    """Convert image bytes to base64 data URL."""
-    encoded = base64.b64encode(file_bytes).decode('utf-8')
-    return f"data:{mime};base64,{encoded}"
+VISION_MODEL = "gpt-4o-mini"
 
-def _call_vision(prompt: str, data_url: str, max_tokens: int = 1000) -> str:
-    """Call GPT-4o Vision API with image."""
+def _call_vision(prompt: str, image_bytes: bytes, mime: str, max_tokens: int = 1000, call: str = "vision",
+                 detail: str = "auto") -> str:
+    """Call GPT-4o Vision API with image at the given detail level (low/high/auto)."""
     try:
         client = _get_client()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": data_url}}
-                    ]
-                }
-            ],
-            max_tokens=max_tokens,
-            temperature=0.1
-        )
+
+        def send() -> ChatCompletion:
+            # The data URL is encoded while the body is sent, never held as a whole string.
+            # Each attempt gets its own body so a hedge can stream it alongside the first
+            body = VisionBody({
+                "model": VISION_MODEL,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": prompt},
+                            {"type": "image_url", "image_url": {"url": IMAGE_URL, "detail": detail}}
+                        ]
+                    }
+                ],
+                "max_tokens": max_tokens,
+                "temperature": 0.1
+            }, image_bytes, mime)
+            return client.post("/chat/completions", cast_to=ChatCompletion, content=body)
+
+        def discard(loser: ChatCompletion, elapsed: float) -> None:
+            record_completion(VISION_MODEL, loser.usage, elapsed, "hedge_loser")
+
+        started = time.perf_counter()
+        with stage('upstream_call'):
+            response = hedged(f"{call}:{detail}", send, discard)
+        record_completion(VISION_MODEL, response.usage, time.perf_counter() - started, call)
         content = response.choices[0].message.content.strip()
-        print(f"DEBUG: Raw API response: {content[:500]}...")  # Log first 500 chars
+        logger.debug("Raw API response: %.500s...", content)
         return content
     except Exception as e:
-        print(f"DEBUG: Vision API call failed: {e}")
+        logger.debug("Vision API call failed: %s", e)
         raise RuntimeError(f"Vision API call failed: {e}") from e
 
+_MONEY_STRIP_RE = re.compile(r'[RM\s$€£¥₹]')
+_MONEY_NUMBER_RE = re.compile(r'(\d+(?:\.\d+)?)')
+
 def normalize_money(value: Union[str, int, float, None]) -> Optional[float]:
     """Normalize money values to float with 2 decimal places."""
     if value is None:
@@ -142,16 +209,22 @@ def normalize_money(value: Union[str, int, float, None]) -> Optional[float]:
     
     if isinstance(value, str):
         # Remove RM, currency symbols, whitespace
-        cleaned = re.sub(r'[RM\s$€£¥₹]', '', value.strip())
+        cleaned = _MONEY_STRIP_RE.sub('', value.strip())
         # Extract number
-        match = re.search(r'(\d+(?:\.\d+)?)', cleaned)
+        match = _MONEY_NUMBER_RE.search(cleaned)
         if match:
             return round(float(match.group(1)), 2)
     
     return None
 
 def normalize_menu(data: Dict[str, Any]) -> Dict[str, Any]:
-    """Normalize and clean menu data."""
+    """
+    Normalize and clean menu data in place.
+
+    parse_and_validate no longer calls this (the same rules live in the model
+    validators); it is kept for dict inputs and as the reference behaviour
+    checked by benchmarks/check_equivalence.py.
+    """
     if not isinstance(data, dict):
         return data
     
@@ -226,41 +299,31 @@ def normalize_menu(data: Dict[str, Any]) -> Dict[str, Any]:
     
     return data
 
+def strip_code_fence(raw_json: str) -> str:
+    """Remove a surrounding ```json markdown fence if present."""
+    cleaned = raw_json.strip()
+    if cleaned.startswith("```json"):
+        cleaned = cleaned[7:]
+    if cleaned.endswith("```"):
+        cleaned = cleaned[:-3]
+    return cleaned.strip()
+
 def parse_and_validate(raw_json: str) -> Dict[str, Any]:
     """Parse and validate JSON response against canonical schema."""
+    logger.debug("Attempting to parse JSON: %.200s...", raw_json)
+    with stage('parse'):
+        cleaned = strip_code_fence(raw_json)
+    
     try:
-        print(f"DEBUG: Attempting to parse JSON: {raw_json[:200]}...")
-        
-        # Clean the response - remove markdown code blocks if present
-        cleaned = raw_json.strip()
-        if cleaned.startswith("```json"):
-            cleaned = cleaned[7:]
-        if cleaned.endswith("```"):
-            cleaned = cleaned[:-3]
-        cleaned = cleaned.strip()
-        
-        print(f"DEBUG: Cleaned JSON: {cleaned[:200]}...")
-        
-        # Parse JSON
-        data = json.loads(cleaned)
-        print(f"DEBUG: Successfully parsed JSON, keys: {list(data.keys()) if isinstance(data, dict) else type(data)}")
-        
-        # Normalize and validate
-        normalized = normalize_menu(data)
-        validated = MenuDoc(**normalized)
-        
-        return validated.model_dump()
-        
-    except json.JSONDecodeError as e:
-        print(f"DEBUG: JSON decode error: {e}")
-        print(f"DEBUG: Raw content that failed: '{raw_json}'")
-        raise ValueError(f"Invalid JSON response: {e}")
+        # Parse, normalize and validate in a single pass over the raw string
+        with stage('validate'):
+            return MENU_ADAPTER.validate_json(cleaned).model_dump()
     except ValidationError as e:
-        print(f"DEBUG: Pydantic validation error: {e}")
+        if any(error["type"] == "json_invalid" for error in e.errors()):
+            logger.debug("JSON decode error: %s", e)
+            raise ValueError(f"Invalid JSON response: {e}")
+        logger.debug("Pydantic validation error: %s", e)
         raise ValueError(f"Schema validation failed: {e}")
-    except Exception as e:
-        print(f"DEBUG: Unexpected error: {e}")
-        raise
 
 def build_repair_prompt(original_json_text: str, error_text: str) -> str:
     """Build repair prompt for failed validation."""
@@ -269,13 +332,18 @@ def build_repair_prompt(original_json_text: str, error_text: str) -> str:
         error_text=error_text
     )
 
-def extract_menu(image_bytes: bytes, mime: str = "image/png") -> Dict[str, Any]:
+def extract_menu(image_bytes: bytes, mime: str = "image/png", prompt: str = EXTRACT_PROMPT,
+                 detail: str = "auto", max_tokens: int = 3000, call: str = "vision") -> Dict[str, Any]:
     """
     Extract menu/catalog data from image using GPT-4o Vision.
     
     Args:
         image_bytes: Raw image data
         mime: MIME type (e.g., 'image/png', 'image/jpeg')
+        prompt: Extraction prompt (tiles add bbox instructions to the default)
+        detail: Image detail level sent to the model ('low', 'high' or 'auto')
+        max_tokens: Completion budget for the extraction and the repair call
+        call: Usage call type recorded for the first attempt
     
     Returns:
         Validated menu document following canta.menu v1 schema
@@ -283,34 +351,38 @@ def extract_menu(image_bytes: bytes, mime: str = "image/png") -> Dict[str, Any]:
     Raises:
         RuntimeError: If extraction fails after repair attempt
     """
-    # Convert to data URL
-    data_url = _b64(image_bytes, mime)
-    
     # First attempt
     try:
-        raw = _call_vision(EXTRACT_PROMPT, data_url, max_tokens=3000)
+        raw = _call_vision(prompt, image_bytes, mime, max_tokens=max_tokens, call=call, detail=detail)
         return parse_and_validate(raw)
     except Exception as e1:
         # Attempt repair
         try:
-            repair_prompt = build_repair_prompt(
-                original_json_text=raw if 'raw' in locals() else "No JSON returned",
-                error_text=str(e1)
-            )
-            repaired = _call_vision(repair_prompt, data_url, max_tokens=3000)
-            return parse_and_validate(repaired)
+            with stage('repair'):
+                repair_prompt = build_repair_prompt(
+                    original_json_text=raw if 'raw' in locals() else "No JSON returned",
+                    error_text=str(e1)
+                )
+                repaired = _call_vision(repair_prompt, image_bytes, mime, max_tokens=max_tokens, call="repair",
+                                        detail=detail)
+                return parse_and_validate(repaired)
         except Exception as e2:
             raise RuntimeError(f"Extraction failed after repair: {e2}") from e2
 
 # Compatibility functions for existing Flask backend
-def detect_boxes(file_bytes: bytes, mime_type: str) -> str:
+def detect_boxes(file_bytes: bytes, mime_type: str, tiling: str = "off") -> str:
     """
     Compatibility wrapper for the old detect_boxes function.
     Now uses the new extract_menu function but returns simple format.
+    tiling: "off", "auto" (tile pages above the size threshold) or "on".
     """
     try:
-        # Use the new extract_menu function
-        menu_data = extract_menu(file_bytes, mime_type)
+        if tiling == "off":
+            from services.vision.routing import extract_menu_routed
+            menu_data = extract_menu_routed(file_bytes, mime_type)
+        else:
+            from services.vision.tiling import extract_menu_tiled
+            menu_data = extract_menu_tiled(file_bytes, mime_type, force=tiling == "on")
         
         # Convert to simple format expected by frontend
         description_parts = []
@@ -350,6 +422,8 @@ def detect_boxes(file_bytes: bytes, mime_type: str) -> str:
         
         return json.dumps(response)
         
+    except ImagePoolBusy:
+        raise
     except Exception as e:
         error_response = {
             "description": f"Error: {str(e)}",
@@ -364,8 +438,9 @@ def extract_item(file_bytes: bytes, mime_type: str) -> str:
     Now uses the new extract_menu function but focuses on first item.
     """
     try:
-        # Use the new extract_menu function
-        menu_data = extract_menu(file_bytes, mime_type)
+        # Single-item crops are routed to the cheap item prompt first
+        from services.vision.routing import extract_menu_routed
+        menu_data = extract_menu_routed(file_bytes, mime_type, hint="crop")
         
         # Find the first item
         first_item = None
@@ -405,6 +480,8 @@ def extract_item(file_bytes: bytes, mime_type: str) -> str:
         
         return json.dumps(response)
         
+    except ImagePoolBusy:
+        raise
     except Exception as e:
         error_response = {
             "description": f"Error: {str(e)}",
@@ -418,7 +495,7 @@ if __name__ == "__main__":
     import sys
     
     if len(sys.argv) < 2:
-        print("Usage: python backend/services/vision/gpt4o.py <image_path>")
+        print("Usage: cd backend && python -m services.vision.gpt4o <image_path>")
         sys.exit(1)
     
     path = sys.argv[1]
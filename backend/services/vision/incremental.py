@@ -0,0 +1,137 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.imaging import ImagePoolBusy, diff_tiles, handoff, handoff_dir, run_image_job
+from services.metrics import stage
+from services.vision.tiling import (
+    TILE_OVERLAP,
+    TILE_WORKERS,
+    _PIL_FORMATS,
+    Tile,
+    _extract_tile,
+    _page_bbox,
+    merge_tile_menus,
+    plan_tiles,
+)
+
+logger = logging.getLogger(__name__)
+
+# Incremental re-extraction of a stored catalog page. The page is cut into a
+# grid of VISION_DIFF_TILE_SIZE tiles and each tile gets a perceptual
+# signature: the grey level of every VISION_DIFF_CELL-pixel block. A tile is
+# sent to the vision model again only if one of its blocks moved by more
+# than VISION_DIFF_TOLERANCE levels since it was last extracted. A 64-bit
+# aHash or dHash of a 1024px tile does not change when one price does, so
+# the blocks are about the size of a stroke of small print. A page whose
+# size changed gets a new grid, so every tile is extracted again.
+
+DIFF_TILE_SIZE = int(os.getenv('VISION_DIFF_TILE_SIZE', '1024'))
+DIFF_CELL = int(os.getenv('VISION_DIFF_CELL', '8'))
+DIFF_TOLERANCE = int(os.getenv('VISION_DIFF_TOLERANCE', '12'))
+DEFAULT_CONFIDENCE = 0.5
+
+
+@dataclass
+class TileDiff:
+    tiles: List[Tile]
+    signatures: List[bytes]
+    refreshed: List[int] = field(default_factory=list)
+    failed: List[int] = field(default_factory=list)
+    menu: Optional[Dict[str, Any]] = None
+    duplicates: int = 0
+
+    @property
+    def boxes(self) -> List[Tuple[int, int, int, int]]:
+        return [(tile.x, tile.y, tile.width, tile.height) for tile in self.tiles]
+
+
+def _with_tile_boxes(tile: Tile, menu: Dict[str, Any]) -> Dict[str, Any]:
+    # Items the model gave no usable box (missing, non-numeric, empty or off
+    # the tile, i.e. anything merge_tile_menus would drop) are placed on the
+    # whole tile, so they are owned by it and always reach the catalog with a box
+    for section in menu.get('sections', []):
+        for item in section.get('items', []):
+            if _page_bbox(item, tile) is None:
+                item['extras']['bbox'] = [0, 0, tile.width, tile.height]
+    return menu
+
+
+def extract_changed_tiles(image_bytes: bytes, mime: str, width: int, height: int,
+                          previous: Dict[Tuple[int, int, int, int], bytes]) -> TileDiff:
+    """
+    Sign every tile of a width x height page and extract the ones whose
+    signature differs from `previous` (stored signatures by tile box).
+    """
+    fmt = _PIL_FORMATS.get(mime, 'PNG')
+    tiles = plan_tiles(width, height, DIFF_TILE_SIZE, TILE_OVERLAP)
+    boxes = [(tile.x, tile.y, tile.width, tile.height) for tile in tiles]
+    with stage('tile_diff'), handoff(image_bytes) as path, handoff_dir() as out_dir:
+        signatures, paths = run_image_job(diff_tiles, path, fmt, boxes, [previous.get(box) for box in boxes],
+                                          DIFF_CELL, DIFF_TOLERANCE, out_dir)
+        changed = []
+        for tile, tile_path in zip(tiles, paths):
+            if tile_path is not None:
+                with open(tile_path, 'rb') as f:
+                    tile.image_bytes = f.read()
+                changed.append(tile)
+    diff = TileDiff(tiles, signatures)
+    if not changed:
+        return diff
+    logger.info("Re-extracting %d of %d tiles of a %dx%d page", len(changed), len(tiles), width, height)
+
+    # Each worker runs in a copy of the caller's context so usage accounting
+    # and route labels follow the tile calls
+    results: List[Tuple[Tile, Dict[str, Any]]] = []
+    busy: Optional[ImagePoolBusy] = None
+    with ThreadPoolExecutor(max_workers=max(1, min(TILE_WORKERS, len(changed)))) as pool:
+        futures = [(tile, pool.submit(contextvars.copy_context().run, _extract_tile, tile, mime))
+                   for tile in changed]
+        for tile, future in futures:
+            try:
+                results.append((tile, _with_tile_boxes(tile, future.result())))
+                diff.refreshed.append(tile.index)
+            except Exception as e:
+                logger.warning("Tile %d extraction failed: %s", tile.index, e)
+                diff.failed.append(tile.index)
+                if isinstance(e, ImagePoolBusy):
+                    busy = e
+
+    if busy is not None and not results:
+        # Nothing was stored yet, so the same tiles differ on the retry
+        raise busy
+    if results:
+        with stage('tile_merge'):
+            diff.menu, diff.duplicates = merge_tile_menus(results)
+    return diff
+
+
+def catalog_items(menu: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Flatten a merged tile menu into catalog_items values (bbox in page pixels)."""
+    items = []
+    for section in (menu or {}).get('sections', []):
+        for item in section.get('items', []):
+            price, size = item['price'], item['size']
+            raw_text = ' '.join(part for part in (
+                item['name'], item.get('desc'),
+                f"{price.get('currency') or 'MYR'}{price['value']:.2f}" if price.get('value') is not None else None,
+            ) if part)
+            try:
+                confidence = min(1.0, max(0.0, float(item['extras'].get('confidence', DEFAULT_CONFIDENCE))))
+            except (TypeError, ValueError):
+                confidence = DEFAULT_CONFIDENCE
+            items.append({
+                "bbox": [int(v) for v in item['extras']['bbox']],
+                "name": item['name'],
+                "price_value": price.get('value'),
+                "price_currency": price.get('currency') or 'MYR',
+                "size_value": size.get('value'),
+                "size_unit": size.get('unit'),
+                "tags": item.get('tags'),
+                "raw_text": raw_text,
+                "confidence": confidence,
+            })
+    return items
@@ -0,0 +1,93 @@
+import base64
+import io
+import json
+import math
+import os
+from typing import Any, Dict
+
+from PIL import Image
+
+# Request bodies for vision calls. The image travels as a base64 data URL
+# inside the chat-completions JSON; building that as a string (b64encode,
+# decode, f-string, then the SDK's json.dumps and .encode()) holds four or
+# five 1.33x copies of the image per call. VisionBody renders the JSON around
+# a placeholder once and base64-encodes the image slice by slice as the HTTP
+# client reads the body, so the caller's bytes are the only full copy. It is
+# seekable, which gives httpx a Content-Length and lets the SDK rewind it
+# for retries.
+
+IMAGE_URL = "canta:image"   # placeholder for the data URL in a request payload
+
+_SLICE_BYTES = 48 * 1024    # raw image bytes encoded per step (a multiple of 3)
+
+
+def estimate_prompt_tokens(prompt: str, image: bytes, detail: str = "auto") -> int:
+    """
+    Prompt tokens of a one-image vision call, for calls whose usage never
+    arrives (a closed stream). Text is counted at ~4 characters a token.
+    The image is priced the way the API bills it: 85 tokens at low detail.
+    Otherwise the image is fit in 2048px with its short side at most 768px,
+    and costs 85 plus 170 per 512px tile.
+    """
+    tokens = len(prompt) // 4
+    if detail == "low":
+        return tokens + 85
+    with Image.open(io.BytesIO(image)) as opened:
+        width, height = opened.size
+    scale = min(1.0, 2048 / max(width, height), 768 / max(1, min(width, height)))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return tokens + 85 + 170 * tiles
+
+
+class VisionBody(io.RawIOBase):
+    """A JSON request body whose IMAGE_URL placeholder reads as the image's data URL."""
+
+    def __init__(self, payload: Dict[str, Any], image: bytes, mime: str):
+        text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        before, after = text.split(json.dumps(IMAGE_URL), 1)
+        # json.dumps of the prefix escapes anything odd in a client-supplied mime type
+        self._head = (before + json.dumps(f"data:{mime};base64,")[:-1]).encode("utf-8")
+        self._tail = ('"' + after).encode("utf-8")
+        self._image = memoryview(image)
+        self._encoded = 4 * ((len(image) + 2) // 3)
+        self._size = len(self._head) + self._encoded + len(self._tail)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, buffer) -> int:
+        out = memoryview(buffer).cast("B")
+        written = 0
+        while written < len(out) and self._pos < self._size:
+            chunk = self._chunk(self._pos, len(out) - written)
+            out[written:written + len(chunk)] = chunk
+            written += len(chunk)
+            self._pos += len(chunk)
+        return written
+
+    def _chunk(self, pos: int, limit: int) -> bytes:
+        if pos < len(self._head):
+            return self._head[pos:pos + limit]
+        pos -= len(self._head)
+        if pos >= self._encoded:
+            pos -= self._encoded
+            return self._tail[pos:pos + limit]
+        # Every 3 image bytes become 4 characters, so any window of the
+        # encoding can be produced from the matching window of the image
+        limit = min(limit, self._encoded - pos, _SLICE_BYTES // 3 * 4)
+        start = pos // 4 * 3
+        end = -(-(pos + limit) // 4) * 3
+        encoded = base64.b64encode(self._image[start:end])
+        return encoded[pos % 4:pos % 4 + limit]
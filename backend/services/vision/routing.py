@@ -0,0 +1,203 @@
+import logging
+import os
+from dataclasses import asdict, dataclass, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from services.imaging import handoff, measure_page, run_image_job
+from services.vision.gpt4o import (
+    EXTRACT_PROMPT,
+    _call_vision,
+    extract_menu,
+    parse_and_validate,
+)
+
+logger = logging.getLogger(__name__)
+
+# Cost/latency-aware routing of vision requests. The image is sized up once
+# (dimensions, edge-density estimate of how much text it carries, crop vs
+# page) and a policy picks the detail level, max_tokens and prompt variant.
+# Cheap routes escalate to a richer one when validation or the confidence
+# check fails.
+
+DEFAULT_POLICY = os.getenv('VISION_ROUTING_POLICY', 'adaptive')
+MAX_ESCALATIONS = int(os.getenv('VISION_MAX_ESCALATIONS', '2'))
+
+CROP_MAX_SIDE = 900         # px; anything smaller on its longest side is a crop
+CROP_MAX_MEGAPIXELS = 0.6
+DENSE_TEXT = 0.18           # edge density above which an image is text-heavy
+SPARSE_TEXT = 0.06
+MAX_TOKENS_CEILING = 4096
+MISSING_PRICE_LIMIT = 0.5   # page results with more unpriced items than this escalate
+
+ITEM_PROMPT_ADDENDUM = """
+This image is a crop showing a single product or menu item.
+- Return one section (name null) containing exactly that item
+- Put any printed promotion, pack size or variant text under item.extras
+"""
+
+PROMPTS = {
+    "page": EXTRACT_PROMPT,
+    "item": EXTRACT_PROMPT + ITEM_PROMPT_ADDENDUM,
+}
+
+
+@dataclass
+class ImageProfile:
+    width: int
+    height: int
+    megapixels: float
+    text_density: float
+    kind: str               # 'crop' or 'page'
+
+
+@dataclass
+class RouteDecision:
+    detail: str             # 'low', 'high' or 'auto'
+    max_tokens: int
+    prompt: str             # key into PROMPTS
+    reason: str
+
+
+def profile_image(image_bytes: bytes, hint: Optional[str] = None) -> ImageProfile:
+    """
+    Size up an upload without calling the model.
+
+    text_density is the share of strong edges in a 256px grayscale thumbnail,
+    a cheap proxy for how much printed text the model has to read. `hint`
+    ('crop' or 'page') overrides the size-based kind when the caller knows.
+    """
+    # Decoding runs in the image worker pool, off the request thread's GIL
+    with handoff(image_bytes) as path:
+        width, height, density = run_image_job(measure_page, path)
+    megapixels = width * height / 1_000_000
+    kind = hint or ('crop' if max(width, height) <= CROP_MAX_SIDE or megapixels <= CROP_MAX_MEGAPIXELS
+                    else 'page')
+    return ImageProfile(width, height, round(megapixels, 3), round(density, 4), kind)
+
+
+def fixed_policy(profile: ImageProfile) -> RouteDecision:
+    """The pre-routing behaviour: default detail, 3000 tokens, page prompt, no escalation."""
+    return RouteDecision("auto", 3000, "page", "fixed")
+
+
+def adaptive_policy(profile: ImageProfile) -> RouteDecision:
+    if profile.kind == 'crop':
+        if profile.text_density >= DENSE_TEXT:
+            return RouteDecision("high", 800, "item", "text-heavy crop")
+        return RouteDecision("low", 600, "item", "crop")
+    if profile.text_density >= DENSE_TEXT:
+        return RouteDecision("high", MAX_TOKENS_CEILING, "page", "dense page")
+    if profile.text_density < SPARSE_TEXT:
+        return RouteDecision("high", 1500, "page", "sparse page")
+    return RouteDecision("high", 3000, "page", "page")
+
+
+def economy_policy(profile: ImageProfile) -> RouteDecision:
+    """Always start at low detail and rely on escalation."""
+    if profile.kind == 'crop':
+        return RouteDecision("low", 600, "item", "economy crop")
+    return RouteDecision("low", 1500, "page", "economy page")
+
+
+POLICIES: Dict[str, Callable[[ImageProfile], RouteDecision]] = {
+    "fixed": fixed_policy,
+    "adaptive": adaptive_policy,
+    "economy": economy_policy,
+}
+
+
+def escalate(decision: RouteDecision, profile: ImageProfile) -> Optional[RouteDecision]:
+    """Next, richer route after a failed attempt, or None at the top of the ladder."""
+    if decision.reason == "fixed":
+        return None
+    if decision.detail != "high":
+        floor = 800 if profile.kind == 'crop' else 3000
+        return replace(decision, detail="high", max_tokens=max(decision.max_tokens, floor),
+                       reason="escalated: high detail")
+    if decision.max_tokens < MAX_TOKENS_CEILING:
+        return replace(decision, max_tokens=MAX_TOKENS_CEILING, reason="escalated: token ceiling")
+    return None
+
+
+def _item_count(menu: Dict[str, Any]) -> int:
+    return sum(len(section.get('items', [])) for section in menu.get('sections', []))
+
+
+def low_confidence(menu: Dict[str, Any], profile: ImageProfile) -> Optional[str]:
+    """Reason the result looks unreliable, or None when it passes."""
+    items = [item for section in menu.get('sections', []) for item in section.get('items', [])]
+    if not items:
+        return "no items"
+    if profile.kind == 'page':
+        missing = sum(1 for item in items if item['price'].get('value') is None)
+        if missing / len(items) > MISSING_PRICE_LIMIT:
+            return "missing prices"
+    return None
+
+
+def _attempt(image_bytes: bytes, mime: str, decision: RouteDecision,
+             call: str, last: bool) -> Dict[str, Any]:
+    prompt = PROMPTS[decision.prompt]
+    if last:
+        # Only the final rung pays for a repair call; earlier rungs escalate instead
+        return extract_menu(image_bytes, mime, prompt=prompt, detail=decision.detail,
+                            max_tokens=decision.max_tokens, call=call)
+    raw = _call_vision(prompt, image_bytes, mime, max_tokens=decision.max_tokens, call=call,
+                       detail=decision.detail)
+    return parse_and_validate(raw)
+
+
+def extract_menu_routed(image_bytes: bytes, mime: str = "image/png", policy: Optional[str] = None,
+                        hint: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract a menu with the route picked by `policy` (default VISION_ROUTING_POLICY).
+
+    Attempts that fail validation or the confidence check escalate up to
+    MAX_ESCALATIONS times; if every attempt is low-confidence the result with
+    the most items is returned. The attempts are reported under meta.routing.
+    """
+    policy = policy or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown routing policy: {policy}")
+    profile = profile_image(image_bytes, hint)
+    return climb_routes(image_bytes, mime, policy, profile, POLICIES[policy](profile))
+
+
+def climb_routes(image_bytes: bytes, mime: str, policy: str, profile: ImageProfile,
+                 decision: Optional[RouteDecision], attempts: Optional[List[Dict[str, Any]]] = None,
+                 best: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Run `decision` and escalate from it as extract_menu_routed does.
+
+    `attempts` and `best` carry rungs the caller already ran itself (the
+    streamed first attempt), so they count towards MAX_ESCALATIONS and its
+    result still competes for the most items.
+    """
+    attempts = list(attempts or [])
+    ranked: Optional[Tuple[int, Dict[str, Any]]] = (_item_count(best), best) if best is not None else None
+    error: Optional[Exception] = None
+    while decision is not None:
+        following = escalate(decision, profile) if len(attempts) < MAX_ESCALATIONS else None
+        call = "vision" if not attempts else "escalation"
+        try:
+            menu = _attempt(image_bytes, mime, decision, call, last=following is None)
+        except Exception as e:
+            logger.info("Route %s failed (%s), escalating", decision.reason, e)
+            attempts.append({**asdict(decision), "outcome": "invalid"})
+            error = e
+            decision = following
+            continue
+        reason = low_confidence(menu, profile)
+        attempts.append({**asdict(decision), "outcome": reason or "ok"})
+        if ranked is None or _item_count(menu) > ranked[0]:
+            ranked = (_item_count(menu), menu)
+        if reason is None:
+            break
+        logger.info("Route %s gave a low-confidence result (%s), escalating", decision.reason, reason)
+        decision = following
+
+    if ranked is None:
+        raise RuntimeError(f"Extraction failed on every route: {error}") from error
+    menu = ranked[1]
+    menu['meta']['routing'] = {"policy": policy, "profile": asdict(profile), "attempts": attempts}
+    return menu
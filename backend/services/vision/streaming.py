@@ -0,0 +1,304 @@
+import json
+import logging
+import time
+from dataclasses import asdict
+from typing import Any, Dict, Iterator, List, Optional
+
+from openai import Stream
+from openai.types import CompletionUsage
+from openai.types.chat import ChatCompletionChunk
+from pydantic import TypeAdapter, ValidationError
+
+from services.hedging import hedged
+from services.usage import record_completion
+from services.vision.payload import IMAGE_URL, VisionBody, estimate_prompt_tokens
+from services.vision.gpt4o import (
+    EXTRACT_PROMPT,
+    VISION_MODEL,
+    Item,
+    _call_vision,
+    _get_client,
+    build_repair_prompt,
+    parse_and_validate,
+)
+from services.vision.routing import (
+    DEFAULT_POLICY,
+    MAX_ESCALATIONS,
+    POLICIES,
+    PROMPTS,
+    ImageProfile,
+    climb_routes,
+    escalate,
+    low_confidence,
+)
+from services.vision.tiling import extract_menu_tiled, needs_tiling
+
+logger = logging.getLogger(__name__)
+
+ITEM_ADAPTER = TypeAdapter(Item)
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "start", "expect_key", "pending_key")
+
+    def __init__(self, kind: str, key: Optional[str], start: int):
+        self.kind = kind            # 'obj' or 'arr'
+        self.key = key              # key this container sits under in its parent object
+        self.start = start          # offset of the opening brace/bracket
+        self.expect_key = kind == "obj"
+        self.pending_key: Optional[str] = None
+
+
+class IncrementalMenuParser:
+    """
+    Incremental scanner for canta.menu JSON as the model streams it.
+
+    feed() returns events as soon as they are complete:
+        {"type": "section", "index": i, "name": ..., "time": ...}
+        {"type": "item", "section": i, "index": j, "item": {...validated Item...}}
+    Only the structure (strings, braces, brackets) is tracked; each finished
+    item object is sliced out of the buffer and validated on its own.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._started = False
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._section_index = -1
+        self._section_meta: Dict[str, Any] = {}
+        self._section_announced = False
+        self._item_index = 0
+
+    # Path helpers: root obj > "sections" arr > section obj > "items" arr > item obj
+    def _is_section(self, depth: int) -> bool:
+        return (depth == 3 and self._stack[1].kind == "arr" and self._stack[1].key == "sections"
+                and self._stack[2].kind == "obj")
+
+    def _is_items(self, depth: int) -> bool:
+        return depth == 4 and self._is_section(3) and self._stack[3].kind == "arr" and self._stack[3].key == "items"
+
+    def _is_item(self, depth: int) -> bool:
+        return depth == 5 and self._is_items(4) and self._stack[4].kind == "obj"
+
+    def _announce_section(self, events: List[Dict[str, Any]]) -> None:
+        if not self._section_announced:
+            self._section_announced = True
+            events.append({
+                "type": "section",
+                "index": self._section_index,
+                "name": self._section_meta.get("name"),
+                "time": self._section_meta.get("time"),
+            })
+
+    def _on_string(self, literal: str) -> None:
+        if not self._stack:
+            return
+        top = self._stack[-1]
+        if top.kind != "obj":
+            return
+        if top.expect_key:
+            top.pending_key = json.loads(literal)
+            top.expect_key = False
+        elif self._is_section(len(self._stack)) and top.pending_key in ("name", "time"):
+            self._section_meta[top.pending_key] = json.loads(literal).strip() or None
+
+    def _on_close(self, frame: _Frame, end: int, depth: int, events: List[Dict[str, Any]]) -> None:
+        if frame.kind == "obj" and self._is_item(depth):
+            raw = self.text[frame.start:end + 1]
+            try:
+                item = ITEM_ADAPTER.validate_json(raw).model_dump()
+            except ValidationError as e:
+                # The final whole-document validation decides what to do with it
+                logger.debug("Skipping invalid streamed item: %s", e)
+            else:
+                events.append({"type": "item", "section": self._section_index,
+                               "index": self._item_index, "item": item})
+                self._item_index += 1
+        elif frame.kind == "obj" and self._is_section(depth):
+            self._announce_section(events)
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        events: List[Dict[str, Any]] = []
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if not self._started:
+                # Skip a leading ```json fence or any chatter before the document
+                if c != "{":
+                    continue
+                self._started = True
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._on_string(text[self._string_start:i + 1])
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == "{" or c == "[":
+                parent = self._stack[-1] if self._stack else None
+                key = parent.pending_key if parent is not None and parent.kind == "obj" else None
+                self._stack.append(_Frame("obj" if c == "{" else "arr", key, i))
+                depth = len(self._stack)
+                if self._is_section(depth):
+                    self._section_index += 1
+                    self._section_meta = {}
+                    self._section_announced = False
+                elif self._is_items(depth):
+                    self._announce_section(events)
+            elif c == "}" or c == "]":
+                if not self._stack:
+                    continue
+                # Classify against the full path before popping the frame
+                self._on_close(self._stack[-1], i, len(self._stack), events)
+                self._stack.pop()
+            elif c == ",":
+                if self._stack and self._stack[-1].kind == "obj":
+                    self._stack[-1].expect_key = True
+                    self._stack[-1].pending_key = None
+        self._pos = len(text)
+        return events
+
+
+def stream_menu(image_bytes: bytes, mime: str = "image/png", max_tokens: int = 3000,
+                prompt: str = EXTRACT_PROMPT, detail: str = "auto",
+                repair: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Streaming variant of extract_menu.
+
+    Yields section/item events while the model is still writing, then a
+    final {"type": "done", "menu": ...} with the fully validated MenuDoc
+    (repaired with one extra call if the streamed document is invalid,
+    unless `repair` is off and the caller escalates instead).
+    """
+    client = _get_client()
+    parser = IncrementalMenuParser()
+    usage = None
+
+    def open_stream() -> Stream[ChatCompletionChunk]:
+        body = VisionBody({
+            "model": VISION_MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": IMAGE_URL, "detail": detail}}
+                    ]
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": 0.1,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }, image_bytes, mime)
+        return client.post("/chat/completions", cast_to=ChatCompletionChunk, content=body,
+                           stream=True, stream_cls=Stream[ChatCompletionChunk])
+
+    def discard(loser: Stream[ChatCompletionChunk], elapsed: float) -> None:
+        # Closing the stream saves most of its completion, but the prompt
+        # (image included) is billed; its usage chunk never arrives, so
+        # record an estimate
+        loser.close()
+        prompt_tokens = estimate_prompt_tokens(prompt, image_bytes, detail)
+        record_completion(VISION_MODEL, CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=0,
+                                                        total_tokens=prompt_tokens), elapsed, "hedge_loser")
+
+    started = time.perf_counter()
+    # Only opening the stream is hedged (time to response headers); the
+    # losing stream is closed before the model has written much of it
+    stream = hedged("vision_stream", open_stream, discard)
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield from parser.feed(delta)
+    finally:
+        # A client that disconnects closes this generator mid-loop; drop the
+        # upstream connection so the model stops writing billed tokens
+        stream.close()
+    record_completion(VISION_MODEL, usage, time.perf_counter() - started, "vision_stream")
+
+    raw = parser.text
+    try:
+        menu = parse_and_validate(raw)
+    except Exception as e1:
+        if not repair:
+            raise
+        try:
+            repaired = _call_vision(build_repair_prompt(raw or "No JSON returned", str(e1)),
+                                    image_bytes, mime, max_tokens=max_tokens, call="repair", detail=detail)
+            menu = parse_and_validate(repaired)
+        except Exception as e2:
+            raise RuntimeError(f"Extraction failed after repair: {e2}") from e2
+        yield {"type": "repaired"}
+    yield {"type": "done", "menu": menu}
+
+
+def menu_events(menu: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Section/item events for a menu that was extracted without streaming."""
+    index = 0
+    for i, section in enumerate(menu.get("sections", [])):
+        yield {"type": "section", "index": i, "name": section.get("name"), "time": section.get("time")}
+        for item in section.get("items", []):
+            yield {"type": "item", "section": i, "index": index, "item": item}
+            index += 1
+
+
+def stream_menu_routed(image_bytes: bytes, mime: str, profile: ImageProfile, tiling: str = "auto",
+                       policy: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    stream_menu behind the same routing and tiling as /api/vision/detect-items.
+
+    With `tiling` "auto", pages over the tiling threshold ("on": every page)
+    are extracted tile by tile and replayed as events once merged. Otherwise the first route is streamed; if it fails
+    validation or the confidence check, the rest of the escalation ladder
+    runs without streaming and its menu arrives in the done event.
+    """
+    if tiling == "on" or (tiling == "auto" and needs_tiling(profile.width, profile.height)):
+        menu = extract_menu_tiled(image_bytes, mime, force=True)
+        yield from menu_events(menu)
+        yield {"type": "done", "menu": menu}
+        return
+
+    policy = policy or DEFAULT_POLICY
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown routing policy: {policy}")
+    decision = POLICIES[policy](profile)
+    following = escalate(decision, profile) if MAX_ESCALATIONS > 0 else None
+    menu: Optional[Dict[str, Any]] = None
+    try:
+        for event in stream_menu(image_bytes, mime, max_tokens=decision.max_tokens,
+                                 prompt=PROMPTS[decision.prompt], detail=decision.detail,
+                                 repair=following is None):
+            if event["type"] == "done":
+                menu = event["menu"]
+            else:
+                yield event
+    except Exception as e:
+        if following is None:
+            raise
+        logger.info("Streamed route %s failed (%s), escalating", decision.reason, e)
+
+    reason = low_confidence(menu, profile) if menu is not None else "invalid"
+    attempts = [{**asdict(decision), "outcome": "invalid" if menu is None else reason or "ok"}]
+    if reason is not None and following is not None:
+        logger.info("Streamed route %s gave %s, escalating", decision.reason, reason)
+        yield {"type": "escalating", "reason": reason}
+        menu = climb_routes(image_bytes, mime, policy, profile, following, attempts, menu)
+    else:
+        menu['meta']['routing'] = {"policy": policy, "profile": asdict(profile), "attempts": attempts}
+    yield {"type": "done", "menu": menu}
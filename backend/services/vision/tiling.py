@@ -0,0 +1,251 @@
+import contextvars
+import io
+import logging
+import math
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from services.imaging import ImagePoolBusy, cut_tiles, handoff, handoff_dir, oriented_size, run_image_job
+from services.metrics import stage
+from services.vision.gpt4o import EXTRACT_PROMPT, extract_menu
+from services.vision.routing import extract_menu_routed
+
+logger = logging.getLogger(__name__)
+
+# Tiling configuration (pixels). Pages whose longest side exceeds the
+# threshold are split into overlapping tiles of at most TILE_SIZE.
+TILE_SIZE = int(os.getenv('VISION_TILE_SIZE', '1536'))
+TILE_OVERLAP = int(os.getenv('VISION_TILE_OVERLAP', '160'))
+TILE_THRESHOLD = int(os.getenv('VISION_TILE_THRESHOLD', '2048'))
+TILE_WORKERS = int(os.getenv('VISION_TILE_WORKERS', '6'))
+
+TILE_PROMPT_ADDENDUM = """
+This image is one tile ({width}x{height} pixels) cut from a larger catalog page.
+- For every item add "bbox": [x, y, width, height] under item.extras, in pixels of THIS image,
+  covering the item's name, price and picture
+- List items that are cut off at the tile edge as well; they will be merged with the neighbouring tile
+"""
+
+_PIL_FORMATS = {'image/jpeg': 'JPEG', 'image/jpg': 'JPEG', 'image/webp': 'WEBP'}
+_NAME_SPACE_RE = re.compile(r'\s+')
+
+
+@dataclass
+class Tile:
+    index: int
+    x: int
+    y: int
+    width: int
+    height: int
+    image_bytes: bytes = b''
+
+
+def _axis_spans(length: int, tile: int, overlap: int) -> List[Tuple[int, int]]:
+    """Evenly spaced (start, end) spans covering [0, length) with at least `overlap` shared pixels."""
+    if length <= tile:
+        return [(0, length)]
+    count = math.ceil((length - overlap) / (tile - overlap))
+    size = math.ceil((length + (count - 1) * overlap) / count)
+    return [(round(i * (length - size) / (count - 1)), round(i * (length - size) / (count - 1)) + size)
+            for i in range(count)]
+
+
+def plan_tiles(width: int, height: int, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> List[Tile]:
+    """Row-major grid of overlapping tiles covering a width x height page."""
+    tiles = []
+    for y0, y1 in _axis_spans(height, tile_size, overlap):
+        for x0, x1 in _axis_spans(width, tile_size, overlap):
+            tiles.append(Tile(len(tiles), x0, y0, x1 - x0, y1 - y0))
+    return tiles
+
+
+def needs_tiling(width: int, height: int, threshold: int = TILE_THRESHOLD) -> bool:
+    return max(width, height) > threshold
+
+
+def split_tiles(image_bytes: bytes, mime: str, width: int, height: int, tile_size: int = TILE_SIZE,
+                overlap: int = TILE_OVERLAP) -> List[Tile]:
+    """Crop a width x height page into overlapping tiles, encoded in the upload's format."""
+    fmt = _PIL_FORMATS.get(mime, 'PNG')
+    tiles = plan_tiles(width, height, tile_size, overlap)
+    boxes = [(tile.x, tile.y, tile.width, tile.height) for tile in tiles]
+    # Decoding and re-encoding run in the image worker pool; tiles come back as files
+    with stage('tile_split'), handoff(image_bytes) as path, handoff_dir() as out_dir:
+        for tile, tile_path in zip(tiles, run_image_job(cut_tiles, path, fmt, boxes, out_dir)):
+            with open(tile_path, 'rb') as f:
+                tile.image_bytes = f.read()
+    return tiles
+
+
+def _page_bbox(item: Dict[str, Any], tile: Tile) -> Optional[List[int]]:
+    """Map an item's tile-relative extras.bbox to page pixels, clipped to the tile."""
+    bbox = (item.get('extras') or {}).get('bbox')
+    if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+        return None
+    try:
+        x, y, w, h = (float(v) for v in bbox)
+    except (TypeError, ValueError):
+        return None
+    x0, y0 = max(0.0, x), max(0.0, y)
+    x1, y1 = min(float(tile.width), x + w), min(float(tile.height), y + h)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return [round(tile.x + x0), round(tile.y + y0), round(x1 - x0), round(y1 - y0)]
+
+
+def _overlap_ratio(a: List[int], b: List[int]) -> float:
+    """Intersection area over the smaller box, so a clipped half-item still matches the whole one."""
+    ix = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    iy = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if ix <= 0 or iy <= 0:
+        return 0.0
+    return (ix * iy) / max(1, min(a[2] * a[3], b[2] * b[3]))
+
+
+def _tiles_touch(a: Tile, b: Tile) -> bool:
+    return (a.x < b.x + b.width and b.x < a.x + a.width
+            and a.y < b.y + b.height and b.y < a.y + a.height)
+
+
+def _name_key(name: Optional[str]) -> str:
+    return _NAME_SPACE_RE.sub(' ', (name or '')).strip().casefold()
+
+
+def _is_duplicate(item: Dict[str, Any], tile: Tile, other: Dict[str, Any], other_tile: Tile) -> bool:
+    if other_tile.index == tile.index or not _tiles_touch(tile, other_tile):
+        return False
+    if _name_key(item['name']) != _name_key(other['name']):
+        return False
+    box, other_box = item['extras'].get('bbox'), other['extras'].get('bbox')
+    if box and other_box:
+        return _overlap_ratio(box, other_box) >= 0.5
+    # Without boxes, fall back to matching prices from overlapping tiles
+    return item['price'].get('value') == other['price'].get('value')
+
+
+def merge_tile_menus(results: List[Tuple[Tile, Dict[str, Any]]]) -> Tuple[Dict[str, Any], int]:
+    """
+    Merge per-tile MenuDocs into one page document.
+
+    Sections are merged by name in first-seen order. An item reported by two
+    overlapping tiles is kept once: its box becomes the union of both boxes
+    and missing fields are filled from the duplicate.
+    Returns (menu, duplicates_merged).
+    """
+    source = None
+    meta: Dict[str, Any] = {}
+    sections: Dict[str, Dict[str, Any]] = {}
+    placed: List[Tuple[Dict[str, Any], Tile]] = []
+    duplicates = 0
+
+    for tile, menu in results:
+        if source is None and menu.get('source') not in (None, 'Unknown'):
+            source = menu['source']
+        for key, value in (menu.get('meta') or {}).items():
+            meta.setdefault(key, value)
+        for section in menu.get('sections', []):
+            merged = sections.setdefault(_name_key(section.get('name')), {
+                "name": section.get('name'), "time": section.get('time'), "items": [],
+            })
+            merged['time'] = merged['time'] or section.get('time')
+            for item in section.get('items', []):
+                bbox = _page_bbox(item, tile)
+                if bbox:
+                    item['extras']['bbox'] = bbox
+                else:
+                    item['extras'].pop('bbox', None)
+                match = next((other for other, other_tile in placed
+                              if _is_duplicate(item, tile, other, other_tile)), None)
+                if match is None:
+                    merged['items'].append(item)
+                    placed.append((item, tile))
+                    continue
+                duplicates += 1
+                box, other_box = item['extras'].get('bbox'), match['extras'].get('bbox')
+                if box and other_box:
+                    x0, y0 = min(box[0], other_box[0]), min(box[1], other_box[1])
+                    x1 = max(box[0] + box[2], other_box[0] + other_box[2])
+                    y1 = max(box[1] + box[3], other_box[1] + other_box[3])
+                    match['extras']['bbox'] = [x0, y0, x1 - x0, y1 - y0]
+                # Fill gaps in the kept item from the duplicate
+                for field in ('desc', 'tags'):
+                    match[field] = match[field] or item[field]
+                for field in ('price', 'size'):
+                    if match[field].get('value') is None and item[field].get('value') is not None:
+                        match[field] = item[field]
+
+    menu = {
+        "source": source or "Unknown",
+        "sections": list(sections.values()),
+        "meta": meta,
+        "schema": {"name": "canta.menu", "version": "1.0"},
+    }
+    return menu, duplicates
+
+
+def _mime_for(mime: str) -> str:
+    return mime if mime in _PIL_FORMATS else 'image/png'
+
+
+def _extract_tile(tile: Tile, mime: str) -> Dict[str, Any]:
+    prompt = EXTRACT_PROMPT + TILE_PROMPT_ADDENDUM.format(width=tile.width, height=tile.height)
+    return extract_menu(tile.image_bytes, _mime_for(mime), prompt=prompt)
+
+
+def extract_menu_tiled(image_bytes: bytes, mime: str = "image/png", force: bool = False,
+                       tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP) -> Dict[str, Any]:
+    """
+    Extract a large page by splitting it into overlapping tiles.
+
+    Tiles are extracted concurrently on the shared OpenAI client, item boxes
+    are mapped back to page pixels (item.extras.bbox = [x, y, w, h]) and
+    duplicates from the overlaps are merged. Pages below the tiling
+    threshold go through a single routed extraction unless `force` is set.
+    Tiling details are reported under meta.tiling.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        width, height = oriented_size(image)
+    if not force and not needs_tiling(width, height):
+        return extract_menu_routed(image_bytes, mime)
+
+    tiles = split_tiles(image_bytes, mime, width, height, tile_size, overlap)
+    logger.info("Extracting %dx%d page as %d tiles", width, height, len(tiles))
+
+    # Each worker runs in a copy of the caller's context so usage accounting
+    # and route labels follow the tile calls
+    results: List[Tuple[Tile, Dict[str, Any]]] = []
+    failed = []
+    busy: Optional[ImagePoolBusy] = None
+    with ThreadPoolExecutor(max_workers=max(1, min(TILE_WORKERS, len(tiles)))) as pool:
+        futures = [(tile, pool.submit(contextvars.copy_context().run, _extract_tile, tile, mime))
+                   for tile in tiles]
+        for tile, future in futures:
+            try:
+                results.append((tile, future.result()))
+            except Exception as e:
+                logger.warning("Tile %d extraction failed: %s", tile.index, e)
+                failed.append(tile.index)
+                if isinstance(e, ImagePoolBusy):
+                    busy = e
+
+    if not results:
+        if busy is not None:
+            # At least one tile only failed for want of an image worker
+            raise busy
+        raise RuntimeError(f"Extraction failed for all {len(tiles)} tiles")
+
+    with stage('tile_merge'):
+        menu, duplicates = merge_tile_menus(results)
+    menu['meta']['tiling'] = {
+        "page_width": width,
+        "page_height": height,
+        "tiles": [[tile.x, tile.y, tile.width, tile.height] for tile in tiles],
+        "failed_tiles": failed,
+        "duplicates_merged": duplicates,
+    }
+    return menu
@@ -1,5 +1,25 @@
 import React, { useState, useEffect, useMemo } from 'react';
-import { listPage, updateItem, createItem, exportCatalog, detectItemsInImage, storeMenuData } from '../lib/api';
+import { listPage, updateItem, createItem, exportCatalog, streamExtractItems, storeMenuData } from '../lib/api';
+
+// Map a validated canta.menu item to the annotation list shape
+const toMenuItem = (item, sectionName, id) => ({
+  id,
+  name: item.name || 'Unnamed Item',
+  description: item.desc || '',
+  price: {
+    value: item.price?.value || null,
+    currency: item.price?.currency || 'MYR'
+  },
+  size: {
+    value: item.size?.value || null,
+    unit: item.size?.unit || ''
+  },
+  tags: item.tags || [],
+  section: sectionName || 'General',
+  status: 'detected',
+  confidence: 0.8,
+  additionalContext: ''
+});
 
 // ItemCard component for editing individual menu items
 const ItemCard = ({ item, onSave, onVerify }) => {
@@ -380,72 +400,59 @@ const DataAnnotationPage = () => {
         setUploadedFile(file);
         setShowUpload(false);
         
-        // Call GPT-4o Vision API to detect items
-        console.log('Detecting items with GPT-4o Vision...');
-        const visionResult = await detectItemsInImage(file);
-        console.log('Vision API result:', visionResult);
-        
-        // Parse JSON response to extract menu items
-        let menuItems = [];
-        let parsedMenu = null;
-        let parseError = null;
-        
-        try {
-          // Try to parse the raw_response as JSON
-          if (visionResult.raw_response && visionResult.raw_response !== visionResult.description) {
-            parsedMenu = JSON.parse(visionResult.raw_response);
-            
-            // Extract items from the parsed menu structure
-            if (parsedMenu.sections && Array.isArray(parsedMenu.sections)) {
-              let itemId = 1;
-              parsedMenu.sections.forEach(section => {
-                if (section.items && Array.isArray(section.items)) {
-                  section.items.forEach(item => {
-                    menuItems.push({
-                      id: `item_${itemId++}`,
-                      name: item.name || 'Unnamed Item',
-                      description: item.desc || '',
-                      price: {
-                        value: item.price?.value || null,
-                        currency: item.price?.currency || 'MYR'
-                      },
-                      size: {
-                        value: item.size?.value || null,
-                        unit: item.size?.unit || ''
-                      },
-                      tags: item.tags || [],
-                      section: section.name || 'General',
-                      status: 'detected',
-                      confidence: 0.8,
-                      additionalContext: ''
-                    });
-                  });
-                }
-              });
-            }
-          }
-        } catch (e) {
-          parseError = e.message;
-          console.warn('Failed to parse JSON response:', e);
-        }
+        // Stream items from GPT-4o Vision as they are extracted
+        console.log('Streaming items from GPT-4o Vision...');
+        const sectionNames = {};
+        let streamedId = 1;
         
-        // Create data structure to display the AI response and items
-        const transformedData = {
+        setData({
           source_id: 'uploaded',
           page: 1,
           page_width: 800,
           page_height: 600,
-          ai_response: visionResult.description || visionResult.raw_response || "No response received",
-          raw_response: visionResult.raw_response || JSON.stringify(visionResult),
-          status: visionResult.status || "unknown",
-          parsed_menu: parsedMenu,
-          parse_error: parseError,
-          items: menuItems
-        };
-        
-        setData(transformedData);
+          ai_response: 'Extracting items...',
+          raw_response: '',
+          status: 'streaming',
+          parsed_menu: null,
+          parse_error: null,
+          items: []
+        });
         setActiveItemId(null);
         
+        await streamExtractItems(file, {
+          onStart: ({ page_width, page_height }) => {
+            setData(prev => ({ ...prev, page_width, page_height }));
+          },
+          onSection: (section) => {
+            sectionNames[section.index] = section.name;
+          },
+          onItem: ({ section, item }) => {
+            const menuItem = toMenuItem(item, sectionNames[section], `item_${streamedId++}`);
+            setData(prev => ({ ...prev, items: [...prev.items, menuItem] }));
+          },
+          onEscalating: () => {
+            setData(prev => ({ ...prev, ai_response: 'Low-confidence result, re-extracting in more detail...' }));
+          },
+          onDone: ({ menu }) => {
+            // The fully validated document is authoritative; replace the streamed items
+            let itemId = 1;
+            const menuItems = [];
+            (menu.sections || []).forEach(section => {
+              (section.items || []).forEach(item => {
+                menuItems.push(toMenuItem(item, section.name, `item_${itemId++}`));
+              });
+            });
+            setData(prev => ({
+              ...prev,
+              ai_response: `Source: ${menu.source}\nTotal items detected: ${menuItems.length}`,
+              raw_response: JSON.stringify(menu, null, 2),
+              status: 'success',
+              parsed_menu: menu,
+              items: menuItems
+            }));
+          }
+        }, { sourceId: 'uploaded', page: 1 });
+        
       } catch (err) {
         console.error('Vision processing failed:', err);
         setError(`AI vision processing failed: ${err.message}`);
@@ -1,7 +1,8 @@
 import React, { useState, useEffect, useRef } from 'react';
+import { assetUrl } from '../lib/api';
 
 interface PageCanvasProps {
-  imageUrl: string;
+  imageUrl?: string;
   page: any;
   activeItemId: number | null;
   onSelectItem: (id: number) => void;
@@ -9,9 +10,18 @@ interface PageCanvasProps {
 
 const PageCanvas: React.FC<PageCanvasProps> = ({ imageUrl, page, activeItemId, onSelectItem }) => {
   const [imageLoaded, setImageLoaded] = useState(false);
+  const [fullLoaded, setFullLoaded] = useState(false);
   const [scale, setScale] = useState(1);
   const imgRef = useRef<HTMLImageElement>(null);
 
+  // Stored pages come with a cached thumbnail: show it first, swap in the full image once loaded
+  const fullUrl = imageUrl || assetUrl(page?.image_url);
+  const previewUrl = assetUrl(page?.thumbnails?.['1024']);
+
+  useEffect(() => {
+    setFullLoaded(false);
+  }, [fullUrl]);
+
   useEffect(() => {
     if (imageLoaded && imgRef.current && page) {
       const img = imgRef.current;
@@ -58,11 +68,15 @@ const PageCanvas: React.FC<PageCanvasProps> = ({ imageUrl, page, activeItemId, o
         <div className="relative inline-block max-w-full">
           <img
             ref={imgRef}
-            src={imageUrl}
+            src={previewUrl && !fullLoaded ? previewUrl : fullUrl}
+            width={page.page_width}
             alt={`Page ${page.page}`}
             className="max-w-full h-auto border border-gray-200 rounded"
             onLoad={() => setImageLoaded(true)}
           />
+          {previewUrl && !fullLoaded && (
+            <img src={fullUrl} alt="" className="hidden" onLoad={() => setFullLoaded(true)} />
+          )}
           
           {imageLoaded && page.items.map((item: any) => {
             const [x, y, w, h] = item.bbox;
@@ -1,4 +1,10 @@
 const API_BASE = 'http://localhost:5001/api';
+const API_ORIGIN = API_BASE.replace(/\/api$/, '');
+
+// Image and thumbnail URLs from the API are origin-relative paths
+export function assetUrl(path) {
+  return path ? `${API_ORIGIN}${path}` : null;
+}
 
 export async function listPage(sourceId, page) {
   const response = await fetch(`${API_BASE}/catalog/${sourceId}/page/${page}`);
@@ -36,8 +42,9 @@ export async function createItem(sourceId, page, itemData) {
   return response.json();
 }
 
-export async function exportCatalog(sourceId) {
-  const response = await fetch(`${API_BASE}/export/${sourceId}`, {
+export async function exportCatalog(sourceId, since = null) {
+  const query = since != null ? `?since=${since}` : '';
+  const response = await fetch(`${API_BASE}/export/${sourceId}${query}`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
@@ -128,6 +135,74 @@ export async function detectItemsInImage(file) {
   }
 }
 
+// Stream menu sections/items over SSE as the vision model emits them.
+// Resolves with the final `done` event ({ menu, extraction_id }).
+export async function streamExtractItems(file, handlers = {}, options = {}) {
+  const { onStart, onSection, onItem, onEscalating, onDone } = handlers;
+  const formData = new FormData();
+  formData.append('file', file);
+  if (options.sourceId) formData.append('source_id', options.sourceId);
+  if (options.page != null) formData.append('page', options.page);
+  if (options.sessionId) formData.append('session_id', options.sessionId);
+
+  const response = await fetch(`${API_BASE}/vision/extract-stream`, {
+    method: 'POST',
+    body: formData,
+  });
+  if (!response.ok) {
+    const errorText = await response.text();
+    throw new Error(`Failed to extract items: ${response.statusText} - ${errorText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let result = null;
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      const dataLine = rawEvent.split('\n').find((line) => line.startsWith('data: '));
+      if (!dataLine) continue;
+
+      const event = JSON.parse(dataLine.slice(6));
+      switch (event.type) {
+        case 'start':
+          onStart?.(event);
+          break;
+        case 'section':
+          onSection?.(event);
+          break;
+        case 'item':
+          onItem?.(event);
+          break;
+        case 'escalating':
+          onEscalating?.(event);
+          break;
+        case 'done':
+          result = event;
+          onDone?.(event);
+          break;
+        case 'error':
+          throw new Error(event.error);
+        default:
+          break;
+      }
+    }
+  }
+
+  if (!result) {
+    throw new Error('Extraction stream ended before completion');
+  }
+  return result;
+}
+
 export async function extractItemData(file) {
   console.log('=== extractItemData API call started ===');
   console.log('File details:', {